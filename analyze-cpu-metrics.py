@@ -5,11 +5,17 @@ Phase 4: CPU Analysis Script for EC2 Instance Downgrade
 Analyzes CPU utilization for t3.small instances to identify downgrade candidates
 """
 
+import argparse
 import boto3
 import json
+import numpy as np
+import sqlite3
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Tuple
+from fnmatch import fnmatch
+from typing import Dict, List, Optional, Set, Tuple
 
 # Fix Windows console encoding
 if sys.platform == 'win32':
@@ -19,7 +25,7 @@ if sys.platform == 'win32':
 REGION = 'eu-central-1'
 PERIOD_DAYS = 7
 
-# Instances to analyze
+# Instances to analyze with --static; by default the fleet is discovered from EC2 and Elastic Beanstalk
 INSTANCES = [
     {"id": "i-07aba2934ad4ed933", "name": "rt-admin-api-prod"},
     {"id": "i-02260cfd794e7f43f", "name": "rt-affret-ia-api-prod-v4"},
@@ -35,110 +41,655 @@ INSTANCES = [
     {"id": "i-093ef6b78139d9574", "name": "exploit-ia-affretia-prod-v1"}
 ]
 
-# Thresholds
-CPU_AVG_THRESHOLD = 30.0  # Average CPU < 30% → Candidate for downgrade
-CPU_MAX_THRESHOLD = 60.0  # Max CPU < 60% → Safe for downgrade
+# Thresholds (on the per-period Average CPU series)
+CPU_P50_THRESHOLD = 30.0    # Median CPU < 30% → Candidate for downgrade
+CPU_P95_THRESHOLD = 60.0    # p95 CPU < 60% → Sustained load fits a smaller instance
+CPU_BURST_THRESHOLD = 60.0  # CPU above this counts as time above threshold / burst
+MAX_BURST_MINUTES = 30      # Longest burst above CPU_BURST_THRESHOLD must stay shorter → Safe for downgrade
+PERCENTILES = [50, 90, 95, 99]
+
+# Burstable CPU credits (standard mode): one credit = one vCPU at 100% for one minute.
+# (vCPUs, baseline % per vCPU, credits earned per hour, max accrued credits)
+BURSTABLE_TYPES = {
+    't3.nano': (2, 5.0, 6, 144),
+    't3.micro': (2, 10.0, 12, 288),
+    't3.small': (2, 20.0, 24, 576),
+    't3.medium': (2, 20.0, 24, 576),
+    't3.large': (2, 30.0, 36, 864),
+    't4g.nano': (2, 5.0, 6, 144),
+    't4g.micro': (2, 10.0, 12, 288),
+    't4g.small': (2, 20.0, 24, 576),
+    't4g.medium': (2, 20.0, 24, 576),
+    't4g.large': (2, 30.0, 36, 864),
+}
+# Approximate eu-central-1 on-demand Linux price, EUR/month running 24/7
+MONTHLY_PRICE_EUR = {
+    't3.nano': 3.75, 't3.micro': 7.50, 't3.small': 15.00, 't3.medium': 30.00, 't3.large': 60.00,
+    't4g.nano': 3.00, 't4g.micro': 6.00, 't4g.small': 12.00, 't4g.medium': 24.00, 't4g.large': 48.00,
+}
+SOURCE_VCPUS = 2            # the analysed instances are t3.small
+CREDIT_TARGET = 't3.micro'  # downgrade target simulated against the measured CPU
+
+# GetMetricData limits
+MAX_METRICS_PER_REQUEST = 500
+STATISTICS = ['Average', 'Maximum']
+METRIC_PERIOD = 3600  # 1 hour
+
+# Fleet discovery: running EC2 instances grouped by Elastic Beanstalk environment
+INVENTORY_FILE = "instance-inventory.json"
+INVENTORY_TTL = 3600  # seconds before the inventory is discovered again
+DISCOVERY_WORKERS = 8
+EB_ENVIRONMENT_TAG = 'elasticbeanstalk:environment-name'
+
+# Local CloudWatch cache: re-runs only fetch datapoints newer than the cached window
+CACHE_FILE = "cloudwatch-cache.db"
+SETTLE_LAG = 900  # seconds CloudWatch may take to publish a closed period; younger periods are re-fetched
+
+def build_metric_queries(instance_ids: List[str], statistics: List[str] = STATISTICS,
+                         period: int = METRIC_PERIOD, dimension: str = 'InstanceId') -> List[Dict]:
+    """
+    One MetricDataQuery per (instance, statistic). Query ids must start with a
+    lowercase letter, so they are positional: m<index>_<statistic>. With
+    dimension='AutoScalingGroupName' the ids are group names and the series
+    aggregate every instance the group ever ran.
+    """
+    queries = []
+    for index, instance_id in enumerate(instance_ids):
+        for stat in statistics:
+            queries.append({
+                'Id': f"m{index}_{stat.lower()}",
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': 'AWS/EC2',
+                        'MetricName': 'CPUUtilization',
+                        'Dimensions': [{'Name': dimension, 'Value': instance_id}]
+                    },
+                    'Period': period,
+                    'Stat': stat
+                },
+                'ReturnData': True
+            })
+    return queries
+
+def fetch_cpu_metrics(instance_ids: List[str], start_time: datetime, end_time: datetime,
+                      statistics: List[str] = STATISTICS, period: int = METRIC_PERIOD,
+                      cloudwatch=None, failed: Optional[Set[str]] = None, dimension: str = 'InstanceId'
+                      ) -> Dict[str, Dict[str, List[Tuple[datetime, float]]]]:
+    """
+    CPU series of every instance and statistic through batched GetMetricData calls
+    (up to MAX_METRICS_PER_REQUEST queries each), following NextToken pages.
+    Returns {instance_id: {statistic: [(timestamp, value), ...]}} in ascending time.
+    A failed batch is reported and its instances come back empty (and are added to
+    `failed` when given).
+    """
+    cloudwatch = cloudwatch or boto3.client('cloudwatch', region_name=REGION)
+    queries = build_metric_queries(instance_ids, statistics, period, dimension)
+    by_id = {query['Id']: (instance_ids[int(query['Id'][1:].split('_')[0])], query['MetricStat']['Stat'])
+             for query in queries}
+    series = {instance_id: {stat: [] for stat in statistics} for instance_id in instance_ids}
+
+    for offset in range(0, len(queries), MAX_METRICS_PER_REQUEST):
+        batch = queries[offset:offset + MAX_METRICS_PER_REQUEST]
+        params = {
+            'MetricDataQueries': batch,
+            'StartTime': start_time,
+            'EndTime': end_time,
+            'ScanBy': 'TimestampAscending'
+        }
+        try:
+            while True:
+                response = cloudwatch.get_metric_data(**params)
+                # A series can be split across pages: append, never overwrite
+                for result in response['MetricDataResults']:
+                    instance_id, stat = by_id[result['Id']]
+                    series[instance_id][stat].extend(zip(result['Timestamps'], result['Values']))
+                if not response.get('NextToken'):
+                    break
+                params['NextToken'] = response['NextToken']
+        except Exception as e:
+            print(f"Error getting metrics for batch {offset // MAX_METRICS_PER_REQUEST + 1}: {str(e)}")
+            if failed is not None:
+                failed.update(by_id[query['Id']][0] for query in batch)
+
+    for stats in series.values():
+        for points in stats.values():
+            points.sort(key=lambda point: point[0])
+    return series
+
+class MetricsCache:
+    """
+    SQLite store of CloudWatch datapoints keyed by (instance, metric, statistic, period),
+    with the time range already fetched for each key. Periods that closed less than
+    SETTLE_LAG before the fetch are kept but not counted as covered: they are fetched
+    again once a newer period has closed or SETTLE_LAG has passed, so datapoints
+    CloudWatch publishes late are not lost, while an immediate re-run makes no call.
+    """
 
-def get_cpu_metrics(instance_id: str) -> Tuple[float, float, int]:
+    def __init__(self, path: str = CACHE_FILE):
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS datapoints (
+                instance_id TEXT, metric TEXT, stat TEXT, period INTEGER, ts INTEGER, value REAL,
+                PRIMARY KEY (instance_id, metric, stat, period, ts)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS coverage (
+                instance_id TEXT, metric TEXT, stat TEXT, period INTEGER, start_ts INTEGER, end_ts INTEGER,
+                PRIMARY KEY (instance_id, metric, stat, period)
+            );
+        """)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(coverage)")}
+        for column in ('fetched_end', 'fetched_at'):
+            if column not in columns:   # caches written before the settle lag
+                self.db.execute(f"ALTER TABLE coverage ADD COLUMN {column} INTEGER")
+
+    def coverage(self, instance_id: str, metric: str, stat: str,
+                 period: int) -> Optional[Tuple[int, int, Optional[int], Optional[int]]]:
+        """(start, end) of the settled range, and (end, time) of the last fetch reaching the present"""
+        return self.db.execute(
+            "SELECT start_ts, end_ts, fetched_end, fetched_at FROM coverage "
+            "WHERE instance_id = ? AND metric = ? AND stat = ? AND period = ?",
+            (instance_id, metric, stat, period)).fetchone()
+
+    def missing(self, instance_id: str, metric: str, stat: str, period: int,
+                start: int, end: int, now: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        Sub-ranges of [start, end) to fetch: a head when the window widened, and the
+        tail past the settled range unless it was fetched recently and no period closed since
+        """
+        now = end if now is None else now
+        covered = self.coverage(instance_id, metric, stat, period)
+        if covered is None or covered[1] <= start or covered[0] >= end:
+            return [(start, end)]
+        ranges = []
+        if start < covered[0]:
+            ranges.append((start, covered[0]))
+        if covered[1] < end:
+            fetched_end, fetched_at = covered[2], covered[3]
+            if fetched_end is None or fetched_end < end - end % period or now - fetched_at >= SETTLE_LAG:
+                ranges.append((covered[1], end))
+        return ranges
+
+    def store(self, instance_id: str, metric: str, stat: str, period: int,
+              points: List[Tuple[datetime, float]], start: int, end: int, now: Optional[int] = None):
+        """
+        Upsert datapoints fetched for [start, end) and merge the range into the key's
+        coverage. Only a range ending within SETTLE_LAG of `now` (default: end) loses
+        its unsettled tail.
+        """
+        now = end if now is None else now
+        self.db.executemany(
+            "INSERT OR REPLACE INTO datapoints VALUES (?, ?, ?, ?, ?, ?)",
+            [(instance_id, metric, stat, period, int(ts.timestamp()), value) for ts, value in points])
+        closed = end - end % period   # the partial period at the end is not final yet
+        settled = closed
+        row = self.coverage(instance_id, metric, stat, period)
+        fetched_end, fetched_at = (row[2], row[3]) if row else (None, None)
+        if end > now - SETTLE_LAG:
+            # CloudWatch may still be publishing the periods that closed less than SETTLE_LAG ago
+            settled = min(closed, (now - SETTLE_LAG) - (now - SETTLE_LAG) % period)
+            fetched_end, fetched_at = closed, now
+        if row is not None and row[0] <= settled and start <= row[1]:
+            start, settled = min(start, row[0]), max(settled, row[1])
+        elif row is not None and settled <= start:
+            start, settled = row[0], row[1]   # nothing settled yet: keep the coverage, record the fetch
+        self.db.execute("INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (instance_id, metric, stat, period, start, max(start, settled), fetched_end, fetched_at))
+
+    def series(self, instance_id: str, metric: str, stat: str, period: int,
+               start: int, end: int) -> List[Tuple[datetime, float]]:
+        rows = self.db.execute(
+            "SELECT ts, value FROM datapoints WHERE instance_id = ? AND metric = ? AND stat = ? AND period = ? "
+            "AND ts >= ? AND ts < ? ORDER BY ts", (instance_id, metric, stat, period, start, end))
+        return [(datetime.fromtimestamp(ts, timezone.utc), value) for ts, value in rows]
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def cached_cpu_metrics(instance_ids: List[str], start_time: datetime, end_time: datetime, cache: MetricsCache,
+                       statistics: List[str] = STATISTICS, period: int = METRIC_PERIOD,
+                       cloudwatch=None, dimension: str = 'InstanceId', now: Optional[int] = None
+                       ) -> Dict[str, Dict[str, List[Tuple[datetime, float]]]]:
+    """
+    Same result as fetch_cpu_metrics, served from the cache. Instances missing the
+    same time range are fetched together, so a daily re-run is one small batched call.
+    """
+    start, end = int(start_time.timestamp()), int(end_time.timestamp())
+    start += -start % period   # first whole period inside the window
+    now = int(time.time()) if now is None else now
+    wanted = {}
+    for instance_id in instance_ids:
+        for stat in statistics:
+            for gap in cache.missing(instance_id, 'CPUUtilization', stat, period, start, end, now):
+                wanted.setdefault(gap, set()).add(instance_id)
+
+    for (gap_start, gap_end), ids in sorted(wanted.items()):
+        ids = sorted(ids)
+        failed = set()
+        fetched = fetch_cpu_metrics(ids, datetime.fromtimestamp(gap_start, timezone.utc),
+                                    datetime.fromtimestamp(gap_end, timezone.utc), statistics, period,
+                                    cloudwatch, failed, dimension)
+        for instance_id in ids:
+            if instance_id in failed:
+                continue
+            for stat in statistics:
+                cache.store(instance_id, 'CPUUtilization', stat, period, fetched[instance_id][stat],
+                            gap_start, gap_end, now)
+        cache.commit()
+
+    return {instance_id: {stat: cache.series(instance_id, 'CPUUtilization', stat, period, start, end)
+                          for stat in statistics}
+            for instance_id in instance_ids}
+
+def _ec2_instances(ec2, tag_filters: List[Tuple[str, str]]) -> Dict[str, Dict]:
+    """Running instances matching every tag filter, all describe_instances pages"""
+    filters = [{'Name': 'instance-state-name', 'Values': ['running']}]
+    filters += [{'Name': f'tag:{key}', 'Values': [value]} for key, value in tag_filters]
+    instances = {}
+    for page in ec2.get_paginator('describe_instances').paginate(Filters=filters):
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                tags = {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
+                cpu = instance.get('CpuOptions')
+                burstable = BURSTABLE_TYPES.get(instance['InstanceType'])
+                instances[instance['InstanceId']] = {
+                    'id': instance['InstanceId'],
+                    'name': tags.get('Name', instance['InstanceId']),
+                    'instance_type': instance['InstanceType'],
+                    'vcpus': cpu['CoreCount'] * cpu['ThreadsPerCore'] if cpu else
+                    burstable[0] if burstable else SOURCE_VCPUS,
+                    'environment': tags.get(EB_ENVIRONMENT_TAG)
+                }
+    return instances
+
+def _eb_environment_names(eb, env_pattern: Optional[str]) -> List[str]:
+    names = []
+    for page in eb.get_paginator('describe_environments').paginate(IncludeDeleted=False):
+        for environment in page['Environments']:
+            if environment['Status'] != 'Terminated' and (
+                    not env_pattern or fnmatch(environment['EnvironmentName'], env_pattern)):
+                names.append(environment['EnvironmentName'])
+    return names
+
+def _eb_environment(eb, name: str) -> Dict:
+    resources = eb.describe_environment_resources(EnvironmentName=name)['EnvironmentResources']
+    groups = resources.get('AutoScalingGroups', [])
+    return {'name': name, 'auto_scaling_group': groups[0]['Name'] if groups else None,
+            'instances': [instance['Id'] for instance in resources.get('Instances', [])]}
+
+def discover_fleet(tag_filters: List[Tuple[str, str]] = (), env_pattern: Optional[str] = None,
+                   ec2=None, eb=None, workers: int = DISCOVERY_WORKERS) -> List[Dict]:
+    """
+    Analysis units for the running fleet. describe_instances pages and the Elastic
+    Beanstalk environment resources are fetched in parallel. Each environment becomes
+    one unit measured on its Auto Scaling group, whose CloudWatch series outlives the
+    instances EB replaces; instances outside any environment stay one unit each.
+    With env_pattern (fnmatch, e.g. "rt-*-prod*") only matching environments are kept.
+    """
+    ec2 = ec2 or boto3.client('ec2', region_name=REGION)
+    eb = eb or boto3.client('elasticbeanstalk', region_name=REGION)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = pool.submit(_ec2_instances, ec2, list(tag_filters))
+        environments = [pool.submit(_eb_environment, eb, name) for name in _eb_environment_names(eb, env_pattern)]
+        instances = running.result()
+        environments = [future.result() for future in environments]
+
+    units = []
+    grouped = set()
+    for environment in sorted(environments, key=lambda env: env['name']):
+        members = [instances[instance_id] for instance_id in environment['instances'] if instance_id in instances]
+        if not members:
+            continue  # excluded by the tag filters, or nothing running
+        grouped.update(member['id'] for member in members)
+        group = environment['auto_scaling_group']
+        units.append({
+            'id': group or members[0]['id'],
+            'dimension': 'AutoScalingGroupName' if group else 'InstanceId',
+            'name': environment['name'],
+            'environment': environment['name'],
+            'instances': sorted(member['id'] for member in members),
+            'instance_type': members[0]['instance_type'],
+            'vcpus': members[0]['vcpus']
+        })
+    for instance in sorted(instances.values(), key=lambda instance: instance['name']):
+        if instance['id'] in grouped:
+            continue
+        if env_pattern and not (instance['environment'] and fnmatch(instance['environment'], env_pattern)):
+            continue
+        units.append({'id': instance['id'], 'dimension': 'InstanceId', 'name': instance['name'],
+                      'environment': instance['environment'], 'instances': [instance['id']],
+                      'instance_type': instance['instance_type'], 'vcpus': instance['vcpus']})
+    return units
+
+def load_inventory(tag_filters: List[Tuple[str, str]] = (), env_pattern: Optional[str] = None,
+                   path: str = INVENTORY_FILE, ttl: int = INVENTORY_TTL, refresh: bool = False) -> List[Dict]:
+    """Discovered units, reused from `path` while younger than ttl seconds and discovered with the same filters"""
+    key = {'region': REGION, 'tags': sorted(f"{k}={v}" for k, v in tag_filters), 'environment': env_pattern}
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        cached = None
+    if not refresh and cached and cached.get('key') == key and time.time() - cached['discovered_at'] < ttl:
+        return cached['units']
+    units = discover_fleet(tag_filters, env_pattern)
+    with open(path, 'w') as f:
+        json.dump({'key': key, 'discovered_at': time.time(), 'units': units}, f, indent=2)
+    return units
+
+def static_units() -> List[Dict]:
+    """The hand-maintained INSTANCES list as analysis units"""
+    return [{'id': instance['id'], 'dimension': 'InstanceId', 'name': instance['name'], 'environment': None,
+             'instances': [instance['id']], 'instance_type': 't3.small', 'vcpus': SOURCE_VCPUS}
+            for instance in INSTANCES]
+
+def _merge_series(parts: List[Dict[str, List[Tuple[datetime, float]]]],
+                  statistics: List[str]) -> Dict[str, List[Tuple[datetime, float]]]:
+    """Several instances as one series: mean of the Average, max of the Maximum per timestamp"""
+    merged = {}
+    for stat in statistics:
+        by_time = {}
+        for part in parts:
+            for ts, value in part[stat]:
+                by_time.setdefault(ts, []).append(value)
+        combine = max if stat == 'Maximum' else (lambda values: sum(values) / len(values))
+        merged[stat] = [(ts, combine(values)) for ts, values in sorted(by_time.items())]
+    return merged
+
+def fetch_unit_metrics(units: List[Dict], start_time: datetime, end_time: datetime,
+                       period: int = METRIC_PERIOD, cache: Optional[MetricsCache] = None,
+                       statistics: List[str] = STATISTICS) -> Dict[str, Dict[str, List[Tuple[datetime, float]]]]:
+    """
+    CPU series per unit id, one batched fetch per CloudWatch dimension. An Auto Scaling
+    group without data (e.g. metrics not aggregated for it) falls back to the merged
+    series of its current instances.
+    """
+    def fetch(ids, dimension):
+        if cache is None:
+            return fetch_cpu_metrics(ids, start_time, end_time, statistics, period, dimension=dimension)
+        return cached_cpu_metrics(ids, start_time, end_time, cache, statistics, period, dimension=dimension)
+
+    series = {}
+    for dimension in ('InstanceId', 'AutoScalingGroupName'):
+        ids = [unit['id'] for unit in units if unit['dimension'] == dimension]
+        if ids:
+            series.update(fetch(ids, dimension))
+
+    empty = [unit for unit in units if unit['dimension'] == 'AutoScalingGroupName' and not series[unit['id']]['Average']]
+    if empty:
+        fallback = fetch(sorted({i for unit in empty for i in unit['instances']}), 'InstanceId')
+        for unit in empty:
+            series[unit['id']] = _merge_series([fallback[i] for i in unit['instances']], statistics)
+    return series
+
+def summarize_cpu(stats: Dict[str, List[Tuple[datetime, float]]]) -> Tuple[float, float, int]:
+    """(avg_cpu, max_cpu, datapoint_count): mean of the hourly averages and the highest hourly maximum"""
+    averages = [value for _, value in stats.get('Average', [])]
+    maximums = [value for _, value in stats.get('Maximum', [])]
+    if not averages:
+        return 0.0, 0.0, 0
+    return sum(averages) / len(averages), max(maximums) if maximums else 0.0, len(averages)
+
+def get_cpu_metrics(instance_id: str, cloudwatch=None) -> Tuple[float, float, int]:
     """
     Get CPU utilization metrics for an instance over the past 7 days
     Returns: (avg_cpu, max_cpu, datapoint_count)
     """
-    cloudwatch = boto3.client('cloudwatch', region_name=REGION)
-
     end_time = datetime.now(timezone.utc)
     start_time = end_time - timedelta(days=PERIOD_DAYS)
+    series = fetch_cpu_metrics([instance_id], start_time, end_time, cloudwatch=cloudwatch)
+    return summarize_cpu(series[instance_id])
 
-    try:
-        # Get Average statistics
-        response_avg = cloudwatch.get_metric_statistics(
-            Namespace='AWS/EC2',
-            MetricName='CPUUtilization',
-            Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
-            StartTime=start_time,
-            EndTime=end_time,
-            Period=3600,  # 1 hour
-            Statistics=['Average']
-        )
-
-        # Get Maximum statistics
-        response_max = cloudwatch.get_metric_statistics(
-            Namespace='AWS/EC2',
-            MetricName='CPUUtilization',
-            Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
-            StartTime=start_time,
-            EndTime=end_time,
-            Period=3600,  # 1 hour
-            Statistics=['Maximum']
-        )
-
-        # Calculate average of all hourly averages
-        avg_datapoints = response_avg['Datapoints']
-        max_datapoints = response_max['Datapoints']
-
-        if not avg_datapoints:
-            return 0.0, 0.0, 0
-
-        avg_cpu = sum(dp['Average'] for dp in avg_datapoints) / len(avg_datapoints)
-        max_cpu = max(dp['Maximum'] for dp in max_datapoints) if max_datapoints else 0.0
-
-        return avg_cpu, max_cpu, len(avg_datapoints)
-
-    except Exception as e:
-        print(f"Error getting metrics for {instance_id}: {str(e)}")
-        return 0.0, 0.0, 0
-
-def get_recommendation(avg_cpu: float, max_cpu: float) -> str:
+def cpu_matrix(series: Dict[str, Dict[str, List[Tuple[datetime, float]]]], instance_ids: List[str], stat: str,
+               start_time: datetime, end_time: datetime, period: int = METRIC_PERIOD) -> np.ndarray:
+    """
+    Fleet series as an (instances x periods) float32 array, one column per period of the
+    window starting at its first whole period; periods without a datapoint are NaN.
+    """
+    start = int(start_time.timestamp())
+    start += -start % period
+    slots = max(0, (int(end_time.timestamp()) - start) // period + 1)
+    matrix = np.full((len(instance_ids), slots), np.nan, dtype=np.float32)
+    for row, instance_id in enumerate(instance_ids):
+        points = series[instance_id][stat]
+        if not points:
+            continue
+        timestamps = np.fromiter((ts.timestamp() for ts, _ in points), np.float64, len(points))
+        columns = ((timestamps - start) // period).astype(np.int64)
+        keep = (columns >= 0) & (columns < slots)
+        matrix[row, columns[keep]] = np.fromiter((value for _, value in points), np.float32, len(points))[keep]
+    return matrix
+
+def fleet_cpu_stats(average: np.ndarray, maximum: np.ndarray, period: int = METRIC_PERIOD) -> Dict[str, np.ndarray]:
+    """
+    Per-instance statistics for the whole fleet at once, each an array with one value per
+    row: mean, max, PERCENTILES (linear interpolation, like numpy's default), datapoint
+    count, % of covered time above CPU_BURST_THRESHOLD and the longest run of consecutive
+    periods above it, in minutes. A missing period ends a burst. Rows without data are NaN.
+    """
+    valid = ~np.isnan(average)
+    counts = valid.sum(axis=1)
+    has_data = counts > 0
+    stats = {'count': counts}
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats['mean'] = np.where(has_data, np.nansum(average, axis=1, dtype=np.float64) / counts, np.nan)
+        stats['max'] = np.where(~np.isnan(maximum).all(axis=1),
+                                np.nanmax(np.where(np.isnan(maximum), -np.inf, maximum), axis=1), np.nan)
+
+        # One sort for every percentile: NaN sorts last, so ranks only span each row's data
+        ordered = np.sort(average, axis=1)
+        last = np.maximum(counts - 1, 0)
+        for pct in PERCENTILES:
+            rank = last * (pct / 100.0)
+            low = np.floor(rank).astype(np.int64)
+            high = np.minimum(low + 1, last)
+            lo_values = np.take_along_axis(ordered, low[:, None], axis=1)[:, 0]
+            hi_values = np.take_along_axis(ordered, high[:, None], axis=1)[:, 0]
+            stats[f'p{pct}'] = np.where(has_data, lo_values + (hi_values - lo_values) * (rank - low), np.nan)
+
+        above = average > CPU_BURST_THRESHOLD   # NaN compares False
+        stats['time_above_pct'] = np.where(has_data, above.sum(axis=1) * 100.0 / counts, np.nan)
+
+    # Runs of True: +1 / -1 steps of the zero-padded mask mark where each burst starts and ends.
+    # np.nonzero walks row by row, so the n-th start and the n-th end belong to the same burst.
+    padded = np.zeros((above.shape[0], above.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = above
+    steps = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(steps == 1)
+    _, ends = np.nonzero(steps == -1)
+    longest = np.zeros(above.shape[0], dtype=np.int64)
+    np.maximum.at(longest, rows, ends - starts)
+    stats['longest_burst_minutes'] = np.where(has_data, longest * period / 60.0, np.nan)
+    return stats
+
+def simulate_cpu_credits(average: np.ndarray, instance_type: str = CREDIT_TARGET, period: int = METRIC_PERIOD,
+                         source_vcpus=SOURCE_VCPUS, initial_balance: Optional[float] = None
+                         ) -> Dict[str, np.ndarray]:
+    """
+    Replay each row of the measured CPU (% of a source_vcpus instance; one count for
+    the fleet or one per row) through the
+    credit model of `instance_type` in standard mode, all instances at once. Within a
+    period demand is taken as constant, so the balance drains linearly and the minutes
+    left after it hits zero are spent throttled at the baseline. Returns, per row:
+    throttled minutes, lowest balance, and the surplus credits unlimited mode would
+    bill instead of throttling. Missing periods neither earn nor spend.
+    The balance starts full (a long-running instance) unless initial_balance is given.
+    """
+    vcpus, baseline, earn_per_hour, max_credits = BURSTABLE_TYPES[instance_type]
+    minutes = period / 60.0
+    earn = earn_per_hour / 60.0
+    # Credits per minute: vCPU-equivalents in use, capped at what the target can run
+    source = np.asarray(source_vcpus, dtype=np.float64)
+    if source.ndim:
+        source = source[:, None]
+    demand = np.minimum(average.astype(np.float64) * source / 100.0, vcpus)
+    drain = np.ascontiguousarray(np.nan_to_num(demand - earn, nan=0.0).T)   # one row per period
+    spend = drain * minutes
+    # Balance shortfall / drain rate = minutes throttled; drain is > 0 whenever there is a shortfall
+    inverse = np.divide(1.0, drain, out=np.zeros_like(drain), where=drain > 0)
+
+    rows = average.shape[0]
+    balance = np.full(rows, max_credits if initial_balance is None else min(initial_balance, max_credits),
+                      dtype=np.float64)
+    lowest = balance.copy()
+    throttled = np.zeros(rows)
+    surplus = np.zeros(rows)
+    shortfall = np.empty(rows)
+    for period_spend, period_inverse in zip(spend, inverse):
+        balance -= period_spend
+        np.minimum(balance, 0.0, out=shortfall)      # <= 0
+        surplus -= shortfall
+        shortfall *= period_inverse
+        throttled -= shortfall
+        np.clip(balance, 0.0, max_credits, out=balance)
+        np.minimum(lowest, balance, out=lowest)
+    return {'throttled_minutes': throttled, 'lowest_balance': lowest, 'surplus_credits': surplus,
+            'baseline_pct': baseline, 'max_credits': max_credits}
+
+def monthly_savings(current: str, target: str = CREDIT_TARGET) -> Optional[float]:
+    """EUR/month saved per instance moving from current to target, None when either price is unknown"""
+    if current not in MONTHLY_PRICE_EUR or target not in MONTHLY_PRICE_EUR:
+        return None
+    return round(MONTHLY_PRICE_EUR[current] - MONTHLY_PRICE_EUR[target], 2)
+
+def get_recommendation(p50_cpu: float, p95_cpu: float, longest_burst_minutes: float,
+                       throttled_minutes: float = 0.0, target: str = CREDIT_TARGET, current: str = 't3.small') -> str:
     """
-    Determine if instance is a candidate for downgrade
+    Determine if instance is a candidate for downgrade: low typical load, low sustained
+    load (p95), no burst above CPU_BURST_THRESHOLD lasting MAX_BURST_MINUTES or more,
+    and no CPU credit exhaustion when the history is replayed on the target type.
+    Instances already at or below the target's price are kept as they are.
     """
-    if avg_cpu < CPU_AVG_THRESHOLD and max_cpu < CPU_MAX_THRESHOLD:
-        return "[OK] DOWNGRADE TO t3.micro"
-    elif avg_cpu < CPU_AVG_THRESHOLD:
-        return "[WARN] MONITOR (high max CPU)"
+    savings = monthly_savings(current, target)
+    if current == target or (savings is not None and savings <= 0):
+        return f"[NO] KEEP {current} (already at target)"
+    if p50_cpu < CPU_P50_THRESHOLD and p95_cpu < CPU_P95_THRESHOLD and longest_burst_minutes < MAX_BURST_MINUTES:
+        if throttled_minutes > 0:
+            return f"[WARN] MONITOR (CPU credits run out on {target})"
+        return f"[OK] DOWNGRADE TO {target}"
+    elif p50_cpu < CPU_P50_THRESHOLD and p95_cpu >= CPU_P95_THRESHOLD:
+        return "[WARN] MONITOR (high p95 CPU)"
+    elif p50_cpu < CPU_P50_THRESHOLD:
+        return "[WARN] MONITOR (long CPU bursts)"
     else:
-        return "[NO] KEEP t3.small"
+        return f"[NO] KEEP {current}"
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="CPU analysis of EC2 instances for downgrade decisions")
+    parser.add_argument("--days", type=int, default=PERIOD_DAYS, help=f"analysis window (default: {PERIOD_DAYS})")
+    parser.add_argument("--period", type=int, default=METRIC_PERIOD, choices=[60, 300, 3600],
+                        help=f"CloudWatch period in seconds; 60 needs detailed monitoring (default: {METRIC_PERIOD})")
+    parser.add_argument("--credit-target", default=CREDIT_TARGET, choices=sorted(BURSTABLE_TYPES),
+                        help=f"burstable type to replay the CPU history on (default: {CREDIT_TARGET})")
+    parser.add_argument("--static", action="store_true", help="analyze the hand-maintained INSTANCES list")
+    parser.add_argument("--tag", action="append", default=[], metavar="KEY=VALUE",
+                        help="only discover instances with this tag (repeatable)")
+    parser.add_argument("--env-pattern", metavar="GLOB", help="only discover EB environments matching, e.g. 'rt-*-prod*'")
+    parser.add_argument("--inventory", default=INVENTORY_FILE,
+                        help=f"discovered inventory cache (default: {INVENTORY_FILE})")
+    parser.add_argument("--inventory-ttl", type=int, default=INVENTORY_TTL,
+                        help=f"seconds before the fleet is discovered again (default: {INVENTORY_TTL})")
+    parser.add_argument("--refresh-inventory", action="store_true", help="discover the fleet even if cached")
+    parser.add_argument("--cache", default=CACHE_FILE, help=f"CloudWatch datapoint cache (default: {CACHE_FILE})")
+    parser.add_argument("--no-cache", action="store_true", help="always fetch the whole window from CloudWatch")
+    args = parser.parse_args(argv)
+    if any('=' not in tag for tag in args.tag):
+        parser.error("--tag expects KEY=VALUE")
+    args.tag = [tuple(tag.split('=', 1)) for tag in args.tag]
+    return args
 
 def main():
+    args = parse_args()
     print("=" * 80)
     print("Phase 4: CPU Analysis for EC2 Instance Downgrade")
     print("=" * 80)
-    print(f"\nAnalyzing {len(INSTANCES)} t3.small instances over the past {PERIOD_DAYS} days")
-    print(f"Thresholds: CPU Avg < {CPU_AVG_THRESHOLD}%, CPU Max < {CPU_MAX_THRESHOLD}%")
+    if args.static:
+        units = static_units()
+    else:
+        print("\nDiscovering EC2 instances and Elastic Beanstalk environments...")
+        units = load_inventory(args.tag, args.env_pattern, args.inventory, args.inventory_ttl, args.refresh_inventory)
+    environments = sum(1 for unit in units if unit['environment'])
+    print(f"\nAnalyzing {len(units)} units ({environments} EB environments) over the past {args.days} days")
+    print(f"Thresholds: CPU p50 < {CPU_P50_THRESHOLD}%, CPU p95 < {CPU_P95_THRESHOLD}%, "
+          f"bursts above {CPU_BURST_THRESHOLD}% < {MAX_BURST_MINUTES} min ({args.period}s periods)")
     print("\nFetching metrics from CloudWatch...\n")
 
+    end_time = datetime.now(timezone.utc)
+    start_time = end_time - timedelta(days=args.days)
+    unit_ids = [unit['id'] for unit in units]
+    cache = None if args.no_cache else MetricsCache(args.cache)
+    try:
+        series = fetch_unit_metrics(units, start_time, end_time, args.period, cache)
+    finally:
+        if cache:
+            cache.close()
+
+    average = cpu_matrix(series, unit_ids, 'Average', start_time, end_time, args.period)
+    stats = fleet_cpu_stats(average, cpu_matrix(series, unit_ids, 'Maximum', start_time, end_time, args.period),
+                            args.period)
+    credits = simulate_cpu_credits(average, args.credit_target, args.period, [unit['vcpus'] for unit in units])
+
     results = []
 
-    for i, instance in enumerate(INSTANCES, 1):
-        print(f"[{i}/{len(INSTANCES)}] Analyzing {instance['name']} ({instance['id']})...", end=" ")
+    for i, unit in enumerate(units, 1):
+        print(f"[{i}/{len(units)}] Analyzing {unit['name']} ({', '.join(unit['instances'])})...", end=" ")
 
-        avg_cpu, max_cpu, datapoint_count = get_cpu_metrics(instance['id'])
-        recommendation = get_recommendation(avg_cpu, max_cpu)
+        if stats['count'][i - 1]:
+            values = {name: round(float(column[i - 1]), 3) for name, column in stats.items() if name != 'count'}
+        else:
+            values = {name: 0.0 for name in stats if name != 'count'}
+        throttled = round(float(credits['throttled_minutes'][i - 1]), 1)
+        recommendation = get_recommendation(values['p50'], values['p95'], values['longest_burst_minutes'],
+                                            throttled, args.credit_target, unit['instance_type'])
 
         results.append({
-            "id": instance['id'],
-            "name": instance['name'],
-            "avg_cpu": avg_cpu,
-            "max_cpu": max_cpu,
-            "datapoints": datapoint_count,
-            "recommendation": recommendation
+            "id": unit['id'],
+            "name": unit['name'],
+            "environment": unit['environment'],
+            "metric_dimension": unit['dimension'],
+            "instances": unit['instances'],
+            "instance_type": unit['instance_type'],
+            "vcpus": unit['vcpus'],
+            "avg_cpu": values['mean'],
+            "max_cpu": values['max'],
+            **{f"p{pct}_cpu": values[f'p{pct}'] for pct in PERCENTILES},
+            "time_above_threshold_pct": values['time_above_pct'],
+            "longest_burst_minutes": values['longest_burst_minutes'],
+            "datapoints": int(stats['count'][i - 1]),
+            "credit_target": args.credit_target,
+            "throttled_minutes": throttled,
+            "lowest_credit_balance": round(float(credits['lowest_balance'][i - 1]), 1),
+            "unlimited_surplus_credits": round(float(credits['surplus_credits'][i - 1]), 1),
+            "recommendation": recommendation,
+            "monthly_savings_eur": round((monthly_savings(unit['instance_type'], args.credit_target) or 0.0)
+                                         * len(unit['instances']), 2) if "DOWNGRADE" in recommendation else 0.0
         })
 
-        print(f"Avg: {avg_cpu:.2f}%, Max: {max_cpu:.2f}% -> {recommendation}")
+        print(f"p50: {values['p50']:.2f}%, p95: {values['p95']:.2f}%, Max: {values['max']:.2f}%, "
+              f"burst: {values['longest_burst_minutes']:.0f} min, {args.credit_target} throttled: {throttled:.0f} min "
+              f"-> {recommendation}")
 
     # Generate report
     print("\n" + "=" * 80)
     print("ANALYSIS RESULTS")
     print("=" * 80)
-    print(f"\n{'Instance Name':<40} {'Instance ID':<22} {'CPU Avg':<10} {'CPU Max':<10} {'Recommendation':<30}")
-    print("-" * 130)
+    print(f"\n{'Instance Name':<40} {'Instance ID':<22} {'CPU Avg':<10} {'CPU p95':<10} {'CPU Max':<10} "
+          f"{'Burst':<8} {'Throttled':<10} {'Min credits':<12} {'Recommendation':<30}")
+    print("-" * 170)
 
     downgrade_candidates = []
     monitor_instances = []
     keep_instances = []
 
     for result in results:
-        print(f"{result['name']:<40} {result['id']:<22} {result['avg_cpu']:>7.2f}% {result['max_cpu']:>7.2f}% {result['recommendation']:<30}")
+        instances = result['instances'][0] + (f" +{len(result['instances']) - 1}" if len(result['instances']) > 1 else "")
+        print(f"{result['name'][:40]:<40} {instances:<22} {result['avg_cpu']:>7.2f}%  {result['p95_cpu']:>7.2f}%  "
+              f"{result['max_cpu']:>7.2f}%  {result['longest_burst_minutes']:>4.0f}min "
+              f"{result['throttled_minutes']:>6.0f}min  {result['lowest_credit_balance']:>10.1f}  {result['recommendation']:<30}")
 
         if "DOWNGRADE" in result['recommendation']:
             downgrade_candidates.append(result)
@@ -151,33 +702,53 @@ def main():
     print("\n" + "=" * 80)
     print("SUMMARY")
     print("=" * 80)
-    print(f"\nTotal instances analyzed: {len(results)}")
-    print(f"[OK] Recommended for downgrade to t3.micro: {len(downgrade_candidates)}")
+    print(f"\nTotal analyzed: {len(results)} units, {sum(len(r['instances']) for r in results)} instances")
+    print(f"[OK] Recommended for downgrade to {args.credit_target}: {len(downgrade_candidates)}")
     print(f"[WARN] Monitor (borderline cases): {len(monitor_instances)}")
-    print(f"[NO] Keep as t3.small: {len(keep_instances)}")
+    print(f"[NO] Keep current type: {len(keep_instances)}")
 
-    # Calculate savings
-    monthly_savings_per_instance = 7.50  # EUR
-    total_potential_savings = len(downgrade_candidates) * monthly_savings_per_instance
+    # Calculate savings from the current -> target price of each candidate
+    by_type = {}
+    for result in downgrade_candidates:
+        by_type.setdefault(result['instance_type'], []).append(result)
+    total_potential_savings = round(sum(result['monthly_savings_eur'] for result in downgrade_candidates), 2)
 
     print(f"\nESTIMATED MONTHLY SAVINGS")
-    print(f"   {len(downgrade_candidates)} instances x {monthly_savings_per_instance} EUR/month = {total_potential_savings} EUR/month")
+    for instance_type, candidates in sorted(by_type.items()):
+        count = sum(len(result['instances']) for result in candidates)
+        per_instance = monthly_savings(instance_type, args.credit_target)
+        if per_instance is None:
+            print(f"   {count} instances {instance_type} -> {args.credit_target}: no price known, not counted")
+        else:
+            print(f"   {count} instances {instance_type} -> {args.credit_target} x {per_instance} EUR/month = "
+                  f"{per_instance * count:.2f} EUR/month")
+    print(f"   Total: {total_potential_savings} EUR/month")
 
     # Save detailed results to JSON
     output_file = "cpu-analysis-results.json"
     with open(output_file, 'w') as f:
         json.dump({
             "analysis_date": datetime.now(timezone.utc).isoformat(),
-            "period_days": PERIOD_DAYS,
+            "period_days": args.days,
+            "metric_period_seconds": args.period,
+            "credit_simulation": {
+                "target": args.credit_target,
+                "baseline_pct_per_vcpu": credits['baseline_pct'],
+                "max_credits": credits['max_credits']
+            },
             "thresholds": {
-                "cpu_avg": CPU_AVG_THRESHOLD,
-                "cpu_max": CPU_MAX_THRESHOLD
+                "cpu_p50": CPU_P50_THRESHOLD,
+                "cpu_p95": CPU_P95_THRESHOLD,
+                "cpu_burst": CPU_BURST_THRESHOLD,
+                "max_burst_minutes": MAX_BURST_MINUTES
             },
             "summary": {
-                "total_instances": len(results),
+                "total_units": len(results),
+                "total_instances": sum(len(r['instances']) for r in results),
                 "downgrade_candidates": len(downgrade_candidates),
                 "monitor_instances": len(monitor_instances),
                 "keep_instances": len(keep_instances),
+                "credit_throttled_instances": sum(1 for r in results if r['throttled_minutes'] > 0),
                 "estimated_monthly_savings_eur": total_potential_savings
             },
             "instances": results
@@ -191,7 +762,8 @@ def main():
         print("INSTANCES RECOMMENDED FOR DOWNGRADE")
         print("=" * 80)
         for result in downgrade_candidates:
-            print(f"  - {result['name']} ({result['id']}) - Avg: {result['avg_cpu']:.2f}%, Max: {result['max_cpu']:.2f}%")
+            print(f"  - {result['name']} ({result['id']}) - p50: {result['p50_cpu']:.2f}%, p95: {result['p95_cpu']:.2f}%, "
+                  f"Max: {result['max_cpu']:.2f}%, longest burst: {result['longest_burst_minutes']:.0f} min")
 
     print("\n" + "=" * 80)
     print("Next steps:")
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+RT Backend Services - Capacity analysis
+Charge un service par paliers de concurrence (modele ferme de load-test.py), ajuste
+la loi universelle de scalabilite (USL) au debit, en deduit la latence par la loi de
+Little, puis estime le genou de saturation et le debit max tenable sous le SLO.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import math
+import os
+import sys
+from datetime import datetime, timezone
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+
+def _load_script(name, filename):
+    """Sibling scripts are not importable by name (hyphen), load them from their path"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+monitor = _load_script("monitor_services", "monitor-services.py")
+loadtest = _load_script("load_test", "load-test.py")
+
+# Written next to cpu-analysis-results.json (analyze-cpu-metrics.py writes it to the working directory)
+RESULTS_FILE = "capacity-analysis-results.json"
+CONCURRENCY_LEVELS = "1,2,4,8,16,32,64"
+STEP_DURATION = 20.0
+STEP_WARMUP = 5.0
+MIN_FIT_STEPS = 3
+MAX_ERROR_RATE = 0.01          # steps with more errors / completed are left out of the fit
+# The series stops early once the service is clearly past its limit
+STOP_THROUGHPUT = 0.8          # throughput below this fraction of the best step (retrograde)
+STOP_ERROR_RATE = 0.05
+STOP_LATENCY_FACTOR = 3.0      # percentile latency above this multiple of the SLO
+
+
+def _solve(matrix, vector):
+    """Gaussian elimination with partial pivoting; None when the system is singular"""
+    n = len(vector)
+    rows = [list(matrix[i]) + [vector[i]] for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(rows[r][col]))
+        if abs(rows[pivot][col]) < 1e-12:
+            return None
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for r in range(n):
+            if r != col:
+                factor = rows[r][col] / rows[col][col]
+                rows[r] = [a - factor * b for a, b in zip(rows[r], rows[col])]
+    return [rows[i][n] / rows[i][i] for i in range(n)]
+
+
+def least_squares(features, targets):
+    """Coefficients minimising sum((features . coef - target)^2), via the normal equations"""
+    k = len(features[0])
+    xtx = [[sum(f[i] * f[j] for f in features) for j in range(k)] for i in range(k)]
+    xty = [sum(f[i] * y for f, y in zip(features, targets)) for i in range(k)]
+    return _solve(xtx, xty)
+
+
+def _r_squared(predicted, observed):
+    mean = sum(observed) / len(observed)
+    total = sum((y - mean) ** 2 for y in observed)
+    residual = sum((y - p) ** 2 for y, p in zip(observed, predicted))
+    return round(1 - residual / total, 4) if total else None
+
+
+def usl_throughput(n, lam, sigma, kappa):
+    return lam * n / (1 + sigma * (n - 1) + kappa * n * (n - 1))
+
+
+def fit_usl(points):
+    """
+    Universal Scalability Law X(N) = lambda N / (1 + sigma (N-1) + kappa N (N-1)) over
+    (concurrency, throughput) points. N / X is linear in (1, N-1, N(N-1)), so the fit is
+    ordinary least squares; a negative coefficient is dropped and the rest refitted.
+    """
+    terms = [lambda n: 1.0, lambda n: n - 1, lambda n: n * (n - 1)]
+    active = [0, 1, 2]
+    while True:
+        features = [[terms[t](n) for t in active] for n, _ in points]
+        coef = least_squares(features, [n / x for n, x in points])
+        if coef is None:
+            return None
+        negative = [t for t, c in zip(active, coef) if c < 0 and t != 0]
+        if not negative or coef[0] <= 0:
+            break
+        active = [t for t in active if t not in negative]
+    if coef[0] <= 0:
+        return None
+    full = dict(zip(active, coef))
+    lam = 1 / full[0]
+    sigma = full.get(1, 0.0) * lam
+    kappa = full.get(2, 0.0) * lam
+
+    if kappa > 0:
+        # Retrograde scaling: throughput peaks, then falls
+        peak_n = math.sqrt(max(1 - sigma, 0.0) / kappa)
+        peak_rps = usl_throughput(max(peak_n, 1.0), lam, sigma, kappa)
+    elif sigma > 0:
+        # Contention only: throughput tends to lambda / sigma
+        peak_n, peak_rps = None, lam / sigma
+    else:
+        peak_n, peak_rps = None, None
+    # Knee: where the fitted curve has lost half of linear scaling (X(N) = lambda N / 2),
+    # i.e. sigma (N-1) + kappa N (N-1) = 1
+    if kappa > 0:
+        b = sigma + kappa
+        knee_n = 1 + (-b + math.sqrt(b * b + 4 * kappa)) / (2 * kappa)
+    elif sigma > 0:
+        knee_n = 1 + 1 / sigma
+    else:
+        knee_n = None
+
+    predicted = [usl_throughput(n, lam, sigma, kappa) for n, _ in points]
+    return {
+        "lambda": round(lam, 3),
+        "sigma": round(sigma, 5),
+        "kappa": round(kappa, 6),
+        "peak_concurrency": round(peak_n, 2) if peak_n is not None else None,
+        "peak_rps": round(peak_rps, 2) if peak_rps is not None else None,
+        "knee_concurrency": round(knee_n, 2) if knee_n is not None else None,
+        "knee_rps": round(usl_throughput(knee_n, lam, sigma, kappa), 2) if knee_n is not None else None,
+        "r_squared": _r_squared(predicted, [x for _, x in points]),
+    }
+
+
+def latency_model(usl, steps):
+    """
+    Closed-loop latency from the USL fit through Little's law, R(N) = N / X(N), scaled
+    to the objective percentile by the median measured percentile / mean ratio.
+    """
+    ratios = sorted(s["latency_ms"] / s["mean_ms"] for s in steps if s["latency_ms"] and s["mean_ms"])
+    if not usl or not ratios:
+        return None
+    tail_factor = ratios[len(ratios) // 2]
+    return {"base_ms": round(tail_factor * 1000 / usl["lambda"], 2), "tail_factor": round(tail_factor, 3)}
+
+
+def sustainable(usl, model, slo_ms):
+    """
+    Highest concurrency, and its throughput, whose modelled percentile latency stays
+    within slo_ms: tail_factor (1 + sigma (N-1) + kappa N (N-1)) / lambda <= slo, a
+    quadratic in N. Capped at the USL peak, past which more load only loses throughput.
+    """
+    if not usl or not model:
+        return None, None
+    lam, sigma, kappa = usl["lambda"], usl["sigma"], usl["kappa"]
+    budget = lam * slo_ms / 1000 / model["tail_factor"]   # allowed 1 + sigma (N-1) + kappa N (N-1)
+    if budget < 1:
+        return 0.0, 0.0
+    if kappa > 0:
+        b = sigma - kappa
+        n = (-b + math.sqrt(b * b + 4 * kappa * (budget - 1 + sigma))) / (2 * kappa)
+    elif sigma > 0:
+        n = 1 + (budget - 1) / sigma
+    else:
+        return None, None     # no contention measured: the series never approached the limit
+    if usl["peak_concurrency"]:
+        n = min(n, usl["peak_concurrency"])
+    return round(n, 2), round(usl_throughput(n, lam, sigma, kappa), 2)
+
+
+def _percentile_ms(histogram, percentile):
+    return round(histogram.value_at(percentile) / 1000, 2) if histogram and histogram.total else None
+
+
+def summarize_step(result, percentile):
+    """
+    One step of the series. mean_ms and latency_ms both come from the raw histogram,
+    the one Little's law and the fit are about; the coordinated-omission corrected
+    mean and percentile are reported beside them as corrected_*.
+    """
+    corrected = result.get("histogram_corrected")
+    errors = sum(result["errors"].values())
+    return {
+        "concurrency": result["concurrency"],
+        "throughput_rps": result["throughput_rps"],
+        "mean_ms": result["latency"]["mean_ms"],
+        "latency_ms": _percentile_ms(result["histogram"], percentile),
+        "corrected_mean_ms": result["latency_corrected"]["mean_ms"] if corrected else None,
+        "corrected_latency_ms": _percentile_ms(corrected, percentile),
+        "error_rate": round(errors / result["completed"], 4) if result["completed"] else 1.0,
+        "completed": result["completed"],
+    }
+
+
+def analyze(steps, slo_ms):
+    """USL fit, knee and max sustainable RPS from a stepped concurrency series"""
+    healthy = [s for s in steps if s["throughput_rps"] and s["error_rate"] <= MAX_ERROR_RATE]
+    usl = fit_usl([(s["concurrency"], s["throughput_rps"]) for s in healthy]) \
+        if len(healthy) >= MIN_FIT_STEPS else None
+    model = latency_model(usl, healthy)
+    concurrency, rps = sustainable(usl, model, slo_ms)
+    within_slo = [s for s in healthy if s["latency_ms"] is not None and s["latency_ms"] <= slo_ms]
+    return {
+        "usl": usl,
+        "latency_model": model,
+        "knee_rps": usl["knee_rps"] if usl else None,
+        "max_sustainable_concurrency": concurrency,
+        "max_sustainable_rps": rps,
+        "measured_max_rps_within_slo": max((s["throughput_rps"] for s in within_slo), default=None),
+    }
+
+
+async def run_series(target, levels, duration, warmup, percentile, slo_ms, token=None, timeout=None):
+    """Closed-model steps at each concurrency level, stopping once the service is past its limit"""
+    steps = []
+    best = 0.0
+    for i, concurrency in enumerate(levels, 1):
+        result = await loadtest.run_load(target, "closed", concurrency=concurrency, duration=duration,
+                                         warmup=warmup, token=token, timeout=timeout)
+        step = summarize_step(result, percentile)
+        steps.append(step)
+        print(f"  [{i}/{len(levels)}] N {concurrency:>4}  throughput {step['throughput_rps']:>8} req/s  "
+              f"mean {monitor._format_ms(step['mean_ms']):>8}  p{percentile:g} "
+              f"{monitor._format_ms(step['latency_ms']):>8} (CO-corrected "
+              f"{monitor._format_ms(step['corrected_latency_ms'])})  errors {step['error_rate']:.1%}", flush=True)
+        best = max(best, step["throughput_rps"])
+        if (step["throughput_rps"] < STOP_THROUGHPUT * best or step["error_rate"] > STOP_ERROR_RATE
+                or (step["latency_ms"] or 0) > STOP_LATENCY_FACTOR * slo_ms):
+            print("  Service past its limit, stopping the series")
+            break
+    return steps
+
+
+async def run(args, slo_ms, percentile):
+    stand_in = None
+    token = None
+    try:
+        if args.stand_in:
+            stand_in = loadtest.StandInServer(args.stand_in_delay, args.stand_in_workers)
+            await stand_in.start()
+            target = {"service": "stand-in", "url": stand_in.url + args.path, "method": args.method, "body": None}
+        else:
+            target = loadtest.resolve_target(args)
+        if args.auth:
+            client = monitor.HttpClient()
+            login_result, token, _ = await monitor.login(client)
+            await client.close()
+            if not token:
+                raise SystemExit(f"Login failed: {login_result['message']}")
+        levels = [int(level) for level in args.levels.split(",")]
+        return await run_series(target, levels, args.step_duration, args.warmup, percentile, slo_ms,
+                                token, args.timeout)
+    finally:
+        if stand_in:
+            await stand_in.close()
+
+
+def save_result(path, service, entry):
+    """Merge one service's analysis into the results file, keyed by service then instance type"""
+    try:
+        with open(path) as f:
+            results = json.load(f)
+    except (OSError, ValueError):
+        results = {}
+    results.setdefault("services", {}).setdefault(service, {})[entry["instance_type"] or "unknown"] = entry
+    results["updated"] = entry["analysis_date"]
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stepped-load capacity analysis (USL fit, knee and max RPS within the SLO)")
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument("--service", help="service name from the monitor registry, e.g. \"Orders API\"")
+    where.add_argument("--url", help="explicit URL instead of a registry service")
+    where.add_argument("--stand-in", action="store_true", help="start a local stand-in server and load it")
+    parser.add_argument("--path", default="/health", help="path on the service (default: /health)")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--body", help="JSON request body")
+    parser.add_argument("--auth", action="store_true", help="send the demo account token")
+    parser.add_argument("--levels", default=CONCURRENCY_LEVELS,
+                        help=f"comma-separated concurrency steps (default: {CONCURRENCY_LEVELS})")
+    parser.add_argument("--step-duration", type=float, default=STEP_DURATION,
+                        help=f"measured seconds per step (default: {STEP_DURATION:g})")
+    parser.add_argument("--warmup", type=float, default=STEP_WARMUP,
+                        help=f"unmeasured seconds per step (default: {STEP_WARMUP:g})")
+    parser.add_argument("--slo-ms", type=float, help="latency objective (default: the service SLO latency_ms)")
+    parser.add_argument("--percentile", type=float,
+                        help="percentile held to the objective (default: the service SLO latency target)")
+    parser.add_argument("--instance-type", help="instance type under test, e.g. t3.micro (recorded in the results)")
+    parser.add_argument("--timeout", type=float, help="per-request timeout in seconds")
+    parser.add_argument("--stand-in-delay", type=float, default=5.0, help="stand-in: response delay in ms")
+    parser.add_argument("--stand-in-workers", type=int, help="stand-in: requests served concurrently")
+    parser.add_argument("--output", default=RESULTS_FILE, help=f"results file (default: {RESULTS_FILE})")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    name = args.service or args.url or "stand-in"
+    slo = monitor.slo_for(args.service)
+    slo_ms = args.slo_ms or slo["latency_ms"]
+    percentile = args.percentile or slo["latency"]
+
+    print("=" * 70)
+    print(f"  CAPACITY ANALYSIS - {name}{args.path if not args.url else ''} - "
+          f"objective p{percentile:g} <= {slo_ms:g}ms")
+    print("=" * 70)
+
+    steps = asyncio.run(run(args, slo_ms, percentile))
+    analysis = analyze(steps, slo_ms)
+
+    print("\n" + "-" * 70)
+    usl, model = analysis["usl"], analysis["latency_model"]
+    if usl:
+        print(f"  USL: lambda {usl['lambda']} req/s/unit  sigma {usl['sigma']}  kappa {usl['kappa']}  "
+              f"R2 {usl['r_squared']}")
+        print(f"       peak {usl['peak_rps']} req/s at N={usl['peak_concurrency']}  "
+              f"knee {usl['knee_rps']} req/s at N={usl['knee_concurrency']}")
+    else:
+        print(f"  USL: not enough healthy steps (need {MIN_FIT_STEPS})")
+    if model:
+        print(f"  Latency: p{percentile:g} {model['base_ms']}ms unloaded, {model['tail_factor']}x the mean")
+    print(f"  Max sustainable: {analysis['max_sustainable_rps']} req/s modelled "
+          f"(N={analysis['max_sustainable_concurrency']}), "
+          f"{analysis['measured_max_rps_within_slo']} req/s measured within p{percentile:g} <= {slo_ms:g}ms")
+
+    entry = dict(analysis, analysis_date=datetime.now(timezone.utc).isoformat(), target=name, path=args.path,
+                 instance_type=args.instance_type, slo={"latency_ms": slo_ms, "percentile": percentile},
+                 steps=steps)
+    save_result(args.output, name, entry)
+    print(f"\nResults saved to: {args.output}")
+
+    sys.exit(0 if analysis["max_sustainable_rps"] is not None else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+RT Backend Services - Load generator
+Applique une charge controlee a un endpoint du registre de services :
+debit d'arrivee constant (modele ouvert) ou concurrence fixe (modele ferme),
+latences en HdrHistogram avec correction du coordinated omission.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import math
+import os
+import sys
+from datetime import datetime
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+
+def _load_monitor():
+    """monitor-services.py is not importable by name (hyphen), load it from its path"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "monitor-services.py")
+    spec = importlib.util.spec_from_file_location("monitor_services", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+monitor = _load_monitor()
+
+REPORT_FILE = "load-test-report.json"
+MAX_IN_FLIGHT = 256          # open model: concurrent requests before arrivals start queueing
+HIGHEST_TRACKABLE_US = 3600 * 1000 * 1000
+SIGNIFICANT_FIGURES = 3
+REPORT_PERCENTILES = [50, 75, 90, 95, 99, 99.9, 99.99]
+
+
+class HdrHistogram:
+    """
+    High Dynamic Range histogram of integer values (microseconds here): log-linear
+    buckets keeping `significant_figures` decimal digits of precision from 1 to
+    `highest`, with constant memory and O(1) recording. Same bucket layout as the
+    reference HdrHistogram, so percentile output can be plotted with its tools.
+    """
+
+    def __init__(self, highest=HIGHEST_TRACKABLE_US, significant_figures=SIGNIFICANT_FIGURES):
+        self.highest = highest
+        self.significant_figures = significant_figures
+        largest_single_unit = 2 * 10 ** significant_figures
+        self.sub_bucket_bits = math.ceil(math.log2(largest_single_unit))
+        self.sub_bucket_count = 1 << self.sub_bucket_bits
+        self.sub_bucket_half_bits = self.sub_bucket_bits - 1
+        self.sub_bucket_half_count = self.sub_bucket_count // 2
+        self.bucket_count = max(1, highest.bit_length() - self.sub_bucket_bits + 1)
+        self.counts = [0] * ((self.bucket_count + 1) * self.sub_bucket_half_count)
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self._sum = 0
+
+    def _index(self, value):
+        bucket = max(0, value.bit_length() - self.sub_bucket_bits)
+        sub_bucket = value >> bucket
+        return ((bucket + 1) << self.sub_bucket_half_bits) + sub_bucket - self.sub_bucket_half_count
+
+    def _value(self, index):
+        """Lowest value of the bucket at `index`, and the bucket width"""
+        bucket = (index >> self.sub_bucket_half_bits) - 1
+        sub_bucket = (index & (self.sub_bucket_half_count - 1)) + self.sub_bucket_half_count
+        if bucket < 0:
+            sub_bucket -= self.sub_bucket_half_count
+            bucket = 0
+        return sub_bucket << bucket, 1 << bucket
+
+    def record(self, value, count=1):
+        value = min(max(int(value), 0), self.highest)
+        self.counts[self._index(value)] += count
+        self.total += count
+        self._sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def record_corrected(self, value, expected_interval):
+        """
+        Record `value` plus the samples a stalled closed-loop generator failed to send:
+        value - interval, value - 2 x interval, ... while above the expected interval.
+        """
+        self.record(value)
+        if expected_interval <= 0:
+            return
+        missing = value - expected_interval
+        while missing >= expected_interval:
+            self.record(missing)
+            missing -= expected_interval
+
+    def corrected(self, expected_interval):
+        """Copy with coordinated-omission correction applied after the fact"""
+        copy = HdrHistogram(self.highest, self.significant_figures)
+        for index, count in enumerate(self.counts):
+            if count:
+                low, width = self._value(index)
+                for _ in range(count):
+                    copy.record_corrected(low + width // 2 if width > 1 else low, expected_interval)
+        return copy
+
+    def add(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self._sum += other._sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def value_at(self, pct):
+        """Highest value equivalent to the given percentile (0 when empty)"""
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(self.total * min(pct, 100.0) / 100.0))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                low, width = self._value(index)
+                return min(low + width - 1, self.max)
+        return self.max
+
+    def mean(self):
+        return self._sum / self.total if self.total else 0.0
+
+    def stddev(self):
+        if not self.total:
+            return 0.0
+        mean = self.mean()
+        squares = 0.0
+        for index, count in enumerate(self.counts):
+            if count:
+                low, width = self._value(index)
+                squares += count * (low + width / 2 - mean) ** 2
+        return math.sqrt(squares / self.total)
+
+    def spectrum(self, ticks_per_half_distance=5):
+        """(value, percentile, cumulative count) points of the percentile distribution"""
+        points = []
+        pct = 0.0
+        while self.total and pct < 100.0:
+            value = self.value_at(pct)
+            points.append((value, pct, self._count_at_or_below(value)))
+            if 1 / (1 - pct / 100.0) > self.total:
+                break
+            half_distance = 2 ** (math.floor(math.log2(100.0 / (100.0 - pct))) + 1)
+            pct += 100.0 / (ticks_per_half_distance * half_distance)
+        if self.total:
+            points.append((self.max, 100.0, self.total))
+        return points
+
+    def _count_at_or_below(self, value):
+        limit = self._index(min(value, self.highest))
+        return sum(self.counts[:limit + 1])
+
+    def summary(self, scale=1000.0):
+        """Percentiles in milliseconds"""
+        result = {"count": self.total, "min_ms": round((self.min or 0) / scale, 3),
+                  "mean_ms": round(self.mean() / scale, 3), "max_ms": round(self.max / scale, 3)}
+        for pct in REPORT_PERCENTILES:
+            result[f"p{pct:g}_ms"] = round(self.value_at(pct) / scale, 3)
+        return result
+
+    def hgrm(self, scale=1000.0):
+        """Percentile distribution in the .hgrm text format of HdrHistogram (values in ms)"""
+        lines = [f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}", ""]
+        for value, pct, count in self.spectrum():
+            inverse = f"{1 / (1 - pct / 100.0):14.2f}" if pct < 100.0 else f"{'inf':>14}"
+            lines.append(f"{value / scale:12.3f} {pct / 100.0:14.12f} {count:10d} {inverse}")
+        lines += [f"#[Mean    = {self.mean() / scale:12.3f}, StdDeviation   = {self.stddev() / scale:12.3f}]",
+                  f"#[Max     = {self.max / scale:12.3f}, Total count    = {self.total:12d}]",
+                  f"#[Buckets = {self.bucket_count:12d}, SubBuckets     = {self.sub_bucket_count:12d}]"]
+        return "\n".join(lines) + "\n"
+
+
+class Timeline:
+    """Per-second completions, errors and latency percentiles (throughput curve)"""
+
+    def __init__(self):
+        self.seconds = {}
+
+    def record(self, second, latency_us, ok):
+        slot = self.seconds.get(second)
+        if slot is None:
+            slot = self.seconds[second] = {"ok": 0, "errors": 0, "histogram": HdrHistogram(significant_figures=2)}
+        if ok:
+            slot["ok"] += 1
+            slot["histogram"].record(latency_us)
+        else:
+            slot["errors"] += 1
+
+    def curve(self):
+        return [{"second": second, "rps": slot["ok"] + slot["errors"], "errors": slot["errors"],
+                 "p50_ms": round(slot["histogram"].value_at(50) / 1000, 2),
+                 "p99_ms": round(slot["histogram"].value_at(99) / 1000, 2)}
+                for second, slot in sorted(self.seconds.items())]
+
+
+class StandInServer:
+    """
+    Local HTTP/1.1 keep-alive server answering every request after `delay_ms`,
+    optionally saturating beyond `workers` concurrent requests like a small instance.
+    Used to exercise the generator without touching a real service.
+    """
+
+    def __init__(self, delay_ms=5.0, workers=None, host="127.0.0.1", port=0):
+        self.delay = delay_ms / 1000.0
+        self.workers = asyncio.Semaphore(workers) if workers else None
+        self.host = host
+        self.port = port
+        self._server = None
+        self._handlers = {}
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer):
+        self._handlers[asyncio.current_task()] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value.strip())
+                if length:
+                    await reader.readexactly(length)
+                if self.workers:
+                    async with self.workers:
+                        await asyncio.sleep(self.delay)
+                else:
+                    await asyncio.sleep(self.delay)
+                body = b'{"status":"healthy","service":"stand-in"}'
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._handlers.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            # Keep-alive connections are not closed by the server: drop them and let handlers return
+            handlers = dict(self._handlers)
+            for writer in handlers.values():
+                writer.close()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self._server.wait_closed()
+
+
+async def _send(client, target, headers):
+    try:
+        response = await client.request(target["method"], target["url"], headers=headers, body=target.get("body"))
+        return response.status < 400, response.status
+    except asyncio.TimeoutError:
+        return False, "timeout"
+    except (OSError, monitor.ProbeError, asyncio.IncompleteReadError) as e:
+        return False, type(e).__name__
+
+
+async def run_load(target, model="open", rate=50.0, concurrency=10, duration=30.0, warmup=0.0,
+                   max_in_flight=MAX_IN_FLIGHT, think_ms=0.0, token=None, timeout=None,
+                   expected_interval_ms=None):
+    """
+    Drive load at target["url"] and return the histograms and curves.
+
+    open:   arrivals every 1/rate seconds whatever the responses; latency is measured
+            from each request's intended start, so queueing behind slow responses is
+            counted (no coordinated omission by construction).
+    closed: `concurrency` workers send back to back (plus think time). "histogram",
+            "latency" and "percentile_curve" stay the raw measurements; a copy
+            corrected for coordinated omission after the fact is reported beside them
+            as "histogram_corrected", "latency_corrected" and "percentile_curve_corrected",
+            with the expected interval used in "co_correction". That interval is
+            `expected_interval_ms` when the pacing of a worker is known; otherwise it is
+            estimated as the mean measured response time plus the think time. The
+            estimate is a heuristic: stalls inflate that mean, so long stalls are
+            under-corrected rather than over-corrected.
+    """
+    loop = asyncio.get_running_loop()
+    limit = max_in_flight if model == "open" else concurrency
+    client = monitor.HttpClient(timeout=timeout or monitor.REQUEST_TIMEOUT, per_host_limit=limit, idle_per_host=limit)
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    if target.get("body") is not None:
+        headers["Content-Type"] = "application/json"
+
+    latency = HdrHistogram()    # from intended start (open) or send time (closed)
+    service = HdrHistogram()    # from actual send time: what a naive tool reports
+    timeline = Timeline()
+    errors = {}
+    started = loop.time()
+    measure_from = started + warmup
+    end = measure_from + duration
+
+    def record(intended, sent, ok, status):
+        done = loop.time()
+        if done < measure_from:
+            return
+        timeline.record(int(done - measure_from), (done - intended) * 1e6, ok)
+        if ok:
+            latency.record((done - intended) * 1e6)
+            service.record((done - sent) * 1e6)
+        else:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+
+    try:
+        if model == "open":
+            gate = asyncio.Semaphore(max_in_flight)
+            in_flight = set()
+
+            async def one(intended):
+                async with gate:
+                    sent = loop.time()
+                    ok, status = await _send(client, target, headers)
+                record(intended, sent, ok, status)
+
+            interval = 1.0 / rate
+            sent_count = 0
+            while True:
+                intended = started + sent_count * interval
+                if intended >= end:
+                    break
+                delay = intended - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.create_task(one(intended))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+                sent_count += 1
+            if in_flight:
+                await asyncio.wait(in_flight)
+        else:
+            async def worker():
+                while loop.time() < end:
+                    sent = loop.time()
+                    ok, status = await _send(client, target, headers)
+                    record(sent, sent, ok, status)
+                    if think_ms:
+                        await asyncio.sleep(think_ms / 1000.0)
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        await client.close()
+
+    elapsed = max(loop.time() - measure_from, 1e-9)
+    completed = latency.total + sum(errors.values())
+    result = {
+        "target": {key: value for key, value in target.items() if key != "body"},
+        "model": model,
+        "offered_rps": rate if model == "open" else None,
+        "concurrency": concurrency if model == "closed" else None,
+        "duration_s": round(elapsed, 2),
+        "completed": completed,
+        "errors": errors,
+        "throughput_rps": round(latency.total / elapsed, 2),
+        "latency": latency.summary(),
+        "service_time": service.summary(),
+        "throughput_curve": timeline.curve(),
+        "histogram": latency,
+    }
+    result["percentile_curve"] = _percentile_curve(latency)
+    if model == "closed" and latency.total:
+        if expected_interval_ms:
+            expected_us, source = expected_interval_ms * 1000, "configured"
+        else:
+            expected_us, source = latency.mean() + think_ms * 1000, "mean response + think time"
+        corrected = latency.corrected(expected_us)
+        result.update(histogram_corrected=corrected, latency_corrected=corrected.summary(),
+                      percentile_curve_corrected=_percentile_curve(corrected),
+                      co_correction={"expected_interval_ms": round(expected_us / 1000, 3), "source": source})
+    return result
+
+
+def _percentile_curve(histogram):
+    return [{"percentile": pct, "value_ms": round(value / 1000, 3)} for value, pct, _ in histogram.spectrum()]
+
+
+def resolve_target(args):
+    """Target URL from the service registry (or --url), as {"service", "url", "method"}"""
+    if args.url:
+        url, service = args.url, None
+    else:
+        if args.service not in monitor.SERVICES:
+            raise SystemExit(f"Unknown service {args.service!r}; known: {', '.join(monitor.SERVICES)}")
+        url, service = monitor.SERVICES[args.service] + args.path, args.service
+    body = args.body.encode() if args.body else None
+    return {"service": service, "url": url, "method": args.method, "body": body}
+
+
+def print_result(result):
+    lat = result["latency"]
+    print(f"  completed {result['completed']} in {result['duration_s']}s  "
+          f"throughput {result['throughput_rps']} req/s  errors {sum(result['errors'].values())} {result['errors'] or ''}")
+    print(f"  {'':14} " + " ".join(f"{'p' + format(p, 'g'):>9}" for p in REPORT_PERCENTILES) + f" {'max':>9}")
+    rows = [("latency", lat), ("service time", result["service_time"])]
+    if "latency_corrected" in result:
+        rows.insert(1, ("CO-corrected", result["latency_corrected"]))
+    for label, summary in rows:
+        print(f"  {label:14} " + " ".join(f"{summary[f'p{p:g}_ms']:>7.1f}ms" for p in REPORT_PERCENTILES)
+              + f" {summary['max_ms']:>7.1f}ms")
+    if "co_correction" in result:
+        co = result["co_correction"]
+        print(f"  CO-corrected: expected interval {co['expected_interval_ms']:.1f}ms ({co['source']})")
+
+
+async def run(args):
+    stand_in = None
+    token = None
+    try:
+        if args.stand_in:
+            stand_in = StandInServer(args.stand_in_delay, args.stand_in_workers)
+            await stand_in.start()
+            target = {"service": "stand-in", "url": stand_in.url + args.path, "method": args.method,
+                      "body": args.body.encode() if args.body else None}
+        else:
+            target = resolve_target(args)
+        if args.auth:
+            client = monitor.HttpClient()
+            login_result, token, _ = await monitor.login(client)
+            await client.close()
+            if not token:
+                raise SystemExit(f"Login failed: {login_result['message']}")
+        return await run_load(target, args.model, args.rate, args.concurrency, args.duration, args.warmup,
+                              args.max_in_flight, args.think, token, args.timeout, args.expected_interval)
+    finally:
+        if stand_in:
+            await stand_in.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Open/closed-model load generator with HdrHistogram latencies")
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument("--service", help="service name from the monitor registry, e.g. \"Orders API\"")
+    where.add_argument("--url", help="explicit URL instead of a registry service")
+    where.add_argument("--stand-in", action="store_true", help="start a local stand-in server and load it")
+    parser.add_argument("--path", default="/health", help="path on the service (default: /health)")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--body", help="JSON request body")
+    parser.add_argument("--auth", action="store_true", help="send the demo account token")
+    parser.add_argument("--model", choices=["open", "closed"], default="open")
+    parser.add_argument("--rate", type=float, default=50.0, help="open: arrivals per second (default: 50)")
+    parser.add_argument("--concurrency", type=int, default=10, help="closed: concurrent workers (default: 10)")
+    parser.add_argument("--think", type=float, default=0.0, help="closed: think time per worker in ms")
+    parser.add_argument("--expected-interval", type=float, metavar="MS",
+                        help="closed: intended interval between a worker's requests for the coordinated-omission "
+                             "correction (default: mean response time + think time)")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds (default: 30)")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds first (default: 5)")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT,
+                        help=f"open: concurrent requests before arrivals queue (default: {MAX_IN_FLIGHT})")
+    parser.add_argument("--timeout", type=float, help="per-request timeout in seconds")
+    parser.add_argument("--stand-in-delay", type=float, default=5.0, help="stand-in: response delay in ms")
+    parser.add_argument("--stand-in-workers", type=int, help="stand-in: requests served concurrently")
+    parser.add_argument("--output", default=REPORT_FILE, help=f"JSON report (default: {REPORT_FILE})")
+    parser.add_argument("--hgrm", metavar="PATH", help="also write the percentile distribution in .hgrm format")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    load = f"{args.rate:g} req/s" if args.model == "open" else f"{args.concurrency} workers"
+    print("=" * 70)
+    print(f"  LOAD TEST - {args.service or args.url or 'stand-in'}{args.path if not args.url else ''} - "
+          f"{args.model} model, {load}, {args.duration:g}s (+{args.warmup:g}s warmup)")
+    print("=" * 70)
+
+    result = asyncio.run(run(args))
+    print_result(result)
+
+    histogram = result.pop("histogram")
+    corrected = result.pop("histogram_corrected", None)
+    if args.hgrm:
+        with open(args.hgrm, "w") as f:
+            f.write(histogram.hgrm())
+        print(f"\nPercentile distribution saved to: {args.hgrm}")
+        if corrected:
+            root, ext = os.path.splitext(args.hgrm)
+            with open(f"{root}-corrected{ext}", "w") as f:
+                f.write(corrected.hgrm())
+            print(f"CO-corrected distribution saved to: {root}-corrected{ext}")
+    with open(args.output, "w") as f:
+        json.dump(dict(result, timestamp=datetime.now().isoformat()), f, indent=2)
+    print(f"Report saved to: {args.output}")
+
+    sys.exit(0 if not result["errors"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,26 @@
 RT Backend Services - Production Monitoring Agent
 Surveille l'etat de sante de tous les services SYMPHONI.A
 """
-import subprocess
+import argparse
+import asyncio
+import base64
+import bisect
+import gzip
+import hashlib
 import json
+import math
+import os
+import random
+import shutil
+import signal
+import socket
+import sqlite3
+import ssl
 import sys
+import time
+from collections import deque
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
 
 # All services with their CloudFront HTTPS endpoints
 SERVICES = {
@@ -43,178 +58,2714 @@ SERVICES = {
     "Subscription Invoicing API": "https://d1zeelzdka3pib.cloudfront.net",
 }
 
-def check_service(name, url):
+# Elastic Beanstalk origin behind each CloudFront distribution (default cache
+# behaviour, plain HTTP as configured on the distributions). Override with --origins.
+ORIGINS = {
+    "Auth API": "http://rt-auth-api-prod.eba-g2psqhq5.eu-central-1.elasticbeanstalk.com",
+    "Authz API": "http://rt-authz-api-prod.eba-smipp22d.eu-central-1.elasticbeanstalk.com",
+    "Orders API": "http://symphonia-affretia-prod.eba-jpc3cbes.eu-west-3.elasticbeanstalk.com",
+    "Planning API": "http://rt-planning-api-prod.eba-gbhspa2p.eu-central-1.elasticbeanstalk.com",
+    "Planning Sites API": "http://rt-planning-sites-api-prod.eba-uc2vvehf.eu-central-1.elasticbeanstalk.com",
+    "Appointments API": "http://rt-appointments-api-prod.eba-b5rcxvcw.eu-central-1.elasticbeanstalk.com",
+    "Geo Tracking API": "http://rt-geo-tracking-api-prod.eba-3mi2pcfi.eu-central-1.elasticbeanstalk.com",
+    "Tracking API": "http://rt-tracking-api-prod.eba-mttbqqhw.eu-central-1.elasticbeanstalk.com",
+    "TMS Sync API": "http://rt-tms-sync-api-prod.eba-gpxm3qif.eu-central-1.elasticbeanstalk.com",
+    "eCMR API": "http://rt-ecmr-api-prod.eba-43ngua6v.eu-central-1.elasticbeanstalk.com",
+    "eCMR Signature API": "http://rt-ecmr-signature-api-prod.eba-4pgwbyaj.eu-central-1.elasticbeanstalk.com",
+    "Documents API": "http://rt-documents-api-prod.eba-xscabiv8.eu-central-1.elasticbeanstalk.com",
+    "Palettes API": "http://rt-palettes-circular-prod.eba-mqjpbjmp.eu-central-1.elasticbeanstalk.com",
+    "Palettes Circular API": "http://rt-palettes-circular-prod.eba-mqjpbjmp.eu-central-1.elasticbeanstalk.com",
+    "Storage Market API": "http://rt-storage-market-prod.eba-6dcj6yvh.eu-central-1.elasticbeanstalk.com",
+    "Affret IA API": "http://rt-affret-ia-api-prod-v4.eba-quc9udpr.eu-central-1.elasticbeanstalk.com",
+    "Scoring API": "http://rt-scoring-api-prod.eba-ygb5kqyw.eu-central-1.elasticbeanstalk.com",
+    "Vigilance API": "http://rt-vigilance-api-prod.eba-kmvyig6m.eu-central-1.elasticbeanstalk.com",
+    "Billing API": "http://rt-billing-api-prod.eba-jg9uugnp.eu-central-1.elasticbeanstalk.com",
+    "Subscriptions API": "http://symphonia-api-services-383580834.eu-central-1.elb.amazonaws.com",
+    "Subscriptions Pricing API": "http://rt-subscriptions-pricing-prod.eba-gez7xm2e.eu-central-1.elasticbeanstalk.com",
+    "Notifications API": "http://rt-notifications-api-prod.eba-usjgee8u.eu-central-1.elasticbeanstalk.com",
+    "WebSocket API": "http://rt-websocket-api-prod.eba-nedjyqk3.eu-central-1.elasticbeanstalk.com",
+    "Chatbot API": "http://rt-chatbot-api-prod.eba-ecrbeupx.eu-central-1.elasticbeanstalk.com",
+    "KPI API": "http://rt-kpi-api-prod.eba-sfwqzd4j.eu-central-1.elasticbeanstalk.com",
+    "Training API": "http://rt-training-api-prod.eba-2gaunbjs.eu-central-1.elasticbeanstalk.com",
+    "Sales Agents API": "http://rt-sales-agents-api-prod.eba-kyimfqkb.eu-central-1.elasticbeanstalk.com",
+    "Supplier Space API": "http://rt-supplier-space-prod.eba-ka46t2mz.eu-central-1.elasticbeanstalk.com",
+    "Recipient Space API": "http://rt-recipient-space-prod.eba-xir23y3r.eu-central-1.elasticbeanstalk.com",
+    "Subscription Invoicing API": "http://rt-subscription-invoicing-prod.eba-6xh2kk2r.eu-central-1.elasticbeanstalk.com",
+}
+ORIGIN_REPORT_FILE = "origin-comparison.json"
+COMPRESSION_REPORT_FILE = "compression-audit.json"
+
+# Probe engine settings
+REQUEST_TIMEOUT = 10.0   # seconds per request (same budget as the former curl -m 10)
+SWEEP_DEADLINE = 20.0    # seconds for a whole sweep, whatever the number of services
+PER_HOST_LIMIT = 4       # concurrent requests per host
+POOL_IDLE_PER_HOST = 4   # idle keep-alive connections kept per host
+USER_AGENT = "rt-monitor/2.0"
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")  # safe to resend on a stale connection
+
+# Latency phases recorded for every probe (milliseconds, except bytes)
+TIMING_PHASES = ["dns_ms", "connect_ms", "tls_ms", "ttfb_ms", "total_ms"]
+
+# Service dependency graph: a service is only probed while everything it depends on is up.
+# "MongoDB" is the shared Atlas cluster, observed through the sentinel's /health payload;
+# its dependents are the services whose /health reports a mongodb status. Services that
+# only verify JWTs locally do not depend on the Auth API; Affret IA calls it server-side.
+# The sentinel itself depends on nothing, or an open MongoDB breaker could never close.
+MONGODB_SENTINEL = "Auth API"
+MONGODB_SERVICES = [
+    "Authz API", "Orders API", "TMS Sync API", "Geo Tracking API", "Tracking API", "Palettes API",
+    "Vigilance API", "Storage Market API", "Subscriptions API", "Notifications API", "Chatbot API",
+    "Training API", "Subscription Invoicing API",
+]
+DEPENDENCIES = {name: ["MongoDB"] for name in MONGODB_SERVICES}
+DEPENDENCIES["Affret IA API"] = ["Auth API"]
+DEPENDENCIES[MONGODB_SENTINEL] = []
+
+# Circuit breakers
+BREAKER_FAILURES = 3           # consecutive failed probes that open a breaker
+BREAKER_COOLDOWN = 30.0        # seconds before an open breaker allows a half-open trial
+BREAKER_MAX_COOLDOWN = 300.0   # cap of the cooldown, doubled after each failed trial
+
+# Daemon mode settings
+DAEMON_INTERVAL = 30.0   # seconds between sweep starts
+DAEMON_JITTER = 0.2      # +/- fraction applied to each interval
+REPORT_FILE = "monitor-report.json"
+
+# Adaptive scheduling (daemon --adaptive)
+ADAPTIVE_MIN_INTERVAL = 5.0    # seconds between probes of a failing service
+ADAPTIVE_MAX_INTERVAL = 300.0  # seconds between probes of a long-stable service
+ADAPTIVE_BACKOFF = 1.5         # interval growth factor after each normal probe
+ADAPTIVE_DRIFT_FACTOR = 1.5    # latency above this x EWMA baseline counts as drift
+ADAPTIVE_RPS_BUDGET = 2.0      # fleet-wide probe budget, requests per second
+
+# Live terminal view (daemon --live)
+LIVE_WINDOW = 40     # samples per row, i.e. sparkline width
+LIVE_REFRESH = 1.0   # seconds between redraws
+SPARK_CHARS = "\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588"
+
+# OpenMetrics exporter (daemon --metrics-port)
+METRICS_PORT = 9464
+
+# Post-deploy regression detection (latency before vs after a /health version change)
+REGRESSION_WINDOW = 120          # samples compared on each side of the change (1h at 30s)
+REGRESSION_MIN_SAMPLES = 20      # fewer samples of the old version: nothing to compare
+REGRESSION_ALPHA = 0.05
+REGRESSION_MIN_INCREASE = 0.10   # significant p95 increases below 10% are not reported
+REGRESSION_BOOTSTRAP = 1000      # bootstrap resamples of the p95 difference
+REGRESSION_REPORT_FILE = "regression-report.json"
+
+# Seasonal anomaly detection (baseline per series and hour of week, log latency)
+ANOMALY_ALPHA = 0.02              # baseline EWMA weight of one probe (~1 week of a slot at 30s)
+ANOMALY_SHORT_ALPHA = 0.3         # EWMA weight of the latest latency residuals
+ANOMALY_ERROR_ALPHA = 0.1         # same for errors, slower as each probe is only 0 or 1
+ANOMALY_K = 4.0                   # band half-width in standard deviations
+ANOMALY_MIN_SAMPLES = 30          # samples before a slot (or series) baseline is trusted
+ANOMALY_CONSECUTIVE = 3           # probes outside/inside the band to raise/clear
+ANOMALY_MIN_DELTA_MS = 50         # latency shifts smaller than this are never anomalies
+ANOMALY_MIN_SIGMA = 0.05          # floor of the log-latency spread (5%)
+ANOMALY_ERROR_FLOOR = 0.01        # assumed minimum error rate of a clean baseline
+ANOMALY_MIN_ERROR_RATE = 0.2
+ANOMALY_REPORT_FILE = "anomaly-report.json"
+
+# History store settings
+STORE_FILE = "monitor-history.db"
+RAW_RETENTION_DAYS = 7
+ROLLUP_RESOLUTIONS = [(60, 30), (3600, 400), (86400, 800)]  # (bucket seconds, retention days)
+# Upper bounds (ms) of the latency histogram buckets; a final overflow bucket follows
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 75, 100, 150, 250, 400, 600, 1000, 1500, 2500, 4000, 6000, 10000]
+
+# Service level objectives over a rolling SLO_PERIOD_DAYS, measured on the /health probes.
+# availability: % of probes without error; latency: % of successful probes answering
+# within latency_ms, which must be one of LATENCY_BUCKETS_MS.
+SLO_PERIOD_DAYS = 30
+SLO_DEFAULT = {"availability": 99.5, "latency_ms": 1000, "latency": 99.0}
+SLO_OVERRIDES = {
+    "Auth API": {"availability": 99.9, "latency_ms": 600},
+    "Authz API": {"availability": 99.9, "latency_ms": 600},
+    "Orders API": {"availability": 99.9},
+    "WebSocket API": {"availability": 99.9},
+    "Chatbot API": {"availability": 99.0, "latency_ms": 2500},
+    "Training API": {"availability": 99.0},
+}
+SLO_WINDOWS = [("5m", 300), ("30m", 1800), ("1h", 3600), ("2h", 7200), ("6h", 21600), ("1d", 86400),
+               ("3d", 259200)]
+# Multi-window burn-rate alerts: (severity, long window, short window, burn rate)
+BURN_RATE_ALERTS = [
+    ("page", "1h", "5m", 14.4),
+    ("page", "6h", "30m", 6.0),
+    ("ticket", "1d", "2h", 3.0),
+    ("ticket", "3d", "6h", 1.0),
+]
+SLO_REPORT_FILE = "slo-report.json"
+
+# Deep probes: real read endpoints per service, each with a p95 latency budget (ms).
+# "auth" probes send the demo account token as a Bearer header.
+PROBE_CATALOGUE = {
+    "Orders API": [
+        {"path": "/api/v1/orders?limit=20", "p95_ms": 1200, "auth": True},
+        {"path": "/api/v1/orders/templates", "p95_ms": 800, "auth": True},
+    ],
+    "TMS Sync API": [
+        {"path": "/api/v1/tms/carriers?limit=20", "p95_ms": 1500, "auth": True},
+        {"path": "/api/v1/datalake/status", "p95_ms": 800, "auth": True},
+    ],
+    "Affret IA API": [
+        {"path": "/api/v1/affret-ia/assignments?limit=20", "p95_ms": 1200, "auth": True},
+    ],
+    "KPI API": [
+        {"path": "/kpi/dashboard", "p95_ms": 1500, "auth": True},
+    ],
+    "Billing API": [
+        {"path": "/api/billing/prefacturations?limit=20", "p95_ms": 1500, "auth": True},
+    ],
+    "Documents API": [
+        {"path": "/api/v1/documents/search?q=cmr", "p95_ms": 1200, "auth": True},
+    ],
+    "Scoring API": [
+        {"path": "/api/v1/scoring/leaderboard", "p95_ms": 1000, "auth": True},
+    ],
+    "Geo Tracking API": [
+        {"path": "/api/tracking", "p95_ms": 800, "auth": True},
+    ],
+}
+DEEP_WINDOW = 20  # recent samples per endpoint used for the p95 budget check
+
+# WebSocket round-trip probe (Socket.IO v4 over the WebSocket transport)
+WS_PINGS = 20    # acknowledged heartbeat events per probe
+WS_RTT_P95_MS = 250
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+AUTH_URL = SERVICES["Auth API"]
+DEMO_CREDENTIALS = {"email": "demo@agrofrance.fr", "password": "Demo2024!"}
+TOKEN_REFRESH_MARGIN = 600.0  # renew the shared JWT this many seconds before it expires
+SESSION_MAX_AGE = 3600.0      # ...and at least this often, to keep exercising the login path
+LOGIN_RETRY_DELAY = 60.0      # wait after a failed login before trying again
+
+
+class ProbeError(Exception):
+    """Raised when an HTTP exchange cannot be completed"""
+
+
+class HttpResponse:
+    """Status, lower-cased headers, raw body and phase timings of an HTTP response"""
+
+    def __init__(self, status, headers, body, timings=None):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.timings = timings
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class _Connection:
+    """A pooled HTTP/1.1 connection"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def is_usable(self):
+        return not self.writer.is_closing() and not self.reader.at_eof()
+
+    def close(self):
+        self.writer.close()
+
+
+class HttpClient:
+    """
+    Minimal asyncio HTTP/1.1 client with keep-alive connection pooling
+    and a per-host concurrency limit. Only the standard library is used so the
+    monitor stays runnable on any ops machine.
+    """
+
+    def __init__(self, timeout=REQUEST_TIMEOUT, per_host_limit=PER_HOST_LIMIT,
+                 idle_per_host=POOL_IDLE_PER_HOST):
+        self.timeout = timeout
+        self.per_host_limit = per_host_limit
+        self.idle_per_host = idle_per_host
+        self._idle = {}
+        self._limits = {}
+        self._ssl = ssl.create_default_context()
+
+    async def request(self, method, url, headers=None, body=None, timeout=None):
+        """Send a request and return an HttpResponse (raises on timeout/IO error)"""
+        key, target = self._split(url)
+
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = asyncio.Semaphore(self.per_host_limit)
+
+        async with limit:
+            return await asyncio.wait_for(
+                self._exchange(key, method, target, headers or {}, body),
+                timeout or self.timeout
+            )
+
+    async def upgrade(self, url, headers=None, timeout=None):
+        """
+        Open a dedicated connection (never pooled) and send a GET with
+        "Connection: Upgrade" and `headers` on it. Returns (connection, HttpResponse
+        with status, headers and timings but no body); the connection, with its
+        reader and writer, then belongs to the caller, who must close it.
+        """
+        key, target = self._split(url)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        timings = {"dns_ms": 0.0, "connect_ms": 0.0, "tls_ms": 0.0, "ttfb_ms": None,
+                   "total_ms": None, "bytes": 0, "reused": False}
+        conn = None
+        try:
+            conn = await asyncio.wait_for(self._open(key, timings), timeout or self.timeout)
+            conn.writer.write(self._head(key, "GET", target, headers or {}, connection="Upgrade"))
+            await conn.writer.drain()
+            status, _, response_headers, received = await asyncio.wait_for(
+                self._read_head(conn.reader, timings), timeout or self.timeout)
+        except BaseException:
+            if conn:
+                conn.close()
+            raise
+        timings["bytes"] = received
+        timings["total_ms"] = _elapsed_ms(loop, started)
+        return conn, HttpResponse(status, response_headers, b"", timings)
+
+    async def close(self):
+        """Close every idle connection"""
+        for connections in self._idle.values():
+            for conn in connections:
+                conn.close()
+        self._idle.clear()
+
+    async def _exchange(self, key, method, target, headers, body):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        # Phases skipped on a reused keep-alive connection stay at 0
+        timings = {"dns_ms": 0.0, "connect_ms": 0.0, "tls_ms": 0.0, "ttfb_ms": None,
+                   "total_ms": None, "bytes": 0, "reused": True}
+
+        conn = self._checkout(key)
+        retry = conn is not None and method.upper() in IDEMPOTENT_METHODS
+        while True:
+            if conn is None:
+                conn = await self._open(key, timings)
+            try:
+                response, keep_alive = await self._send(conn, key, method, target, headers, body, timings)
+                break
+            except (ProbeError, ConnectionError):
+                conn.close()
+                if not retry or timings["ttfb_ms"] is not None:
+                    raise
+                # The server dropped an idle keep-alive connection before answering:
+                # retry once on a fresh one (never for POST, it may have been processed)
+                retry, conn = False, None
+            except BaseException:
+                conn.close()
+                raise
+
+        timings["total_ms"] = _elapsed_ms(loop, started)
+        response.timings = timings
+        if keep_alive:
+            self._checkin(key, conn)
+        else:
+            conn.close()
+        return response
+
+    @staticmethod
+    def _split(url):
+        """Pool key (scheme, host, port) and request target of a URL"""
+        parts = urlsplit(url)
+        secure = parts.scheme == "https"
+        key = (parts.scheme, parts.hostname, parts.port or (443 if secure else 80))
+        return key, (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+    def _checkout(self, key):
+        connections = self._idle.get(key)
+        while connections:
+            conn = connections.pop()
+            if conn.is_usable():
+                return conn
+            conn.close()
+        return None
+
+    def _checkin(self, key, conn):
+        connections = self._idle.setdefault(key, [])
+        if len(connections) < self.idle_per_host:
+            connections.append(conn)
+        else:
+            conn.close()
+
+    async def _open(self, key, timings):
+        scheme, host, port = key
+        loop = asyncio.get_running_loop()
+        timings["reused"] = False
+
+        started = loop.time()
+        addresses = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        timings["dns_ms"] = _elapsed_ms(loop, started)
+
+        started = loop.time()
+        last_error = None
+        for family, _, _, _, address in addresses:
+            try:
+                reader, writer = await asyncio.open_connection(address[0], address[1], family=family)
+                break
+            except OSError as e:
+                last_error = e
+        else:
+            raise last_error or ProbeError(f"No address for {host}")
+        timings["connect_ms"] = _elapsed_ms(loop, started)
+
+        if scheme == "https":
+            started = loop.time()
+            try:
+                await writer.start_tls(self._ssl, server_hostname=host)
+            except BaseException:
+                writer.close()
+                raise
+            timings["tls_ms"] = _elapsed_ms(loop, started)
+        return _Connection(reader, writer)
+
+    @staticmethod
+    def _head(key, method, target, headers, body=None, connection="keep-alive"):
+        scheme, host, port = key
+        default_port = 443 if scheme == "https" else 80
+        lines = [
+            f"{method} {target} HTTP/1.1",
+            f"Host: {host}" if port == default_port else f"Host: {host}:{port}",
+            f"User-Agent: {USER_AGENT}",
+            "Accept: */*",
+            f"Connection: {connection}",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send(self, conn, key, method, target, headers, body, timings):
+        conn.writer.write(self._head(key, method, target, headers, body) + (body or b""))
+        await conn.writer.drain()
+        return await self._read_response(conn.reader, method, timings)
+
+    async def _read_head(self, reader, timings):
+        """Status line and headers: (status, version, lower-cased headers, bytes read)"""
+        loop = asyncio.get_running_loop()
+        sent = loop.time()
+        status_line = await reader.readline()
+        if not status_line:
+            raise ProbeError("Connection closed before response")
+        timings["ttfb_ms"] = _elapsed_ms(loop, sent)
+        received = len(status_line)
+        try:
+            version, status = status_line.decode("latin-1").split(None, 2)[:2]
+            status = int(status)
+        except ValueError:
+            raise ProbeError(f"Malformed status line: {status_line[:50]!r}")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            received += len(line)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return status, version, headers, received
+
+    async def _read_response(self, reader, method, timings):
+        status, version, headers, received = await self._read_head(reader, timings)
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            body = b""
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            body = await self._read_chunked(reader)
+        elif "content-length" in headers:
+            try:
+                length = int(headers["content-length"])
+            except ValueError:
+                length = -1
+            if length < 0:
+                raise ProbeError(f"Malformed Content-Length: {headers['content-length'][:50]!r}")
+            body = await reader.readexactly(length)
+        else:
+            body = await reader.read()
+            keep_alive = False
+
+        timings["bytes"] = received + len(body)
+        return HttpResponse(status, headers, body), keep_alive
+
+    async def _read_chunked(self, reader):
+        chunks = []
+        while True:
+            size_line = await reader.readline()
+            try:
+                size = int(size_line.split(b";")[0].strip(), 16)
+            except ValueError:
+                raise ProbeError("Malformed chunked encoding")
+            if size == 0:
+                # Skip trailers up to the final blank line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+
+def _elapsed_ms(loop, started):
+    return round((loop.time() - started) * 1000, 2)
+
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of a list of numbers (None when empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize_latency(samples):
+    """Per-phase min/p50/p95/max over a list of probe timings dicts"""
+    summary = {}
+    for phase in TIMING_PHASES + ["bytes"]:
+        values = [t[phase] for t in samples if t and t.get(phase) is not None]
+        if values:
+            summary[phase] = {
+                "min": min(values),
+                "p50": round(percentile(values, 50), 2),
+                "p95": round(percentile(values, 95), 2),
+                "max": max(values)
+            }
+    return summary
+
+
+def latency_histogram(values):
+    """Counts of values per LATENCY_BUCKETS_MS bucket (last entry is the overflow bucket)"""
+    counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    for value in values:
+        counts[bisect.bisect_left(LATENCY_BUCKETS_MS, value)] += 1
+    return counts
+
+
+def histogram_percentile(counts, pct):
+    """Percentile estimated from bucket counts, interpolating inside the bucket"""
+    total = sum(counts)
+    if not total:
+        return None
+    target = total * pct / 100.0
+    seen = 0
+    for index, count in enumerate(counts):
+        if count and seen + count >= target:
+            low = LATENCY_BUCKETS_MS[index - 1] if index else 0.0
+            high = LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else low * 2
+            return round(low + (high - low) * (target - seen) / count, 2)
+        seen += count
+    return float(LATENCY_BUCKETS_MS[-1])
+
+
+MONGODB_UP_STATUSES = ("connected", "ok", "healthy", "active", "up", "ready")
+
+
+def mongodb_up(mongodb):
+    """Whether a /health mongodb status ("connected", "active", ...) means the database is reachable"""
+    return str(mongodb).strip().lower() in MONGODB_UP_STATUSES
+
+
+def _result(name, url, healthy, status, version="N/A", mongodb="N/A",
+            timings=None, error=None):
+    return {
+        "name": name,
+        "url": url,
+        "healthy": healthy,
+        "status": status,
+        "version": version,
+        "mongodb": mongodb,
+        "response_time": timings["total_ms"] if timings else None,
+        "timings": timings,
+        "error": error,
+        "checked_at": round(time.time(), 3)
+    }
+
+
+async def check_service(client, name, url):
     """Check health of a single service"""
     health_url = f"{url}/health"
     try:
-        result = subprocess.run(
-            ["curl", "-s", "--ssl-no-revoke", "-m", "10", health_url],
-            capture_output=True,
-            text=True,
-            timeout=15
-        )
+        response = await client.request("GET", health_url)
+    except asyncio.TimeoutError:
+        return _result(name, url, False, "timeout",
+                       error=f"No response within {client.timeout:.0f}s")
+    except (OSError, ProbeError, asyncio.IncompleteReadError) as e:
+        return _result(name, url, False, "error", error=str(e)[:100] or type(e).__name__)
 
-        if result.returncode == 0 and result.stdout:
-            try:
-                data = json.loads(result.stdout)
-                status = data.get("status", "unknown")
-                version = data.get("version", "N/A")
-
-                # Handle mongodb field (can be string or object)
-                mongodb_field = data.get("mongodb", "N/A")
-                if isinstance(mongodb_field, dict):
-                    mongodb = mongodb_field.get("status", "N/A")
-                elif isinstance(mongodb_field, str):
-                    mongodb = mongodb_field
-                else:
-                    mongodb = "N/A"
-
-                return {
-                    "name": name,
-                    "url": url,
-                    "healthy": status in ["healthy", "ok"],
-                    "status": status,
-                    "version": version,
-                    "mongodb": mongodb,
-                    "response_time": "OK",
-                    "error": None
-                }
-            except json.JSONDecodeError:
-                # Not JSON but got a response
-                return {
-                    "name": name,
-                    "url": url,
-                    "healthy": True,
-                    "status": "responding",
-                    "version": "N/A",
-                    "mongodb": "N/A",
-                    "response_time": "OK",
-                    "error": None
-                }
-        else:
-            return {
-                "name": name,
-                "url": url,
-                "healthy": False,
-                "status": "error",
-                "version": "N/A",
-                "mongodb": "N/A",
-                "response_time": "TIMEOUT",
-                "error": result.stderr[:100] if result.stderr else "No response"
-            }
+    timings = response.timings
+    if not response.body:
+        return _result(name, url, False, "error", timings=timings,
+                       error=f"Empty response (HTTP {response.status})")
+
+    try:
+        data = response.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        # Not JSON but got a response
+        return _result(name, url, True, "responding", timings=timings)
+    if not isinstance(data, dict):
+        return _result(name, url, True, "responding", timings=timings)
+
+    status = data.get("status", "unknown")
+    version = data.get("version", "N/A")
+
+    # Handle mongodb field (can be string or object)
+    mongodb_field = data.get("mongodb", "N/A")
+    if isinstance(mongodb_field, dict):
+        mongodb = mongodb_field.get("status", "N/A")
+        if mongodb == "N/A" and isinstance(mongodb_field.get("connected"), bool):
+            mongodb = "connected" if mongodb_field["connected"] else "disconnected"
+    elif isinstance(mongodb_field, str):
+        mongodb = mongodb_field
+    else:
+        mongodb = "N/A"
+
+    return _result(name, url, status in ["healthy", "ok"], status, version, mongodb, timings)
+
+
+class CircuitBreakers:
+    """
+    Per-service circuit breakers over the DEPENDENCIES graph. A breaker opens after
+    `threshold` consecutive failed probes; while it is open the service fast-fails and
+    every service that depends on it, directly or not, is reported as blocked instead
+    of waiting out its own timeout. Once the cooldown has elapsed a single half-open
+    trial probe is let through: success closes the breaker and restores the dependents,
+    failure re-opens it with a doubled cooldown (capped at max_cooldown).
+    MongoDB has no endpoint of its own: its breaker follows the mongodb field of the
+    sentinel service's /health payload.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, dependencies=None, threshold=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN,
+                 max_cooldown=BREAKER_MAX_COOLDOWN, sentinel=MONGODB_SENTINEL, verbose=False):
+        self.dependencies = DEPENDENCIES if dependencies is None else dependencies
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.sentinel = sentinel
+        self.verbose = verbose
+        self.state = {}
+
+    def _breaker(self, name):
+        breaker = self.state.get(name)
+        if breaker is None:
+            breaker = self.state[name] = {"state": self.CLOSED, "failures": 0, "opened_at": None,
+                                          "cooldown": self.cooldown}
+        return breaker
+
+    def _set(self, name, breaker, state):
+        if breaker["state"] != state and self.verbose:
+            print(f"[breaker] {name}: {breaker['state']} -> {state}", flush=True)
+        breaker["state"] = state
+
+    def blocker(self, name):
+        """Closest dependency of `name` whose breaker is not closed, or None"""
+        queue, seen = deque(self.dependencies.get(name, [])), set()
+        while queue:
+            dependency = queue.popleft()
+            if dependency in seen:
+                continue
+            seen.add(dependency)
+            if self._breaker(dependency)["state"] != self.CLOSED:
+                return dependency
+            queue.extend(self.dependencies.get(dependency, []))
+        return None
+
+    def blocked(self, name):
+        """Why `name` should not be probed right now, or None (does not start a trial)"""
+        dependency = self.blocker(name)
+        if dependency:
+            return f"Blocked by {dependency}"
+        if self._breaker(name)["state"] != self.CLOSED:
+            return "Circuit open"
+        return None
+
+    def gate(self, name, now):
+        """
+        None when a probe of `name` may run now, otherwise the fast-fail reason.
+        An open breaker past its cooldown moves to half-open and lets this probe through.
+        """
+        dependency = self.blocker(name)
+        if dependency:
+            return f"Blocked by {dependency}"
+        breaker = self._breaker(name)
+        if breaker["state"] == self.CLOSED:
+            return None
+        if breaker["state"] == self.OPEN and now - breaker["opened_at"] >= breaker["cooldown"]:
+            self._set(name, breaker, self.HALF_OPEN)
+            return None
+        if breaker["state"] == self.HALF_OPEN:
+            return "Circuit half-open, trial probe in flight"
+        return f"Circuit open, retry in {breaker['cooldown'] - (now - breaker['opened_at']):.0f}s"
+
+    def record(self, result, now):
+        """Update the breaker of a probed service; returns its state"""
+        name = result["name"]
+        if result.get("blocked_by") or result["status"] == "circuit-open":
+            return self._breaker(name)["state"]
+        if name == self.sentinel and result["mongodb"] != "N/A":
+            self._observe("MongoDB", mongodb_up(result["mongodb"]), now)
+        if not result["healthy"] and self.blocker(name):
+            # The failure is the dependency's, not this service's
+            return self._breaker(name)["state"]
+        return self._observe(name, result["healthy"], now)
+
+    def _observe(self, name, ok, now):
+        breaker = self._breaker(name)
+        if ok:
+            if breaker["state"] != self.CLOSED:
+                self._release_dependents(name, now)
+            breaker.update(failures=0, opened_at=None, cooldown=self.cooldown)
+            self._set(name, breaker, self.CLOSED)
+            return breaker["state"]
+
+        breaker["failures"] += 1
+        if breaker["state"] == self.HALF_OPEN:
+            breaker.update(opened_at=now, cooldown=min(self.max_cooldown, breaker["cooldown"] * 2))
+            self._set(name, breaker, self.OPEN)
+        elif breaker["state"] == self.OPEN:
+            breaker["opened_at"] = now
+        elif breaker["failures"] >= self.threshold:
+            breaker["opened_at"] = now
+            self._set(name, breaker, self.OPEN)
+        return breaker["state"]
+
+    def _release_dependents(self, name, now):
+        """A recovered dependency makes the open breakers behind it due for a trial at once"""
+        queue = deque([name])
+        while queue:
+            current = queue.popleft()
+            for dependent, dependencies in self.dependencies.items():
+                breaker = self.state.get(dependent)
+                if current in dependencies and breaker and breaker["state"] == self.OPEN:
+                    breaker["opened_at"] = now - breaker["cooldown"]
+                    queue.append(dependent)
+
+    def snapshot(self):
+        """Breakers that are not closed, for the report"""
+        return {name: {"state": b["state"], "failures": b["failures"], "cooldown_s": b["cooldown"]}
+                for name, b in sorted(self.state.items()) if b["state"] != self.CLOSED}
+
+
+def _blocked_result(name, url, reason, blocker=None):
+    result = _result(name, url, False, "blocked" if blocker else "circuit-open", error=reason)
+    result["blocked_by"] = blocker
+    return result
+
+
+async def sweep(client, services, deadline=SWEEP_DEADLINE, breakers=None):
+    """
+    Probe every service concurrently and yield results as they complete.
+    Services still pending when the global deadline expires are reported as TIMEOUT.
+    With circuit breakers, services behind an open breaker are fast-failed up front,
+    and a breaker opening mid-sweep cancels the dependents still waiting on it.
+    """
+    loop = asyncio.get_running_loop()
+    now = time.monotonic()
+    gated = {name: breakers.gate(name, now) if breakers else None for name in services}
+    tasks = {asyncio.create_task(check_service(client, name, url)): (name, url)
+             for name, url in services.items() if gated[name] is None}
+    pending = set(tasks)
+    end = loop.time() + deadline
+    try:
+        for name, reason in gated.items():
+            if reason:
+                yield _blocked_result(name, services[name], reason, breakers.blocker(name))
+
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, end - loop.time()),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            opened = False
+            for task in done:
+                result = task.result()
+                if breakers and breakers.record(result, time.monotonic()) != CircuitBreakers.CLOSED:
+                    opened = True
+                yield result
+            for task in [t for t in pending if opened and breakers.blocker(tasks[t][0])]:
+                task.cancel()
+                pending.discard(task)
+                name, url = tasks[task]
+                blocker = breakers.blocker(name)
+                yield _blocked_result(name, url, f"Blocked by {blocker}", blocker)
+        for task in pending:
+            task.cancel()
+            name, url = tasks[task]
+            yield _result(name, url, False, "timeout",
+                          error=f"Sweep deadline of {deadline:.0f}s exceeded")
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _endpoint_result(service, path, url, healthy, status, timings=None, error=None):
+    result = _result(f"{service} {path}", url, healthy, status, timings=timings, error=error)
+    result["service"] = service
+    result["endpoint"] = path
+    return result
+
+
+async def check_endpoint(client, service, probe, token=None):
+    """Run one deep probe from PROBE_CATALOGUE"""
+    path = probe["path"]
+    url = f"{SERVICES[service]}{path}"
+    if probe.get("auth") and not token:
+        result = _endpoint_result(service, path, url, False, "skipped", error="No auth token")
+        result["blocked_by"] = "Auth API"   # a failed login, not a fault of this endpoint
+        return result
+
+    headers = {"Authorization": f"Bearer {token}"} if probe.get("auth") else {}
+    try:
+        response = await client.request("GET", url, headers=headers)
+    except asyncio.TimeoutError:
+        return _endpoint_result(service, path, url, False, "timeout",
+                                error=f"No response within {client.timeout:.0f}s")
+    except (OSError, ProbeError, asyncio.IncompleteReadError) as e:
+        return _endpoint_result(service, path, url, False, "error", error=str(e)[:100] or type(e).__name__)
+
+    ok = 200 <= response.status < 400
+    return _endpoint_result(service, path, url, ok, response.status, response.timings,
+                            None if ok else f"HTTP {response.status}")
+
+
+async def deep_probes(client, session, catalogue=None, breakers=None):
+    """Run every catalogued endpoint probe concurrently, yielding results as they complete"""
+    catalogue = PROBE_CATALOGUE if catalogue is None else catalogue
+    blocked = {service: breakers.blocked(service) if breakers else None for service in catalogue}
+    for service, probes in catalogue.items():
+        for probe in probes if blocked[service] else []:
+            result = _endpoint_result(service, probe["path"], f"{SERVICES[service]}{probe['path']}", False,
+                                      "blocked", error=blocked[service])
+            result["blocked_by"] = breakers.blocker(service) or service
+            yield result
+    if all(blocked.values()):
+        return
+
+    token = await session.token()
+    tasks = [check_endpoint(client, service, probe, token)
+             for service, probes in catalogue.items() if service in SERVICES and not blocked[service]
+             for probe in probes]
+    for task in asyncio.as_completed(tasks):
+        result = await task
+        if result["status"] == 401:
+            session.invalidate()
+        yield result
+
+
+async def login(client, auth_url=None):
+    """Log in with the demo account. Returns (test result, JWT or None, timings or None)"""
+    try:
+        response = await client.request(
+            "POST", f"{auth_url or AUTH_URL}/api/auth/login",
+            headers={"Content-Type": "application/json"},
+            body=json.dumps(DEMO_CREDENTIALS).encode()
+        )
+        if not response.body:
+            return {"success": False, "message": "No response"}, None, response.timings
+        data = response.json()
+        if data.get("token"):
+            return ({"success": True, "message": "Login OK", "user": data.get("user", {}).get("email")},
+                    data["token"], response.timings)
+        return {"success": False, "message": data.get("message", "No token")}, None, response.timings
+    except asyncio.TimeoutError:
+        return {"success": False, "message": "Timeout"}, None, None
     except Exception as e:
+        return {"success": False, "message": str(e)[:50]}, None, None
+
+
+def jwt_expiry(token):
+    """Expiry (epoch seconds) from the JWT payload, without verifying the signature"""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class SessionCache:
+    """
+    One demo-account JWT shared by every authenticated probe. Concurrent callers
+    wait on the same login instead of each posting credentials; the token is
+    renewed TOKEN_REFRESH_MARGIN before its `exp` claim, and at least every
+    SESSION_MAX_AGE so a broken login still surfaces. Each login is emitted to the
+    sinks as an "Auth API /api/auth/login" probe, which gives login latency its own series.
+    """
+
+    def __init__(self, client, sinks=None, refresh_margin=TOKEN_REFRESH_MARGIN, max_age=SESSION_MAX_AGE,
+                 auth_url=None):
+        self.client = client
+        self.auth_url = auth_url or AUTH_URL
+        self.sinks = sinks if sinks is not None else []
+        self.refresh_margin = refresh_margin
+        self.max_age = max_age
+        self.last_login = {"success": False, "message": "Not run yet"}
+        self.logins = 0
+        self.failures = 0
+        self.login_ms = deque(maxlen=100)
+        self._token = None
+        self._renew_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def token(self):
+        """Current JWT (None when the login fails), logging in again only when due"""
+        if time.time() < self._renew_at:
+            return self._token
+        async with self._lock:
+            # Another worker may have logged in while we waited for the lock
+            if time.time() >= self._renew_at:
+                await self._login()
+            return self._token
+
+    def invalidate(self):
+        """Force a new login on next use, e.g. after a 401"""
+        self._renew_at = 0.0
+
+    async def _login(self):
+        result, token, timings = await login(self.client, self.auth_url)
+        now = time.time()
+        self.logins += 1
+        if timings and timings.get("total_ms") is not None:
+            self.login_ms.append(timings["total_ms"])
+            result["login_ms"] = timings["total_ms"]
+        self.last_login = result
+
+        if token:
+            expires = jwt_expiry(token) or now + self.max_age
+            self._token = token
+            self._renew_at = min(expires - self.refresh_margin, now + self.max_age)
+        else:
+            self.failures += 1
+            self._token = None
+            # Do not hammer the Auth API while it is refusing logins
+            self._renew_at = now + LOGIN_RETRY_DELAY
+
+        probe = _endpoint_result("Auth API", "/api/auth/login", f"{self.auth_url}/api/auth/login",
+                                 bool(token), "ok" if token else "error", timings,
+                                 None if token else result["message"])
+        for sink in self.sinks:
+            sink(probe)
+
+    def stats(self):
         return {
-            "name": name,
-            "url": url,
-            "healthy": False,
-            "status": "error",
-            "version": "N/A",
-            "mongodb": "N/A",
-            "response_time": "ERROR",
-            "error": str(e)[:100]
+            "logins": self.logins,
+            "failures": self.failures,
+            "login_p50_ms": percentile(list(self.login_ms), 50),
+            "login_p95_ms": percentile(list(self.login_ms), 95),
+            "token_valid_for_s": round(self._renew_at - time.time()) if self._token else None
         }
 
-def test_login():
-    """Test login functionality"""
+
+def _ws_frame(opcode, payload):
+    """Client WebSocket frame (clients must mask their payload)"""
+    header = bytearray([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header.append(0x80 | length)
+    elif length < 65536:
+        header += bytes([0x80 | 126]) + length.to_bytes(2, "big")
+    else:
+        header += bytes([0x80 | 127]) + length.to_bytes(8, "big")
+    mask = os.urandom(4)
+    return bytes(header) + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+async def _ws_recv(reader, writer):
+    """Next text message; answers control frames on the way"""
+    message = b""
+    while True:
+        head = await reader.readexactly(2)
+        opcode, length = head[0] & 0x0F, head[1] & 0x7F
+        if length == 126:
+            length = int.from_bytes(await reader.readexactly(2), "big")
+        elif length == 127:
+            length = int.from_bytes(await reader.readexactly(8), "big")
+        payload = await reader.readexactly(length)
+        if opcode == 0x8:
+            raise ProbeError("WebSocket closed by server")
+        if opcode == 0x9:
+            writer.write(_ws_frame(0xA, payload))
+            continue
+        if opcode == 0xA:
+            continue
+        message += payload
+        if head[0] & 0x80:
+            return message.decode()
+
+
+async def _sio_recv(reader, writer):
+    """Next Socket.IO packet, replying to engine.io heartbeats ("2" -> "3")"""
+    while True:
+        packet = await _ws_recv(reader, writer)
+        if packet == "2":
+            writer.write(_ws_frame(0x1, b"3"))
+            continue
+        return packet
+
+
+async def websocket_probe(client, base_url, token, pings=WS_PINGS):
+    """
+    Open a Socket.IO session on the WebSocket API the way the planning and tracking
+    UIs do (WebSocket transport, JWT in the connect packet), then time a burst of
+    acknowledged heartbeat events.
+    """
+    path = "/socket.io/?EIO=4&transport=websocket"
+    name = "WebSocket API"
+    if not token:
+        result = _endpoint_result(name, "/socket.io", base_url + path, False, "skipped", error="No auth token")
+        result["websocket"] = {}
+        return result
+
+    loop = asyncio.get_running_loop()
+    timings = None
+    details = {}
+    started = loop.time()
+    conn = None
     try:
-        # Create a temp file with JSON payload
-        payload = '{"email":"demo@agrofrance.fr","password":"Demo2024!"}'
-        result = subprocess.run(
-            ["curl", "-s", "--ssl-no-revoke", "-m", "10",
-             "-X", "POST",
-             "-H", "Content-Type: application/json",
-             "-d", payload,
-             "https://d2swp5s4jfg8ri.cloudfront.net/api/auth/login"],
-            capture_output=True,
-            text=True,
-            timeout=15
+        ws_key = base64.b64encode(os.urandom(16)).decode()
+        conn, response = await client.upgrade(base_url + path, {"Upgrade": "websocket", "Sec-WebSocket-Key": ws_key,
+                                                                "Sec-WebSocket-Version": "13"})
+        upgraded = loop.time()
+        reader, writer = conn.reader, conn.writer
+        timings = response.timings
+        expected = base64.b64encode(hashlib.sha1((ws_key + WS_GUID).encode()).digest()).decode()
+        if response.status != 101 or response.headers.get("sec-websocket-accept") != expected:
+            raise ProbeError(f"Upgrade refused: HTTP {response.status}")
+
+        # engine.io open packet, then Socket.IO connect with the JWT
+        open_packet = await asyncio.wait_for(_sio_recv(reader, writer), client.timeout)
+        if not open_packet.startswith("0"):
+            raise ProbeError(f"Unexpected engine.io packet: {open_packet[:40]}")
+        details["handshake_ms"] = round(timings["ttfb_ms"] + _elapsed_ms(loop, upgraded), 2)
+        auth_started = loop.time()
+        writer.write(_ws_frame(0x1, ("40" + json.dumps({"token": token})).encode()))
+        while True:
+            packet = await asyncio.wait_for(_sio_recv(reader, writer), client.timeout)
+            if packet.startswith("44"):
+                raise ProbeError(f"Socket.IO auth refused: {packet[2:80]}")
+            if packet.startswith("40"):
+                break
+        details["auth_ms"] = _elapsed_ms(loop, auth_started)
+        timings["total_ms"] = _elapsed_ms(loop, started)
+
+        # Acknowledged heartbeat events: 42<id>["heartbeat",{}] -> 43<id>[...]
+        rtts = []
+        for ack_id in range(pings):
+            ping_started = loop.time()
+            writer.write(_ws_frame(0x1, f'42{ack_id}["heartbeat",{{}}]'.encode()))
+            while not (await asyncio.wait_for(_sio_recv(reader, writer), client.timeout)).startswith(f"43{ack_id}["):
+                pass
+            rtts.append(_elapsed_ms(loop, ping_started))
+        details["pings"] = len(rtts)
+        for pct in (50, 95, 99):
+            value = percentile(rtts, pct)
+            details[f"rtt_p{pct}_ms"] = round(value, 2) if value is not None else None
+        details["rtt_max_ms"] = max(rtts) if rtts else None
+        writer.write(_ws_frame(0x8, b"\x03\xe8"))
+        result = _endpoint_result(name, "/socket.io", base_url + path, True, "connected", timings)
+    except asyncio.TimeoutError:
+        result = _endpoint_result(name, "/socket.io", base_url + path, False, "timeout",
+                                  error=f"No response within {client.timeout:.0f}s")
+    except (OSError, ProbeError, asyncio.IncompleteReadError, UnicodeDecodeError) as e:
+        result = _endpoint_result(name, "/socket.io", base_url + path, False, "error",
+                                  timings if "auth_ms" in details else None, str(e)[:100] or type(e).__name__)
+    finally:
+        if conn:
+            conn.close()
+
+    result["websocket"] = details
+    return result
+
+
+def print_websocket_result(result):
+    ws = result.get("websocket", {})
+    if not result["healthy"]:
+        print(f"  [FAIL] {result['name']:25} {result['error']}")
+        return
+    icon = "[OK]" if ws["rtt_p95_ms"] is not None and ws["rtt_p95_ms"] <= WS_RTT_P95_MS else "[SLOW]"
+    print(f"  {icon:6} {result['name']:25} handshake {_format_ms(ws['handshake_ms'])}  "
+          f"auth {_format_ms(ws['auth_ms'])}  RTT p50 {_format_ms(ws['rtt_p50_ms'])}  "
+          f"p95 {_format_ms(ws['rtt_p95_ms'])}  p99 {_format_ms(ws['rtt_p99_ms'])} ({ws['pings']} pings)")
+
+
+class SloTracker:
+    """
+    Keeps the last DEEP_WINDOW latencies of every catalogued endpoint and reports
+    the endpoints whose p95 exceeds their budget or that failed recently. Used as a
+    sink, so it sees deep probe results as they stream in.
+    """
+
+    def __init__(self, catalogue=None, window=DEEP_WINDOW):
+        self.catalogue = PROBE_CATALOGUE if catalogue is None else catalogue
+        self.samples = {(service, probe["path"]): deque(maxlen=window)
+                        for service, probes in self.catalogue.items() for probe in probes}
+        self.blocked = {}  # service -> what blocked its last deep probe
+
+    def __call__(self, result):
+        key = (result.get("service"), result.get("endpoint"))
+        if key not in self.samples:
+            return
+        if result.get("blocked_by"):
+            self.blocked[key[0]] = result["blocked_by"]
+            return
+        self.blocked.pop(key[0], None)
+        self.samples[key].append(result["response_time"] if result["healthy"] else None)
+
+    def coverage(self, service):
+        """"probed", "blocked" (last deep probe fast-failed) or "skipped" (never measured)"""
+        if service in self.blocked:
+            return "blocked"
+        if any(self.samples[(service, probe["path"])] for probe in self.catalogue.get(service, [])):
+            return "probed"
+        return "skipped"
+
+    def breaches(self, service):
+        found = []
+        for probe in self.catalogue.get(service, []):
+            window = self.samples[(service, probe["path"])]
+            latencies = [v for v in window if v is not None]
+            errors = len(window) - len(latencies)
+            p95 = percentile(latencies, 95)
+            if errors or (p95 is not None and p95 > probe["p95_ms"]):
+                found.append({"endpoint": probe["path"], "p95_ms": round(p95, 1) if p95 is not None else None,
+                              "budget_ms": probe["p95_ms"], "errors": errors, "samples": len(window)})
+        return found
+
+    def annotate(self, results, deep=True):
+        """
+        Flag health results as degraded when one of their endpoints breaches its budget,
+        and record whether their endpoints were measured at all when deep probes ran.
+        """
+        for r in results:
+            r["slo_breaches"] = self.breaches(r["name"])
+            r["degraded"] = bool(r["slo_breaches"])
+            r["deep_probe"] = self.coverage(r["name"]) if deep and r["name"] in self.catalogue else None
+
+
+def mann_whitney_u(before, after):
+    """
+    One-sided Mann-Whitney U test that `after` tends to be larger than `before`
+    (normal approximation with tie correction). Returns (U of `after`, p-value).
+    """
+    n1, n2 = len(before), len(after)
+    pooled = sorted([(v, 0) for v in before] + [(v, 1) for v in after])
+    rank_sum, ties, i = 0.0, 0.0, 0
+    while i < len(pooled):
+        j = i
+        while j + 1 < len(pooled) and pooled[j + 1][0] == pooled[i][0]:
+            j += 1
+        rank = (i + j) / 2 + 1  # average rank of the tied run
+        rank_sum += rank * sum(1 for k in range(i, j + 1) if pooled[k][1])
+        ties += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+    u = rank_sum - n2 * (n2 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return u, 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return u, 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def bootstrap_p95(before, after, rounds=REGRESSION_BOOTSTRAP, seed=0):
+    """
+    Bootstrap of p95(after) - p95(before). Returns (observed difference,
+    one-sided p-value of "no increase", 95% confidence interval).
+    """
+    rng = random.Random(seed)
+    diffs = sorted(percentile(rng.choices(after, k=len(after)), 95) -
+                   percentile(rng.choices(before, k=len(before)), 95)
+                   for _ in range(rounds))
+    observed = percentile(after, 95) - percentile(before, 95)
+    p_value = (bisect.bisect_right(diffs, 0.0) + 1) / (rounds + 1)
+    return observed, p_value, (percentile(diffs, 2.5), percentile(diffs, 97.5))
+
+
+def _cliffs_magnitude(delta):
+    delta = abs(delta)
+    if delta < 0.147:
+        return "negligible"
+    if delta < 0.33:
+        return "small"
+    return "medium" if delta < 0.474 else "large"
+
+
+def compare_latency(before, after, alpha=REGRESSION_ALPHA, min_increase=REGRESSION_MIN_INCREASE):
+    """
+    Compare the latency samples of two versions. A regression is a p95 increase of at
+    least `min_increase` that the bootstrap finds significant at `alpha`, with a
+    distribution shift confirmed by the Mann-Whitney test. Cliff's delta is the effect size.
+    """
+    u, mw_p = mann_whitney_u(before, after)
+    diff, boot_p, (ci_low, ci_high) = bootstrap_p95(before, after)
+    before_p95, after_p95 = percentile(before, 95), percentile(after, 95)
+    delta = 2 * u / (len(before) * len(after)) - 1
+    increase = diff / before_p95 if before_p95 else None
+    return {
+        "before_samples": len(before),
+        "after_samples": len(after),
+        "before_p50_ms": round(percentile(before, 50), 1),
+        "after_p50_ms": round(percentile(after, 50), 1),
+        "before_p95_ms": round(before_p95, 1),
+        "after_p95_ms": round(after_p95, 1),
+        "p95_increase_pct": round(increase * 100, 1) if increase is not None else None,
+        "p95_diff_ci95_ms": [round(ci_low, 1), round(ci_high, 1)],
+        "bootstrap_p_value": round(boot_p, 4),
+        "mann_whitney_p_value": round(mw_p, 6),
+        "cliffs_delta": round(delta, 3),
+        "effect": _cliffs_magnitude(delta),
+        "regression": (boot_p < alpha and mw_p < alpha and increase is not None
+                       and increase >= min_increase),
+    }
+
+
+class RegressionDetector:
+    """
+    Watches the version reported by /health and compares, per series, the last
+    `window` latencies of the previous version with the first `window` of the new
+    one. Deep endpoint series follow the version of their service. Used as a sink
+    in the daemon, and replayed over stored samples by --regressions.
+    """
+
+    def __init__(self, window=REGRESSION_WINDOW, min_samples=REGRESSION_MIN_SAMPLES, verbose=False):
+        self.window = window
+        self.min_samples = min_samples
+        self.verbose = verbose
+        self.versions = {}   # service -> last version seen on /health
+        self.series = {}     # series name -> comparison state
+        self.findings = deque(maxlen=50)
+
+    def __call__(self, result):
+        if result.get("blocked_by"):
+            return
+        name = result["name"]
+        service = result.get("service", name)
+        version = result.get("version")
+        if service == name and version not in (None, "N/A"):
+            self.versions[service] = version
+        version = self.versions.get(service)
+        if version is None:
+            return
+
+        state = self.series.get(name)
+        if state is None:
+            state = self.series[name] = {"version": version, "before": deque(maxlen=self.window),
+                                         "after": None}
+        if version != state["version"]:
+            # Too few samples of the old version (e.g. back-to-back deploys): nothing to compare
+            enough = len(state["before"]) >= self.min_samples
+            state.update(after=[] if enough else None, previous=state["version"],
+                         changed_at=result["checked_at"], baseline=list(state["before"]))
+            state["version"] = version
+            state["before"] = deque(maxlen=self.window)
+
+        latency = result["response_time"] if result["healthy"] else None
+        if latency is None:
+            return
+        state["before"].append(latency)
+        if state["after"] is not None:
+            state["after"].append(latency)
+            if len(state["after"]) >= self.window:
+                self._evaluate(name, service, state)
+
+    def _evaluate(self, name, service, state):
+        finding = compare_latency(state["baseline"], state["after"])
+        finding.update(name=name, service=service, previous_version=state["previous"],
+                       version=state["version"], changed_at=state["changed_at"])
+        state["after"] = None
+        self.findings.append(finding)
+        if self.verbose and finding["regression"]:
+            print(format_regression(finding), flush=True)
+
+    def finish(self):
+        """Evaluate the series that have at least min_samples since their change"""
+        for name, state in self.series.items():
+            if state["after"] is not None and len(state["after"]) >= self.min_samples:
+                self._evaluate(name, state.get("service", name.split(" /", 1)[0]), state)
+
+    def pending(self):
+        """Series still collecting samples after a version change"""
+        return {name: {"version": st["version"], "previous_version": st["previous"], "samples": len(st["after"])}
+                for name, st in self.series.items() if st["after"] is not None}
+
+
+def format_regression(finding):
+    return (f"[regression] {finding['name']} {finding['previous_version']} -> {finding['version']}: "
+            f"p95 {_format_ms(finding['before_p95_ms'])} -> {_format_ms(finding['after_p95_ms'])} "
+            f"(+{finding['p95_increase_pct']}%, p={finding['bootstrap_p_value']}, "
+            f"Cliff's delta {finding['cliffs_delta']} {finding['effect']})")
+
+
+def _ewm_update(stats, value, variance, weight, alpha):
+    """
+    Fold `weight` observations of mean `value` (and inner variance) into an
+    exponentially weighted mean/variance, as if each had been added with `alpha`.
+    """
+    a = 1.0 if stats["n"] == 0 else 1 - (1 - alpha) ** weight
+    delta = value - stats["mean"]
+    stats["mean"] += a * delta
+    stats["var"] = (1 - a) * (stats["var"] + a * delta * delta) + a * variance
+    stats["n"] += weight
+
+
+def _hour_of_week(ts):
+    moment = time.localtime(ts)
+    return moment.tm_wday * 24 + moment.tm_hour
+
+
+def _slot_label(slot):
+    return f"{('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')[slot // 24]} {slot % 24:02d}h"
+
+
+class AnomalyDetector:
+    """
+    Seasonal latency and error-rate baselines per series and hour of week. Each
+    slot keeps an EWMA mean/variance of log latency and an EWMA error rate, updated
+    in O(1) on every probe; slots with too little history fall back to the series'
+    all-hours baseline. Each probe is scored against the baseline of its own slot and
+    a short EWMA of those residuals is compared with the expected band, so the band
+    moves with the hour instead of lagging behind it. An anomaly is raised (or cleared) after
+    ANOMALY_CONSECUTIVE probes outside (or back inside) it. Baselines can be
+    seeded from the store's hourly rollups so a restart does not relearn weeks.
+    """
+
+    def __init__(self, verbose=False, max_events=100):
+        self.verbose = verbose
+        self.series = {}
+        self.events = deque(maxlen=max_events)
+
+    def _state(self, name):
+        state = self.series.get(name)
+        if state is None:
+            state = self.series[name] = {"slots": {}, "all": self._stats(), "short_z": 0.0,
+                                         "short_err": 0.0, "out": 0, "in": 0, "active": None}
+        return state
+
+    @staticmethod
+    def _stats():
+        return {"mean": 0.0, "var": 0.0, "n": 0, "err": 0.0, "err_n": 0}
+
+    def _learn(self, state, slot, log_latency, variance, errors, count, weight=1.0):
+        for stats in (state["slots"].setdefault(slot, self._stats()), state["all"]):
+            if log_latency is not None:
+                _ewm_update(stats, log_latency, variance, (count - errors) * weight, ANOMALY_ALPHA)
+            a = 1.0 if stats["err_n"] == 0 else 1 - (1 - ANOMALY_ALPHA) ** (count * weight)
+            stats["err"] += a * (errors / count - stats["err"])
+            stats["err_n"] += count * weight
+
+    def seed(self, store, until=None):
+        """Learn the baselines from the hourly rollups of the store"""
+        for service, bucket, count, errors, p50, p95 in store.rollups(3600, 0, until):
+            log_latency = variance = None
+            if p50:
+                # Log-normal reading of the bucket: median -> mean, p95 -> spread
+                log_latency = math.log(p50)
+                variance = (max(0.0, math.log(p95) - log_latency) / 1.645) ** 2 if p95 else 0.0
+            self._learn(self._state(service), _hour_of_week(bucket), log_latency, variance, errors, count)
+
+    def expected(self, name, slot):
+        """Baseline used for a slot: its own once it has enough samples, the series' otherwise"""
+        state = self.series.get(name)
+        if state is None:
+            return None
+        stats = state["slots"].get(slot)
+        if stats is None or stats["n"] < ANOMALY_MIN_SAMPLES:
+            stats = state["all"]
+        return stats if stats["n"] >= ANOMALY_MIN_SAMPLES else None
+
+    def __call__(self, result):
+        if result.get("blocked_by") or result["status"] == "circuit-open":
+            return
+        name = result["name"]
+        state = self._state(name)
+        slot = _hour_of_week(result["checked_at"])
+        latency = result["response_time"] if result["healthy"] else None
+        log_latency = math.log(max(latency, 0.1)) if latency is not None else None
+
+        baseline = self.expected(name, slot)
+        verdict = None
+        if baseline:
+            sigma = max(math.sqrt(baseline["var"]), ANOMALY_MIN_SIGMA)
+            if log_latency is not None:
+                z = (log_latency - baseline["mean"]) / sigma
+                state["short_z"] += ANOMALY_SHORT_ALPHA * (z - state["short_z"])
+            state["short_err"] += ANOMALY_ERROR_ALPHA * ((latency is None) - baseline["err"] - state["short_err"])
+            verdict = self._judge(state, baseline, sigma)
+        if verdict:
+            state["out"], state["in"] = state["out"] + 1, 0
+        else:
+            state["in"], state["out"] = state["in"] + 1, 0
+        if state["active"] is None and state["out"] >= ANOMALY_CONSECUTIVE:
+            state["active"] = dict(verdict, name=name, slot=_slot_label(slot), since=result["checked_at"])
+            self._emit("raised", state["active"], result["checked_at"])
+        elif state["active"] and state["in"] >= ANOMALY_CONSECUTIVE:
+            self._emit("cleared", state["active"], result["checked_at"])
+            state["active"] = None
+
+        # An ongoing anomaly only nudges the baseline, so incidents do not become the norm
+        self._learn(state, slot, log_latency, 0.0, int(latency is None), 1, 0.1 if verdict else 1.0)
+
+    def _judge(self, state, baseline, sigma):
+        """Which signal is outside its band, or None"""
+        # Bands of the short EWMAs: the per-probe spread shrunk by the smoothing
+        limit = ANOMALY_K * math.sqrt(ANOMALY_SHORT_ALPHA / (2 - ANOMALY_SHORT_ALPHA))
+        current = math.exp(baseline["mean"] + state["short_z"] * sigma)
+        expected = math.exp(baseline["mean"])
+        if abs(state["short_z"]) > limit and abs(current - expected) >= ANOMALY_MIN_DELTA_MS:
+            return {"signal": "latency", "direction": "high" if current > expected else "low",
+                    "current_ms": round(current, 1), "expected_ms": round(expected, 1),
+                    "band_ms": [round(math.exp(baseline["mean"] - limit * sigma), 1),
+                                round(math.exp(baseline["mean"] + limit * sigma), 1)]}
+
+        rate = max(baseline["err"], ANOMALY_ERROR_FLOOR)
+        current = baseline["err"] + state["short_err"]
+        ceiling = rate + ANOMALY_K * math.sqrt(rate * (1 - rate) * ANOMALY_ERROR_ALPHA / (2 - ANOMALY_ERROR_ALPHA))
+        if current > ceiling and current >= ANOMALY_MIN_ERROR_RATE:
+            return {"signal": "errors", "direction": "high", "current_rate": round(current, 3),
+                    "expected_rate": round(baseline["err"], 3), "limit_rate": round(ceiling, 3)}
+        return None
+
+    def _emit(self, kind, anomaly, ts):
+        event = dict(anomaly, event=kind, at=ts)
+        self.events.append(event)
+        if self.verbose:
+            print(format_anomaly(event), flush=True)
+
+    def active(self):
+        return [state["active"] for state in self.series.values() if state["active"]]
+
+
+def format_anomaly(event):
+    if event["signal"] == "latency":
+        detail = (f"latency {event['direction']}: {_format_ms(event['current_ms'])} vs expected "
+                  f"{_format_ms(event['expected_ms'])} (band {_format_ms(event['band_ms'][0])}-"
+                  f"{_format_ms(event['band_ms'][1])})")
+    else:
+        detail = f"error rate {event['current_rate']:.0%} vs expected {event['expected_rate']:.1%}"
+    return f"[anomaly {event['event']}] {event['name']} {detail}, {event['slot']}"
+
+
+class MetricsStore:
+    """
+    Append-only SQLite history of probe results with automatic rollups.
+    Raw samples are kept RAW_RETENTION_DAYS; closed 1-minute and 1-hour buckets are
+    rolled up into p50/p95/p99 and error counts plus a fixed-bucket latency histogram,
+    so long-range queries merge a few hundred rollup rows instead of scanning samples.
+    """
+
+    def __init__(self, path=STORE_FILE, raw_retention_days=RAW_RETENTION_DAYS):
+        self.path = path
+        self.raw_retention = raw_retention_days * 86400
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS samples (
+                service TEXT NOT NULL,
+                ts REAL NOT NULL,
+                healthy INTEGER NOT NULL,
+                total_ms REAL,
+                ttfb_ms REAL,
+                bytes INTEGER,
+                version TEXT,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts);
+            CREATE INDEX IF NOT EXISTS samples_service_ts ON samples (service, ts);
+            CREATE TABLE IF NOT EXISTS rollups (
+                service TEXT NOT NULL,
+                resolution INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                errors INTEGER NOT NULL,
+                p50 REAL,
+                p95 REAL,
+                p99 REAL,
+                max REAL,
+                histogram TEXT NOT NULL,
+                PRIMARY KEY (service, resolution, bucket)
+            );
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                resolution INTEGER PRIMARY KEY,
+                rolled_until INTEGER NOT NULL
+            );
+        """)
+        self.db.commit()
+        self._last_purge = 0.0
+
+    def __call__(self, result):
+        """Sink interface: append one probe result (committed by flush())"""
+        timings = result.get("timings") or {}
+        self.db.execute(
+            "INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (result["name"], result["checked_at"], int(result["healthy"]),
+             timings.get("total_ms"), timings.get("ttfb_ms"), timings.get("bytes"),
+             result.get("version"), result.get("error"))
         )
 
-        if result.returncode == 0 and result.stdout:
-            data = json.loads(result.stdout)
-            if data.get("token"):
-                return {"success": True, "message": "Login OK", "user": data.get("user", {}).get("email")}
+    def flush(self, now=None):
+        """Commit pending samples, roll up every closed bucket and purge expired data"""
+        now = now or time.time()
+        for resolution, _ in ROLLUP_RESOLUTIONS:
+            self._rollup(resolution, now)
+        if now - self._last_purge > 3600:
+            self._purge(now)
+        self.db.commit()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def _rollup(self, resolution, now):
+        closed_until = int(now // resolution) * resolution
+        row = self.db.execute("SELECT rolled_until FROM rollup_state WHERE resolution = ?",
+                              (resolution,)).fetchone()
+        if row is None:
+            first = self.db.execute("SELECT MIN(ts) FROM samples").fetchone()[0]
+            if first is None:
+                return
+            rolled_until = int(first // resolution) * resolution
+        else:
+            rolled_until = row[0]
+        if closed_until <= rolled_until:
+            return
+
+        groups = {}
+        for service, ts, healthy, total_ms in self.db.execute(
+                "SELECT service, ts, healthy, total_ms FROM samples WHERE ts >= ? AND ts < ?",
+                (rolled_until, closed_until)):
+            group = groups.setdefault((service, int(ts // resolution) * resolution), [0, 0, []])
+            group[0] += 1
+            if not healthy:
+                group[1] += 1
+            elif total_ms is not None:
+                group[2].append(total_ms)
+
+        self.db.executemany(
+            "INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(service, resolution, bucket, count, errors,
+              percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99),
+              max(latencies) if latencies else None, json.dumps(latency_histogram(latencies)))
+             for (service, bucket), (count, errors, latencies) in groups.items()]
+        )
+        self.db.execute("INSERT OR REPLACE INTO rollup_state VALUES (?, ?)", (resolution, closed_until))
+
+    def _purge(self, now):
+        self.db.execute("DELETE FROM samples WHERE ts < ?", (now - self.raw_retention,))
+        for resolution, retention_days in ROLLUP_RESOLUTIONS:
+            self.db.execute("DELETE FROM rollups WHERE resolution = ? AND bucket < ?",
+                            (resolution, now - retention_days * 86400))
+        self._last_purge = now
+
+    def rollups(self, resolution, since, until=None):
+        """(service, bucket, count, errors, p50, p95) rollup rows of one resolution, oldest first"""
+        return self.db.execute(
+            "SELECT service, bucket, count, errors, p50, p95 FROM rollups "
+            "WHERE resolution = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+            (resolution, since, until or time.time())
+        )
+
+    def samples(self, since, until=None):
+        """Raw samples between two epoch timestamps, oldest first"""
+        return self.db.execute(
+            "SELECT service, ts, healthy, total_ms, version FROM samples WHERE ts >= ? AND ts < ? ORDER BY ts",
+            (since, until or time.time())
+        )
+
+    @staticmethod
+    def _tile(since, until, resolutions):
+        """(resolution, start, end) ranges covering [since, until) with the coarsest buckets first"""
+        if since >= until or not resolutions:
+            return []
+        resolution, finer = resolutions[0], resolutions[1:]
+        start, end = -(-since // resolution) * resolution, until // resolution * resolution
+        if start >= end:
+            return MetricsStore._tile(since, until, finer)
+        return (MetricsStore._tile(since, start, finer) + [(resolution, start, end)]
+                + MetricsStore._tile(end, until, finer))
+
+    def totals(self, service, since, until=None):
+        """
+        Probe, error and latency histogram totals of a window, summed from the coarsest
+        rollups that fit it: a 30-day window reads about as many rows as a 1-hour one.
+        Precision is one minute; the current minute is not rolled up yet.
+        """
+        resolutions = sorted((r for r, _ in ROLLUP_RESOLUTIONS), reverse=True)
+        finest = resolutions[-1]
+        since = -(-int(since) // finest) * finest
+        until = int(until or time.time()) // finest * finest
+        count = errors = 0
+        histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for resolution, start, end in self._tile(since, until, resolutions):
+            for bucket_count, bucket_errors, bucket_histogram in self.db.execute(
+                    "SELECT count, errors, histogram FROM rollups "
+                    "WHERE service = ? AND resolution = ? AND bucket >= ? AND bucket < ?",
+                    (service, resolution, start, end)):
+                count += bucket_count
+                errors += bucket_errors
+                histogram = [a + b for a, b in zip(histogram, json.loads(bucket_histogram))]
+        return {"count": count, "errors": errors, "histogram": histogram}
+
+    def query(self, service, since, until=None, resolution=None):
+        """
+        Rolled-up latency series for one service between two epoch timestamps.
+        Without an explicit resolution, 1-minute buckets are used up to 6 hours and
+        1-hour buckets beyond.
+        """
+        until = until or time.time()
+        if resolution is None:
+            resolution = 60 if until - since <= 6 * 3600 else 3600
+        rows = self.db.execute(
+            "SELECT bucket, count, errors, p50, p95, p99, max, histogram FROM rollups "
+            "WHERE service = ? AND resolution = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+            (service, resolution, int(since // resolution) * resolution, until)
+        ).fetchall()
+        return [{"bucket": bucket, "count": count, "errors": errors,
+                 "p50": p50, "p95": p95, "p99": p99, "max": max_ms,
+                 "histogram": json.loads(histogram)}
+                for bucket, count, errors, p50, p95, p99, max_ms, histogram in rows]
+
+    def summary(self, service, since, until=None, resolution=None):
+        """Overall percentiles and error rate for a window, merged from rollup histograms"""
+        series = self.query(service, since, until, resolution)
+        merged = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for point in series:
+            merged = [a + b for a, b in zip(merged, point["histogram"])]
+        count = sum(p["count"] for p in series)
+        errors = sum(p["errors"] for p in series)
+        return {
+            "service": service,
+            "since": since,
+            "buckets": len(series),
+            "count": count,
+            "errors": errors,
+            "error_rate": errors / count if count else None,
+            "p50": histogram_percentile(merged, 50),
+            "p95": histogram_percentile(merged, 95),
+            "p99": histogram_percentile(merged, 99)
+        }
+
+
+def slo_for(service):
+    return dict(SLO_DEFAULT, **SLO_OVERRIDES.get(service, {}))
+
+
+def _burn(bad, total, target):
+    """Burn rate: error ratio over the budgeted ratio (1 = spending exactly the budget)"""
+    return round(bad / total / (1 - target / 100), 2) if total else None
+
+
+def slo_status(store, service, now=None):
+    """
+    Error budget over SLO_PERIOD_DAYS and burn rate over every BURN_RATE_ALERTS window,
+    for the availability and latency objectives of one service.
+    """
+    now = now or time.time()
+    slo = slo_for(service)
+    threshold = LATENCY_BUCKETS_MS.index(slo["latency_ms"])
+    windows = {label: seconds for label, seconds in SLO_WINDOWS}
+    windows["period"] = SLO_PERIOD_DAYS * 86400
+
+    counts = {}
+    for label, seconds in windows.items():
+        totals = store.totals(service, now - seconds, now)
+        good_latency = sum(totals["histogram"][:threshold + 1])
+        counts[label] = {"availability": (totals["errors"], totals["count"]),
+                         "latency": (sum(totals["histogram"]) - good_latency, sum(totals["histogram"]))}
+
+    status = {"service": service, "probes": counts["period"]["availability"][1], "objectives": {}}
+    for objective, target in (("availability", slo["availability"]), ("latency", slo["latency"])):
+        bad, total = counts["period"][objective]
+        burn = {label: _burn(*counts[label][objective], target) for label, _ in SLO_WINDOWS}
+        alerts = [{"severity": severity, "long": long, "short": short, "threshold": threshold_rate}
+                  for severity, long, short, threshold_rate in BURN_RATE_ALERTS
+                  if burn[long] is not None and burn[short] is not None
+                  and burn[long] >= threshold_rate and burn[short] >= threshold_rate]
+        status["objectives"][objective] = {
+            "target": target,
+            "sli": round(100 * (1 - bad / total), 3) if total else None,
+            "budget_remaining_pct": round(100 * (1 - bad / total / (1 - target / 100)), 1) if total else None,
+            "bad_probes": bad,
+            "burn_rate": burn,
+            "alerts": alerts,
+        }
+    status["objectives"]["latency"]["threshold_ms"] = slo["latency_ms"]
+    return status
+
+
+def slo_report(store, services=None, now=None):
+    return [slo_status(store, service, now) for service in (services or SERVICES)]
+
+
+def print_slo_report(report):
+    print(f"  {'Service':26} {'Objective':12} {'SLI':>8} {'Target':>7} {'Budget':>8}  "
+          + " ".join(f"{label:>5}" for label, _ in SLO_WINDOWS))
+    for status in report:
+        for objective, o in status["objectives"].items():
+            sli = f"{o['sli']:.2f}%" if o["sli"] is not None else "-"
+            budget = f"{o['budget_remaining_pct']:.0f}%" if o["budget_remaining_pct"] is not None else "-"
+            burn = " ".join(f"{o['burn_rate'][label]:>5.1f}" if o["burn_rate"][label] is not None else "    -"
+                            for label, _ in SLO_WINDOWS)
+            flag = "  " + ",".join(f"{a['severity'].upper()}({a['long']}/{a['short']})" for a in o["alerts"])
+            name = status["service"] if objective == "availability" else ""
+            print(f"  {name:26} {objective:12} {sli:>8} {o['target']:>6}% {budget:>8}  {burn}{flag.rstrip()}")
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{_label_value(value)}"' for key, value in labels.items()) + "}"
+
+
+class MetricsExporter:
+    """
+    Serves probe results on an HTTP /metrics endpoint in OpenMetrics text format.
+    Recording a result costs one bisect and a few increments per phase; the text is
+    only rendered when scraped.
+    """
+
+    CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+    def __init__(self, port=METRICS_PORT, host="0.0.0.0"):
+        self.port = port
+        self.host = host
+        self.bounds = [bound / 1000.0 for bound in LATENCY_BUCKETS_MS]
+        self.histograms = {}   # (service, endpoint, phase) -> [bucket counts..., sum]
+        self.probes = {}       # (service, endpoint, outcome) -> count
+        self.up = {}           # service -> 0/1
+        self.info = {}         # service -> (version, mongodb)
+        self._server = None
+
+    def __call__(self, result):
+        service = result.get("service", result["name"])
+        endpoint = result.get("endpoint", "/health")
+        outcome = "success" if result["healthy"] else "failure"
+        self.probes[(service, endpoint, outcome)] = self.probes.get((service, endpoint, outcome), 0) + 1
+
+        if endpoint == "/health":
+            self.up[service] = int(result["healthy"])
+            self.info[service] = (result.get("version", "N/A"), result.get("mongodb", "N/A"))
+
+        timings = result.get("timings") or {}
+        for phase in TIMING_PHASES:
+            value = timings.get(phase)
+            if value is None:
+                continue
+            seconds = value / 1000.0
+            histogram = self.histograms.get((service, endpoint, phase))
+            if histogram is None:
+                histogram = self.histograms[(service, endpoint, phase)] = [0] * (len(self.bounds) + 2)
+            histogram[bisect.bisect_left(self.bounds, seconds)] += 1
+            histogram[-1] += seconds
+
+    def render(self):
+        lines = [
+            "# TYPE rt_probe_duration_seconds histogram",
+            "# UNIT rt_probe_duration_seconds seconds",
+            "# HELP rt_probe_duration_seconds Probe latency per phase.",
+        ]
+        for (service, endpoint, phase), histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            labels = dict(service=service, endpoint=endpoint, phase=phase[:-3])
+            for bound, count in zip(self.bounds + [float("inf")], histogram[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"rt_probe_duration_seconds_bucket{_labels(**labels, le=le)} {cumulative}")
+            lines.append(f"rt_probe_duration_seconds_count{_labels(**labels)} {cumulative}")
+            lines.append(f"rt_probe_duration_seconds_sum{_labels(**labels)} {histogram[-1]:.6f}")
+
+        lines += ["# TYPE rt_probes counter", "# HELP rt_probes Probes run, by outcome."]
+        for (service, endpoint, outcome), count in sorted(self.probes.items()):
+            lines.append(f"rt_probes_total{_labels(service=service, endpoint=endpoint, outcome=outcome)} {count}")
+
+        lines += ["# TYPE rt_service_up gauge", "# HELP rt_service_up 1 when the last /health probe succeeded."]
+        for service, up in sorted(self.up.items()):
+            lines.append(f"rt_service_up{_labels(service=service)} {up}")
+
+        lines += ["# TYPE rt_service info", "# HELP rt_service Version and MongoDB status reported by /health."]
+        for service, (version, mongodb) in sorted(self.info.items()):
+            lines.append(f"rt_service_info{_labels(service=service, version=version, mongodb=mongodb)} 1")
+
+        lines += ["# TYPE rt_service_mongodb_connected gauge",
+                  "# HELP rt_service_mongodb_connected 1 when /health reports MongoDB as connected."]
+        for service, (_, mongodb) in sorted(self.info.items()):
+            if mongodb != "N/A":
+                lines.append(f"rt_service_mongodb_connected{_labels(service=service)} "
+                             f"{int(mongodb_up(mongodb))}")
+
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+
+    def close(self):
+        if self._server:
+            self._server.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, content_type, body = "200 OK", self.CONTENT_TYPE, self.render().encode()
             else:
-                return {"success": False, "message": data.get("message", "No token")}
-        return {"success": False, "message": "No response"}
-    except Exception as e:
-        return {"success": False, "message": str(e)[:50]}
+                status, content_type, body = "404 Not Found", "text/plain", b"Not found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
 
-def main():
-    print("=" * 70)
-    print("  RT BACKEND SERVICES - PRODUCTION MONITOR")
-    print(f"  {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("=" * 70)
 
-    results = []
+def _status_icon(result):
+    if result["healthy"]:
+        return "[OK]"
+    return "[SKIP]" if result.get("blocked_by") else "[FAIL]"
+
+
+def _format_ms(value):
+    return f"{value:.0f}ms" if value is not None else "-"
+
+
+def print_latency_summary(results):
+    """Print per-service latency percentiles, slowest first"""
+    print(f"\n  {'Service':25} {'p50':>8} {'p95':>8} {'TTFB p50':>9} {'TLS p50':>8} {'Bytes':>7}")
+    ranked = sorted(results, key=lambda r: -(r["latency"].get("total_ms", {}).get("p50") or 0))
+    for r in ranked:
+        latency = r["latency"]
+        total = latency.get("total_ms", {})
+        print(f"  {r['name']:25} {_format_ms(total.get('p50')):>8} {_format_ms(total.get('p95')):>8} "
+              f"{_format_ms(latency.get('ttfb_ms', {}).get('p50')):>9} "
+              f"{_format_ms(latency.get('tls_ms', {}).get('p50')):>8} "
+              f"{latency.get('bytes', {}).get('p50', 0):>7.0f}")
+
+
+async def run_checks(samples=1, sinks=None, deep=True, breakers=None):
+    """Run the health sweep(s), the login test and the deep probes on a shared connection pool"""
+    latest = {}
+    history = {name: [] for name in SERVICES}
+    tracker = SloTracker()
+    client = HttpClient()
+    try:
+        # Check all services concurrently; extra samples reuse the warm connections
+        print("\n[1/3] Checking service health endpoints...")
+        print("-" * 70)
+
+        for sample in range(samples):
+            async for result in sweep(client, SERVICES, breakers=breakers):
+                latest[result["name"]] = result
+                history[result["name"]].append(result["timings"])
+                for sink in sinks or []:
+                    sink(result)
+
+                if sample == samples - 1:
+                    # Print status
+                    status_icon = _status_icon(result)
+                    print(f"  {status_icon:6} {result['name']:25} v{result['version']:8} "
+                          f"DB:{result['mongodb']:12} {_format_ms(result['response_time']):>8}")
+
+        results = list(latest.values())
+        for r in results:
+            r["samples"] = len(history[r["name"]])
+            r["latency"] = summarize_latency(history[r["name"]])
+        print_latency_summary(results)
+
+        unhealthy = [r for r in results if not r["healthy"]]
+        print("\n" + "-" * 70)
+        print(f"  Services: {len(results) - len(unhealthy)}/{len(results)} healthy")
 
-    # Check all services in parallel
-    print("\n[1/2] Checking service health endpoints...")
-    print("-" * 70)
+        if unhealthy:
+            print("\n  [!] UNHEALTHY SERVICES:")
+            for r in unhealthy:
+                if not r.get("blocked_by"):
+                    print(f"      - {r['name']}: {r['error']}")
+            blockers = [r["blocked_by"] for r in unhealthy if r.get("blocked_by")]
+            for blocker in sorted(set(blockers)):
+                print(f"      - {blockers.count(blocker)} services blocked by {blocker}")
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = {executor.submit(check_service, name, url): name
-                   for name, url in SERVICES.items()}
+        # Test login
+        print("\n[2/3] Testing authentication...")
+        print("-" * 70)
+        session = SessionCache(client, sinks)
+        await session.token()
+        login_result = session.last_login
+        if login_result["success"]:
+            print(f"  [OK]   Login test passed ({login_result.get('user', 'N/A')})")
+        else:
+            print(f"  [FAIL] Login test failed: {login_result['message']}")
+
+        # Deep probes against the real read endpoints
+        print("\n[3/3] Probing endpoint latency budgets...")
+        print("-" * 70)
+        for _ in range(samples if deep else 0):
+            async for result in deep_probes(client, session, breakers=breakers):
+                tracker(result)
+                for sink in sinks or []:
+                    sink(result)
+        if deep and not (breakers and breakers.blocked("WebSocket API")):
+            ws_result = await websocket_probe(client, SERVICES["WebSocket API"], await session.token())
+            for sink in sinks or []:
+                sink(ws_result)
+            print_websocket_result(ws_result)
+        _flush_sinks(sinks)
+        tracker.annotate(results, deep)
+
+        degraded = [r for r in results if r["degraded"]]
+        if deep:
+            coverage = {service: tracker.coverage(service) for service in PROBE_CATALOGUE}
+            within = [service for service, state in coverage.items() if state == "probed"
+                      and service not in {r["name"] for r in degraded}]
+            unprobed = {state: [service for service, s in coverage.items() if s == state]
+                        for state in ("blocked", "skipped")}
+            print(f"  Endpoints within budget: {len(within)}/{len(PROBE_CATALOGUE)} services "
+                  f"({len(unprobed['blocked'])} blocked, {len(unprobed['skipped'])} not probed)")
+            for service in unprobed["blocked"]:
+                print(f"  [BLOCKED] {service:25} {tracker.blocked[service]}")
+            for service in unprobed["skipped"]:
+                print(f"  [SKIP] {service:25} no endpoint measured")
+        else:
+            print("  Skipped (--no-deep)")
+        for r in degraded:
+            for breach in r["slo_breaches"]:
+                print(f"  [SLOW] {r['name']:25} {breach['endpoint']}: p95 {_format_ms(breach['p95_ms'])} "
+                      f"(budget {breach['budget_ms']}ms, {breach['errors']} errors)")
+    finally:
+        await client.close()
 
-        for future in as_completed(futures):
-            result = future.result()
-            results.append(result)
+    return results, login_result
 
-            # Print status
-            status_icon = "[OK]" if result["healthy"] else "[FAIL]"
-            print(f"  {status_icon:6} {result['name']:25} v{result['version']:8} DB:{result['mongodb']}")
 
-    # Summary
+def _flush_sinks(sinks):
+    for sink in sinks or []:
+        if hasattr(sink, "flush"):
+            sink.flush()
+
+
+def build_report(results, login_result):
     healthy = [r for r in results if r["healthy"]]
-    unhealthy = [r for r in results if not r["healthy"]]
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "total_services": len(results),
+        "healthy_count": len(healthy),
+        "unhealthy_count": len(results) - len(healthy),
+        "degraded_count": sum(1 for r in results if r.get("degraded")),
+        "blocked_count": sum(1 for r in results if r.get("blocked_by")),
+        "unprobed_count": sum(1 for r in results if r.get("deep_probe") in ("blocked", "skipped")),
+        "login_test": login_result,
+        "services": results
+    }
 
-    print("\n" + "-" * 70)
-    print(f"  Services: {len(healthy)}/{len(results)} healthy")
 
-    if unhealthy:
-        print("\n  [!] UNHEALTHY SERVICES:")
-        for r in unhealthy:
-            print(f"      - {r['name']}: {r['error']}")
+def write_report(report, path=REPORT_FILE):
+    """Write the report atomically so readers never see a half-written file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
 
-    # Test login
-    print("\n[2/2] Testing authentication...")
-    print("-" * 70)
-    login_result = test_login()
-    if login_result["success"]:
-        print(f"  [OK]   Login test passed ({login_result.get('user', 'N/A')})")
-    else:
-        print(f"  [FAIL] Login test failed: {login_result['message']}")
+
+class JsonlSink:
+    """Appends every probe result as one JSON line; reopen() supports log rotation"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", buffering=1)
+
+    def __call__(self, result):
+        self._file.write(json.dumps(result) + "\n")
+
+    def reopen(self):
+        self._file.close()
+        self._file = open(self.path, "a", buffering=1)
+
+    def close(self):
+        self._file.close()
+
+
+def print_result_line(result):
+    status_icon = _status_icon(result)
+    stamp = datetime.fromtimestamp(result["checked_at"]).strftime("%H:%M:%S")
+    detail = _format_ms(result["response_time"]) if result["healthy"] else result["error"] or result["status"]
+    print(f"{stamp} {status_icon:6} {result['name']:25} {detail}", flush=True)
+
+
+def _sorted_percentile(ordered, pct):
+    """percentile() for a list that is already sorted"""
+    if not ordered:
+        return None
+    rank = (len(ordered) - 1) * pct / 100.0
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class LiveView:
+    """
+    Full-screen terminal view for the daemon (--live), fed as a sink. Each row keeps
+    its last `window` samples plus a sorted copy updated with bisect on every result,
+    so rolling p50/p95 and the error rate never rescan anything. A redraw task
+    rewrites only the rows that changed since the previous frame.
+    """
+
+    def __init__(self, window=LIVE_WINDOW, refresh=LIVE_REFRESH, stream=None):
+        self.window = window
+        self.refresh = refresh
+        self.stream = stream or sys.stdout
+        self.rows = {}
+        self._drawn = {}      # screen line -> text currently displayed
+        self._task = None
+
+    def __call__(self, result):
+        row = self.rows.get(result["name"])
+        if row is None:
+            row = self.rows[result["name"]] = {"samples": deque(), "sorted": [], "errors": 0, "blocked": 0}
+        if result.get("blocked_by") or result["status"] == "circuit-open":
+            sample = "blocked"
+        else:
+            sample = result["response_time"] if result["healthy"] else None
+
+        samples = row["samples"]
+        if len(samples) == self.window:
+            self._forget(row, samples.popleft())
+        samples.append(sample)
+        if sample is None:
+            row["errors"] += 1
+        elif sample == "blocked":
+            row["blocked"] += 1
+        else:
+            bisect.insort(row["sorted"], sample)
+        row["healthy"] = result["healthy"]
+
+    @staticmethod
+    def _forget(row, sample):
+        if sample is None:
+            row["errors"] -= 1
+        elif sample == "blocked":
+            row["blocked"] -= 1
+        else:
+            del row["sorted"][bisect.bisect_left(row["sorted"], sample)]
+
+    def sparkline(self, row):
+        latencies = row["sorted"]
+        low, high = (latencies[0], latencies[-1]) if latencies else (0, 0)
+        chars = []
+        for sample in row["samples"]:
+            if sample is None:
+                chars.append("!")
+            elif sample == "blocked":
+                chars.append(".")
+            else:
+                level = 0 if high == low else round((sample - low) / (high - low) * (len(SPARK_CHARS) - 1))
+                chars.append(SPARK_CHARS[level])
+        return "".join(chars)
+
+    def render_row(self, name):
+        row = self.rows[name]
+        probed = len(row["samples"]) - row["blocked"]
+        if not row["healthy"] and row["samples"][-1] == "blocked":
+            icon = "[SKIP]"
+        else:
+            icon = "[OK]" if row["healthy"] else "[FAIL]"
+        error_rate = f"{row['errors'] / probed:.0%}" if probed else "-"
+        return (f"{icon:6} {name[:28]:28} {_format_ms(_sorted_percentile(row['sorted'], 50)):>7} "
+                f"{_format_ms(_sorted_percentile(row['sorted'], 95)):>7} {error_rate:>5}  {self.sparkline(row)}")
+
+    def frame(self):
+        """Screen lines of the current state"""
+        down = sum(1 for row in self.rows.values() if not row["healthy"])
+        lines = [
+            f"RT BACKEND SERVICES - LIVE   {datetime.now().strftime('%H:%M:%S')}   "
+            f"{len(self.rows) - down}/{len(self.rows)} OK",
+            f"{'':6} {'Service':28} {'p50':>7} {'p95':>7} {'err':>5}  last {self.window} probes "
+            f"(! failed, . blocked)",
+        ]
+        lines += [self.render_row(name) for name in self.rows]
+        return lines
+
+    def draw(self):
+        """Rewrite the lines that differ from what is on screen"""
+        width, height = shutil.get_terminal_size()
+        out = []
+        lines = [line[:width] for line in self.frame()[:height - 1]]
+        for number, line in enumerate(lines, start=1):
+            if self._drawn.get(number) != line:
+                out.append(f"\x1b[{number};1H{line}\x1b[K")
+                self._drawn[number] = line
+        for number in [n for n in self._drawn if n > len(lines)]:
+            out.append(f"\x1b[{number};1H\x1b[K")
+            del self._drawn[number]
+        if out:
+            self.stream.write("".join(out))
+            self.stream.flush()
+
+    async def start(self):
+        if sys.platform == "win32":
+            os.system("")  # enables ANSI escape sequences in the Windows console
+        self.stream.write("\x1b[?25l\x1b[2J")
+        self._task = asyncio.create_task(self._redraw())
+
+    async def _redraw(self):
+        while True:
+            self.draw()
+            await asyncio.sleep(self.refresh)
+
+    def reopen(self):
+        # SIGHUP: repaint the whole screen, e.g. after a terminal resize
+        self._drawn.clear()
+        self.stream.write("\x1b[2J")
+
+    def close(self):
+        if self._task:
+            self._task.cancel()
+        self.draw()
+        self.stream.write(f"\x1b[{len(self._drawn) + 1};1H\x1b[?25h\n")
+        self.stream.flush()
+
+
+def _install_signal_handlers(loop, stop, reload):
+    """SIGTERM/SIGINT stop the daemon, SIGHUP reloads (not available on Windows)"""
+    for signame, callback in (("SIGTERM", stop.set), ("SIGINT", stop.set), ("SIGHUP", reload.set)):
+        sig = getattr(signal, signame, None)
+        if sig is None:
+            continue
+        try:
+            loop.add_signal_handler(sig, callback)
+        except NotImplementedError:
+            signal.signal(sig, lambda *_, cb=callback: loop.call_soon_threadsafe(cb))
+
+
+class AdaptiveScheduler:
+    """
+    Per-service probe cadence for the daemon. A failing service is probed every
+    min_interval seconds, a service whose latency drifts above drift_factor x its EWMA
+    baseline has its interval halved, and every other success backs the interval off
+    by `backoff` up to max_interval. A token bucket caps the fleet-wide probe rate;
+    when probes compete for tokens, the services with the shortest interval go first.
+    """
+
+    def __init__(self, names, base_interval=DAEMON_INTERVAL, min_interval=ADAPTIVE_MIN_INTERVAL,
+                 max_interval=ADAPTIVE_MAX_INTERVAL, rps_budget=ADAPTIVE_RPS_BUDGET,
+                 backoff=ADAPTIVE_BACKOFF, drift_factor=ADAPTIVE_DRIFT_FACTOR, now=None):
+        now = time.monotonic() if now is None else now
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.rps_budget = rps_budget
+        self.backoff = backoff
+        self.drift_factor = drift_factor
+        self.capacity = max(1.0, rps_budget)
+        self.tokens = self.capacity
+        self._refilled = now
+        # Spread the first probes over one base interval instead of a burst at startup
+        self.state = {
+            name: {"interval": base_interval, "next": now + random.uniform(0, base_interval),
+                   "ewma": None, "in_flight": False}
+            for name in names
+        }
+
+    def take_due(self, now):
+        """Names of the services to probe now, within the rate budget"""
+        self.tokens = min(self.capacity, self.tokens + (now - self._refilled) * self.rps_budget)
+        self._refilled = now
+        due = sorted((st["interval"], st["next"], name) for name, st in self.state.items()
+                     if not st["in_flight"] and st["next"] <= now)
+        names = []
+        for _, _, name in due:
+            if self.tokens < 1:
+                break
+            self.tokens -= 1
+            self.state[name]["in_flight"] = True
+            names.append(name)
+        return names
+
+    def record(self, result, now):
+        """Adapt the probing interval of a service from its latest result"""
+        st = self.state[result["name"]]
+        st["in_flight"] = False
+        latency = result["response_time"]
+        if result.get("blocked_by") or result["status"] == "circuit-open":
+            # Fast-failed without a request: says nothing about the service itself
+            st["next"] = now + st["interval"]
+            return
+
+        if not result["healthy"]:
+            st["interval"] = self.min_interval
+        elif st["ewma"] is not None and latency is not None and latency > st["ewma"] * self.drift_factor:
+            st["interval"] = max(self.min_interval, st["interval"] / 2)
+        else:
+            st["interval"] = min(self.max_interval, st["interval"] * self.backoff)
+
+        if result["healthy"] and latency is not None:
+            st["ewma"] = latency if st["ewma"] is None else 0.8 * st["ewma"] + 0.2 * latency
+        st["next"] = now + st["interval"] * random.uniform(0.9, 1.1)
+
+    def next_due(self):
+        pending = [st["next"] for st in self.state.values() if not st["in_flight"]]
+        return min(pending) if pending else None
+
+
+async def _run_scheduled(client, scheduler, latest, sinks, stop, duration, breakers=None):
+    """Dispatch probes as the scheduler makes them due, for `duration` seconds"""
+    loop = asyncio.get_running_loop()
+    end = loop.time() + duration
+    in_flight = set()
+
+    async def probe(name):
+        reason = breakers.gate(name, time.monotonic()) if breakers else None
+        if reason:
+            result = _blocked_result(name, SERVICES[name], reason, breakers.blocker(name))
+        else:
+            result = await check_service(client, name, SERVICES[name])
+            if breakers:
+                breakers.record(result, time.monotonic())
+        scheduler.record(result, time.monotonic())
+        latest[name] = result
+        for sink in sinks:
+            sink(result)
+
+    while not stop.is_set() and loop.time() < end:
+        for name in scheduler.take_due(time.monotonic()):
+            task = asyncio.create_task(probe(name))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        next_due = scheduler.next_due()
+        wait = 1.0 if next_due is None else next_due - time.monotonic()
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=min(max(wait, 0.05), 1.0, max(end - loop.time(), 0.0)))
+        except asyncio.TimeoutError:
+            pass
+
+    if in_flight:
+        await asyncio.wait(in_flight, timeout=client.timeout)
+
+
+async def run_daemon(interval=DAEMON_INTERVAL, jitter=DAEMON_JITTER, sinks=None,
+                     report_path=REPORT_FILE, scheduler=None, deep=True, breakers=None, regressions=None,
+                     anomalies=None):
+    """
+    Probe the fleet forever on one warm connection pool. Each result is handed to
+    every sink as soon as it completes; only the latest result per service is kept
+    in memory, so CPU and memory stay flat however long the process runs.
+    With a scheduler, services are probed on their own adaptive cadence and the
+    report is refreshed every `interval` seconds instead of after each sweep.
+    Deep endpoint probes run once per cycle with the cached session token.
+    With circuit breakers, services whose dependencies are down are skipped until
+    a half-open trial probe shows the dependency is back. RegressionDetector and
+    AnomalyDetector see every result and their findings are added to the report,
+    with the SLO error budgets when results are stored.
+    SIGHUP drops pooled connections and calls reopen() on sinks that support it.
+    """
+    loop = asyncio.get_running_loop()
+    stop, reload = asyncio.Event(), asyncio.Event()
+    _install_signal_handlers(loop, stop, reload)
+
+    sinks = list(sinks or [])
+    for sink in sinks:
+        if hasattr(sink, "start"):
+            await sink.start()
+    client = HttpClient()
+    latest = {}
+    session = SessionCache(client, sinks)
+    tracker = SloTracker()
+    sinks.append(tracker)
+    sinks += [detector for detector in (regressions, anomalies) if detector]
+    store = next((sink for sink in sinks if isinstance(sink, MetricsStore)), None)
+    try:
+        while not stop.is_set():
+            started = loop.time()
+
+            if reload.is_set():
+                reload.clear()
+                await client.close()
+                for sink in sinks:
+                    if hasattr(sink, "reopen"):
+                        sink.reopen()
+                print("[daemon] SIGHUP: connections reset, sinks reopened", flush=True)
+
+            if scheduler:
+                await _run_scheduled(client, scheduler, latest, sinks, stop, interval, breakers)
+            else:
+                async for result in sweep(client, SERVICES, deadline=min(SWEEP_DEADLINE, interval),
+                                          breakers=breakers):
+                    latest[result["name"]] = result
+                    for sink in sinks:
+                        sink(result)
+                    if stop.is_set():
+                        break
+
+            if deep and not stop.is_set():
+                async for result in deep_probes(client, session, breakers=breakers):
+                    for sink in sinks:
+                        sink(result)
+                if not (breakers and breakers.blocked("WebSocket API")):
+                    result = await websocket_probe(client, SERVICES["WebSocket API"], await session.token())
+                    for sink in sinks:
+                        sink(result)
+            elif not stop.is_set():
+                # Keep the login test going when deep probes are disabled
+                await session.token()
+            _flush_sinks(sinks)
+
+            tracker.annotate(latest.values(), deep)
+            report = build_report(list(latest.values()), session.last_login)
+            report["session"] = session.stats()
+            if breakers:
+                report["breakers"] = breakers.snapshot()
+            if regressions:
+                report["regressions"] = {"findings": list(regressions.findings), "pending": regressions.pending()}
+            if anomalies:
+                report["anomalies"] = {"active": anomalies.active(), "recent": list(anomalies.events)[-20:]}
+            if store:
+                report["slo"] = slo_report(store)
+            write_report(report, report_path)
+
+            if scheduler:
+                continue
+            # Jitter the next start so probes do not align with other periodic traffic
+            delay = interval * random.uniform(1 - jitter, 1 + jitter) - (loop.time() - started)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=max(0.0, delay))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await client.close()
+        for sink in sinks:
+            if hasattr(sink, "close"):
+                sink.close()
+
+
+def load_origins(path=None):
+    """EB origin per service: ORIGINS, overridden by a JSON file of {service: url}"""
+    origins = dict(ORIGINS)
+    if path:
+        with open(path) as f:
+            origins.update(json.load(f))
+    return {name: url.rstrip("/") for name, url in origins.items() if name in SERVICES}
+
+
+def _cache_status(x_cache):
+    # CloudFront sends "Hit from cloudfront", "RefreshHit from cloudfront", "Miss from cloudfront"...
+    return (x_cache or "none").split()[0].lower()
+
+
+async def _compare_target(client, service, origin, path, headers, samples):
+    latencies = {"cdn": [], "origin": []}
+    errors = {"cdn": 0, "origin": 0}
+    cache = {}
+    for _ in range(samples):
+        for side, base in (("cdn", SERVICES[service]), ("origin", origin)):
+            try:
+                response = await client.request("GET", f"{base}{path}", headers=headers)
+            except (asyncio.TimeoutError, OSError, ProbeError, asyncio.IncompleteReadError):
+                errors[side] += 1
+                continue
+            if response.status >= 500:
+                errors[side] += 1
+                continue
+            latencies[side].append(response.timings["total_ms"])
+            if side == "cdn":
+                status = _cache_status(response.headers.get("x-cache"))
+                cache[status] = cache.get(status, 0) + 1
+
+    cdn_p50, origin_p50 = percentile(latencies["cdn"], 50), percentile(latencies["origin"], 50)
+    hits = cache.get("hit", 0) + cache.get("refreshhit", 0)
+    cached = sum(count for status, count in cache.items() if status != "none")
+    return {
+        "service": service,
+        "path": path,
+        "samples": samples,
+        "cdn_p50_ms": cdn_p50,
+        "cdn_p95_ms": percentile(latencies["cdn"], 95),
+        "origin_p50_ms": origin_p50,
+        "origin_p95_ms": percentile(latencies["origin"], 95),
+        # Positive delta: going through CloudFront is slower than hitting the origin directly
+        "delta_p50_ms": round(cdn_p50 - origin_p50, 2) if cdn_p50 is not None and origin_p50 is not None else None,
+        "x_cache": cache,
+        "hit_ratio": round(hits / cached, 3) if cached else None,
+        "errors": errors
+    }
+
+
+async def compare_origins(client, origins, samples, token=None):
+    """Probe /health and the catalogued endpoints through CloudFront and directly on the origin"""
+    tasks = []
+    for service, origin in origins.items():
+        tasks.append(_compare_target(client, service, origin, "/health", {}, samples))
+        for probe in PROBE_CATALOGUE.get(service, []):
+            if probe.get("auth") and not token:
+                continue
+            headers = {"Authorization": f"Bearer {token}"} if probe.get("auth") else {}
+            tasks.append(_compare_target(client, service, origin, probe["path"], headers, samples))
+    return await asyncio.gather(*tasks)
+
+
+def compare_main(args):
+    origins = load_origins(args.origins)
+    samples = max(args.samples, 2)
+
+    async def run():
+        client = HttpClient()
+        try:
+            token = await SessionCache(client).token()
+            return await compare_origins(client, origins, samples, token)
+        finally:
+            await client.close()
+
+    print("=" * 90)
+    print(f"  CLOUDFRONT vs ORIGIN - {len(origins)} services, {samples} samples per path")
+    print("=" * 90)
+    rows = asyncio.run(run())
+    rows.sort(key=lambda r: -(r["delta_p50_ms"] if r["delta_p50_ms"] is not None else float("-inf")))
+
+    print(f"\n  {'Service':25} {'Path':38} {'CDN p50':>8} {'Origin':>8} {'Delta':>8} {'Hit %':>6}")
+    for r in rows:
+        delta = f"{r['delta_p50_ms']:+.0f}ms" if r["delta_p50_ms"] is not None else "-"
+        hit = f"{r['hit_ratio']:.0%}" if r["hit_ratio"] is not None else "-"
+        flag = "  <- no CDN gain" if r["delta_p50_ms"] is not None and r["delta_p50_ms"] >= 0 and not r["hit_ratio"] else ""
+        print(f"  {r['service']:25} {r['path'][:38]:38} {_format_ms(r['cdn_p50_ms']):>8} "
+              f"{_format_ms(r['origin_p50_ms']):>8} {delta:>8} {hit:>6}{flag}")
+
+    with open(ORIGIN_REPORT_FILE, "w") as f:
+        json.dump({"timestamp": datetime.now().isoformat(), "samples": samples,
+                   "origins": origins, "paths": rows}, f, indent=2)
+    print(f"\nReport saved to: {ORIGIN_REPORT_FILE}")
+
+
+async def _audit_endpoint(client, service, path, headers):
+    url = f"{SERVICES[service]}{path}"
+    entry = {"service": service, "path": path}
+    try:
+        plain = await client.request("GET", url, headers=headers)
+        encoded = await client.request("GET", url, headers=dict(headers, **{"Accept-Encoding": "gzip, br"}))
+    except (asyncio.TimeoutError, OSError, ProbeError, asyncio.IncompleteReadError) as e:
+        entry["error"] = str(e)[:100] or type(e).__name__
+        return entry
+
+    encoding = encoded.headers.get("content-encoding", "identity")
+    # What gzip would achieve on this payload, to size the saving when the API sends it raw
+    gzip_estimate = len(gzip.compress(plain.body, 6)) if plain.body else 0
+    wire_size = len(encoded.body)
+    entry.update({
+        "status": encoded.status,
+        "raw_bytes": len(plain.body),
+        "encoded_bytes": wire_size,
+        "content_encoding": encoding,
+        "gzip_estimate_bytes": gzip_estimate,
+        "raw_transfer_ms": plain.timings["total_ms"],
+        "encoded_transfer_ms": encoded.timings["total_ms"],
+        "savable_bytes": max(0, wire_size - gzip_estimate) if encoding == "identity" else 0,
+    })
+    return entry
+
+
+async def compression_audit(client, token=None):
+    """Fetch /health and every catalogued endpoint with and without Accept-Encoding"""
+    tasks = []
+    for service in SERVICES:
+        tasks.append(_audit_endpoint(client, service, "/health", {}))
+        for probe in PROBE_CATALOGUE.get(service, []):
+            if probe.get("auth") and not token:
+                continue
+            headers = {"Authorization": f"Bearer {token}"} if probe.get("auth") else {}
+            tasks.append(_audit_endpoint(client, service, probe["path"], headers))
+    return await asyncio.gather(*tasks)
+
+
+def compression_main(args):
+    async def run():
+        client = HttpClient()
+        try:
+            token = await SessionCache(client).token()
+            return await compression_audit(client, token)
+        finally:
+            await client.close()
+
+    print("=" * 90)
+    print("  RESPONSE COMPRESSION AUDIT")
+    print("=" * 90)
+    entries = asyncio.run(run())
+    measured = sorted((e for e in entries if "error" not in e), key=lambda e: -e["savable_bytes"])
+    failed = [e for e in entries if "error" in e]
+
+    print(f"\n  {'Service':25} {'Path':38} {'Raw':>8} {'Sent':>8} {'Encoding':>9} {'Savable':>8}")
+    for e in measured:
+        print(f"  {e['service']:25} {e['path'][:38]:38} {e['raw_bytes']:>8} {e['encoded_bytes']:>8} "
+              f"{e['content_encoding']:>9} {e['savable_bytes']:>8}")
+    for e in failed:
+        print(f"  {e['service']:25} {e['path'][:38]:38} ERROR: {e['error']}")
+
+    total_raw = sum(e["raw_bytes"] for e in measured)
+    total_sent = sum(e["encoded_bytes"] for e in measured)
+    total_savable = sum(e["savable_bytes"] for e in measured)
+    uncompressed = [e for e in measured if e["content_encoding"] == "identity" and e["savable_bytes"]]
+    print(f"\n  {len(measured)} endpoints: {total_raw} bytes raw, {total_sent} bytes sent with Accept-Encoding, "
+          f"{total_savable} more savable with gzip ({len(uncompressed)} endpoints sent uncompressed)")
+
+    with open(COMPRESSION_REPORT_FILE, "w") as f:
+        json.dump({"timestamp": datetime.now().isoformat(),
+                   "totals": {"raw_bytes": total_raw, "encoded_bytes": total_sent, "savable_bytes": total_savable},
+                   "endpoints": measured + failed}, f, indent=2)
+    print(f"\nReport saved to: {COMPRESSION_REPORT_FILE}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SYMPHONI.A production monitor")
+    parser.add_argument("--samples", type=int, default=1,
+                        help="probes per service in this run, summarized as percentiles (default: 1)")
+    parser.add_argument("--daemon", action="store_true",
+                        help="run continuously instead of a single sweep")
+    parser.add_argument("--interval", type=float, default=DAEMON_INTERVAL,
+                        help=f"daemon: seconds between sweeps (default: {DAEMON_INTERVAL:.0f})")
+    parser.add_argument("--jitter", type=float, default=DAEMON_JITTER,
+                        help=f"daemon: +/- fraction of jitter on the interval (default: {DAEMON_JITTER})")
+    parser.add_argument("--jsonl", metavar="PATH",
+                        help="daemon: append every probe result to this JSON-lines file")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="daemon: adapt each service's probe interval to its health")
+    parser.add_argument("--rps-budget", type=float, default=ADAPTIVE_RPS_BUDGET,
+                        help=f"adaptive: fleet-wide probes per second (default: {ADAPTIVE_RPS_BUDGET})")
+    parser.add_argument("--min-interval", type=float, default=ADAPTIVE_MIN_INTERVAL,
+                        help=f"adaptive: probe interval of failing services (default: {ADAPTIVE_MIN_INTERVAL:.0f})")
+    parser.add_argument("--max-interval", type=float, default=ADAPTIVE_MAX_INTERVAL,
+                        help=f"adaptive: probe interval of stable services (default: {ADAPTIVE_MAX_INTERVAL:.0f})")
+    parser.add_argument("--live", action="store_true",
+                        help="daemon: full-screen view with rolling p50/p95, error rate and sparklines")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help=f"daemon: serve OpenMetrics on http://0.0.0.0:PORT/metrics (usually {METRICS_PORT})")
+    parser.add_argument("--no-deep", action="store_true",
+                        help="skip the deep endpoint probes of PROBE_CATALOGUE")
+    parser.add_argument("--no-breakers", action="store_true",
+                        help="probe every service even when one of its dependencies is down")
+    parser.add_argument("--compare-origin", action="store_true",
+                        help=f"compare CloudFront and EB origin latency per path, write {ORIGIN_REPORT_FILE}")
+    parser.add_argument("--origins", metavar="PATH",
+                        help="compare-origin: JSON file of {service: origin URL} overriding ORIGINS")
+    parser.add_argument("--compression-audit", action="store_true",
+                        help=f"measure payload sizes with and without compression, write {COMPRESSION_REPORT_FILE}")
+    parser.add_argument("--store", metavar="PATH", default=STORE_FILE,
+                        help=f"SQLite history store (default: {STORE_FILE})")
+    parser.add_argument("--no-store", action="store_true",
+                        help="do not record results in the history store")
+    parser.add_argument("--history", metavar="SERVICE",
+                        help="print the stored latency history of SERVICE (or \"SERVICE /endpoint\") and exit")
+    parser.add_argument("--regressions", action="store_true",
+                        help=f"compare latency before/after each stored version change, write {REGRESSION_REPORT_FILE}")
+    parser.add_argument("--anomalies", action="store_true",
+                        help=f"replay stored probes against seasonal baselines, write {ANOMALY_REPORT_FILE}")
+    parser.add_argument("--slo", action="store_true",
+                        help=f"print error budgets and burn rates from the history store, write {SLO_REPORT_FILE}")
+    parser.add_argument("--days", type=float, default=7,
+                        help="history/regressions/anomalies: window in days (default: 7)")
+    return parser.parse_args()
+
+
+def history_main(args):
+    store = MetricsStore(args.store)
+    since = time.time() - args.days * 86400
+    started = time.perf_counter()
+    series = store.query(args.history, since)
+    summary = store.summary(args.history, since)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    store.close()
+
+    print(f"{args.history} - last {args.days:g} days ({len(series)} buckets, query {elapsed_ms:.1f}ms)")
+    print(f"  probes: {summary['count']}  errors: {summary['errors']}  "
+          f"p50: {_format_ms(summary['p50'])}  p95: {_format_ms(summary['p95'])}  p99: {_format_ms(summary['p99'])}")
+    for point in series:
+        stamp = datetime.fromtimestamp(point["bucket"]).strftime("%Y-%m-%d %H:%M")
+        print(f"  {stamp}  n={point['count']:<4} err={point['errors']:<3} p50={_format_ms(point['p50']):>7} "
+              f"p95={_format_ms(point['p95']):>7} p99={_format_ms(point['p99']):>7}")
+
+
+def regressions_main(args):
+    store = MetricsStore(args.store)
+    detector = RegressionDetector()
+    for name, ts, healthy, total_ms, version in store.samples(time.time() - args.days * 86400):
+        detector({"name": name, "service": name.split(" /", 1)[0], "checked_at": ts,
+                  "healthy": bool(healthy), "response_time": total_ms, "version": version})
+    store.close()
+    detector.finish()
+
+    findings = sorted(detector.findings, key=lambda f: f["changed_at"])
+    print(f"Version changes in the last {args.days:g} days: {len(findings)} compared "
+          f"(alpha {REGRESSION_ALPHA}, min p95 increase {REGRESSION_MIN_INCREASE:.0%})")
+    for f in findings:
+        stamp = datetime.fromtimestamp(f["changed_at"]).strftime("%Y-%m-%d %H:%M")
+        if f["regression"]:
+            print(f"  {stamp}  {format_regression(f)}")
+        else:
+            print(f"  {stamp}  [ok] {f['name']} {f['previous_version']} -> {f['version']}: "
+                  f"p95 {_format_ms(f['before_p95_ms'])} -> {_format_ms(f['after_p95_ms'])} "
+                  f"(p={f['bootstrap_p_value']}, {f['effect']} effect)")
+    for name, st in detector.pending().items():
+        print(f"  [..] {name} {st['previous_version']} -> {st['version']}: only {st['samples']} samples so far")
+
+    with open(REGRESSION_REPORT_FILE, "w") as f:
+        json.dump({"timestamp": datetime.now().isoformat(), "days": args.days, "findings": findings,
+                   "pending": detector.pending()}, f, indent=2)
+    print(f"\nReport saved to: {REGRESSION_REPORT_FILE}")
+    sys.exit(1 if any(f["regression"] for f in findings) else 0)
+
+
+def anomalies_main(args):
+    """Seed the baselines with what precedes the window, then replay the window's probes"""
+    store = MetricsStore(args.store)
+    since = time.time() - args.days * 86400
+    detector = AnomalyDetector(max_events=None)
+    detector.seed(store, until=since)
+    for name, ts, healthy, total_ms, _ in store.samples(since):
+        detector({"name": name, "checked_at": ts, "healthy": bool(healthy), "response_time": total_ms,
+                  "status": "replay"})
+    store.close()
+
+    raised = [e for e in detector.events if e["event"] == "raised"]
+    print(f"Anomalies in the last {args.days:g} days over {len(detector.series)} series: {len(raised)} raised, "
+          f"{len(detector.active())} still active")
+    for event in detector.events:
+        print(f"  {datetime.fromtimestamp(event['at']).strftime('%Y-%m-%d %H:%M')}  {format_anomaly(event)}")
+
+    with open(ANOMALY_REPORT_FILE, "w") as f:
+        json.dump({"timestamp": datetime.now().isoformat(), "days": args.days,
+                   "events": list(detector.events), "active": detector.active()}, f, indent=2)
+    print(f"\nReport saved to: {ANOMALY_REPORT_FILE}")
+    sys.exit(1 if detector.active() else 0)
+
+
+def slo_main(args):
+    store = MetricsStore(args.store)
+    started = time.perf_counter()
+    report = slo_report(store)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    store.close()
+
+    print(f"SLOs over {SLO_PERIOD_DAYS} days - budget remaining and burn rate per window "
+          f"({len(report)} services, computed in {elapsed_ms:.0f}ms)")
+    print_slo_report(report)
+    alerts = [(s["service"], objective, a) for s in report for objective, o in s["objectives"].items()
+              for a in o["alerts"]]
+    for service, objective, alert in alerts:
+        print(f"  [{alert['severity'].upper()}] {service} {objective}: burning at >= {alert['threshold']}x "
+              f"over {alert['long']} and {alert['short']}")
+
+    with open(SLO_REPORT_FILE, "w") as f:
+        json.dump({"timestamp": datetime.now().isoformat(), "period_days": SLO_PERIOD_DAYS,
+                   "services": report}, f, indent=2)
+    print(f"\nReport saved to: {SLO_REPORT_FILE}")
+    sys.exit(1 if any(alert["severity"] == "page" for _, _, alert in alerts) else 0)
+
+
+def _store_sinks(args):
+    return [] if args.no_store else [MetricsStore(args.store)]
+
+
+def daemon_main(args):
+    print(f"[daemon] Monitoring {len(SERVICES)} services every {args.interval:.0f}s "
+          f"(+/-{args.jitter:.0%} jitter), report: {REPORT_FILE}", flush=True)
+    live = args.live and sys.stdout.isatty()
+    if args.live and not live:
+        print("[daemon] --live needs a terminal, printing one line per result instead", flush=True)
+    store_sinks = _store_sinks(args)
+    sinks = [LiveView() if live else print_result_line] + store_sinks
+    if args.jsonl:
+        sinks.append(JsonlSink(args.jsonl))
+    if args.metrics_port:
+        sinks.append(MetricsExporter(args.metrics_port))
+        print(f"[daemon] OpenMetrics endpoint: http://0.0.0.0:{args.metrics_port}/metrics", flush=True)
+    scheduler = None
+    if args.adaptive:
+        scheduler = AdaptiveScheduler(SERVICES, args.interval, args.min_interval, args.max_interval,
+                                      args.rps_budget)
+        print(f"[daemon] Adaptive scheduling: {args.min_interval:.0f}-{args.max_interval:.0f}s per service, "
+              f"budget {args.rps_budget:g} req/s", flush=True)
+    breakers = None if args.no_breakers else CircuitBreakers(verbose=not live)
+    anomalies = AnomalyDetector(verbose=not live)
+    if store_sinks:
+        anomalies.seed(store_sinks[0])
+        print(f"[daemon] Anomaly baselines seeded for {len(anomalies.series)} series", flush=True)
+    asyncio.run(run_daemon(args.interval, min(max(args.jitter, 0.0), 0.9), sinks, scheduler=scheduler,
+                           deep=not args.no_deep, breakers=breakers,
+                           regressions=RegressionDetector(verbose=not live), anomalies=anomalies))
+    print("[daemon] Stopped", flush=True)
+
+
+def main():
+    args = parse_args()
+    if args.history:
+        history_main(args)
+        return
+    if args.regressions:
+        regressions_main(args)
+        return
+    if args.anomalies:
+        anomalies_main(args)
+        return
+    if args.slo:
+        slo_main(args)
+        return
+    if args.compare_origin:
+        compare_main(args)
+        return
+    if args.compression_audit:
+        compression_main(args)
+        return
+    if args.daemon:
+        daemon_main(args)
+        return
+
+    print("=" * 70)
+    print("  RT BACKEND SERVICES - PRODUCTION MONITOR")
+    print(f"  {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 70)
+
+    sinks = _store_sinks(args)
+    # Same threshold as the daemon: one transient failure must not fast-fail the fleet
+    breakers = None if args.no_breakers else CircuitBreakers()
+    results, login_result = asyncio.run(run_checks(max(1, args.samples), sinks, not args.no_deep, breakers))
+    for sink in sinks:
+        sink.close()
+
+    unhealthy = [r for r in results if not r["healthy"]]
+    degraded = [r for r in results if r["degraded"]]
+    unprobed = [r for r in results if r.get("deep_probe") in ("blocked", "skipped")]
 
     # Final status
     print("\n" + "=" * 70)
-    all_ok = len(unhealthy) == 0 and login_result["success"]
+    all_ok = len(unhealthy) == 0 and len(degraded) == 0 and len(unprobed) == 0 and login_result["success"]
 
     if all_ok:
         print("  STATUS: ALL SYSTEMS OPERATIONAL")
     else:
         print("  STATUS: ISSUES DETECTED")
         print(f"  - Unhealthy services: {len(unhealthy)}")
+        print(f"  - Degraded services (latency budget): {len(degraded)}")
+        print(f"  - Services without deep probe results: {len(unprobed)}")
         print(f"  - Login test: {'PASS' if login_result['success'] else 'FAIL'}")
 
     print("=" * 70)
 
     # Save report
-    report = {
-        "timestamp": datetime.now().isoformat(),
-        "total_services": len(results),
-        "healthy_count": len(healthy),
-        "unhealthy_count": len(unhealthy),
-        "login_test": login_result,
-        "services": results
-    }
+    write_report(build_report(results, login_result))
 
-    with open("monitor-report.json", "w") as f:
-        json.dump(report, f, indent=2)
-
-    print(f"\nReport saved to: monitor-report.json")
+    print(f"\nReport saved to: {REPORT_FILE}")
 
     # Exit code for CI/CD
     sys.exit(0 if all_ok else 1)
 
+
 if __name__ == "__main__":
     main()
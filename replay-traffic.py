@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+RT Backend Services - Production traffic replay
+Rejoue des requetes enregistrees (logs d'acces nginx des bundles Elastic Beanstalk
+ou JSON lines) vers un environnement cible, en conservant leur rythme relatif,
+et mesure la latence par route.
+"""
+import argparse
+import asyncio
+import gzip
+import importlib.util
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+
+def _load_script(name, filename):
+    """Sibling scripts are not importable by name (hyphen), load them from their path"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+monitor = _load_script("monitor_services", "monitor-services.py")
+loadtest = _load_script("load_test", "load-test.py")
+
+REPORT_FILE = "replay-report.json"
+MAX_IN_FLIGHT = 64
+MAX_GAP = 60.0             # seconds; longer idle gaps in the log are shortened to this
+MAX_ROUTES = 500           # distinct routes tracked; the rest are counted under "(other)"
+ROUTE_SIGNIFICANT_FIGURES = 2  # per-route histograms at 1% precision: ~3.3k counters instead of ~23.5k
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# nginx "combined" (and EB "main") access log line
+ACCESS_LINE = re.compile(
+    r'^\S+ \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<method>[A-Z]+) (?P<target>\S+) HTTP/[\d.]+" (?P<status>\d{3}) '
+)
+# Path segments that are identifiers rather than routes
+ID_SEGMENTS = [
+    re.compile(r"^[0-9a-f]{24}$"),                                              # MongoDB ObjectId
+    re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.I),  # UUID
+    re.compile(r"^\d+$"),
+    re.compile(r"^[A-Z]{2,}-[\w-]*\d[\w-]*$"),                                   # references, e.g. CMD-2024-001
+]
+
+
+def parse_access_line(line):
+    match = ACCESS_LINE.match(line)
+    if not match:
+        return None
+    try:
+        ts = datetime.strptime(match["time"], "%d/%b/%Y:%H:%M:%S %z").timestamp()
+    except ValueError:
+        return None
+    return {"ts": ts, "method": match["method"], "target": match["target"], "status": int(match["status"])}
+
+
+def _timestamp(value):
+    if isinstance(value, (int, float)):
+        return value / 1000.0 if value > 1e11 else float(value)
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def parse_json_line(line):
+    """{"ts"|"timestamp"|"time", "method", "path"|"url", "headers"?, "body"?, "status"?}"""
+    try:
+        data = json.loads(line)
+        ts = _timestamp(data.get("ts", data.get("timestamp", data.get("time"))))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    target = data.get("url") or data.get("path")
+    if not isinstance(target, str) or not target or not isinstance(data.get("method"), str) or not data["method"]:
+        return None
+    headers = data.get("headers") or {}
+    if not isinstance(headers, dict):
+        return None
+    body = data.get("body")
+    return {"ts": ts, "method": data["method"].upper(), "target": target, "status": data.get("status"),
+            "headers": headers,
+            "body": body if body is None or isinstance(body, str) else json.dumps(body)}
+
+
+def read_records(paths):
+    """Stream request records from log files (plain, .gz or "-" for stdin), one line at a time"""
+    for path in paths:
+        if path == "-":
+            handle = sys.stdin
+        elif path.endswith(".gz"):
+            handle = gzip.open(path, "rt", encoding="utf-8", errors="replace")
+        else:
+            handle = open(path, encoding="utf-8", errors="replace")
+        try:
+            for line in handle:
+                line = line.strip()
+                record = parse_json_line(line) if line.startswith("{") else parse_access_line(line)
+                if record:
+                    yield record
+        finally:
+            if handle is not sys.stdin:
+                handle.close()
+
+
+def route_of(path):
+    """Route template of a request path: query dropped, identifier segments replaced by :id"""
+    segments = urlsplit(path).path.split("/")
+    return "/".join(":id" if any(p.match(s) for p in ID_SEGMENTS) else s for s in segments) or "/"
+
+
+class Rewriter:
+    """
+    Maps a recorded request onto the target environment: absolute URLs have their
+    host swapped through host_map (else the default base), relative paths go to the
+    default base; recorded credentials are dropped and replaced by the demo token.
+    """
+
+    DROPPED_HEADERS = {"authorization", "cookie", "host", "content-length", "connection", "x-amz-cf-id"}
+
+    def __init__(self, base_url, host_map=None):
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.host_map = {host: url.rstrip("/") for host, url in (host_map or {}).items()}
+
+    def url(self, target):
+        parts = urlsplit(target)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        base = self.host_map.get(parts.netloc) if parts.netloc else None
+        base = base or self.base_url
+        return base + path if base else None
+
+    def headers(self, record, token):
+        headers = {name: value for name, value in (record.get("headers") or {}).items()
+                   if name.lower() not in self.DROPPED_HEADERS}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        if record.get("body") is not None:
+            headers.setdefault("Content-Type", "application/json")
+        return headers
+
+
+class RouteStats:
+    """
+    Per-route latency histograms, status classes and recorded-vs-replayed mismatches.
+    Route histograms are kept at ROUTE_SIGNIFICANT_FIGURES so MAX_ROUTES of them stay
+    a few MB; the overall histogram keeps full precision.
+    """
+
+    def __init__(self, max_routes=MAX_ROUTES):
+        self.max_routes = max_routes
+        self.routes = {}
+
+    def record(self, method, route, latency_us, status, recorded_status):
+        key = f"{method} {route}"
+        stats = self.routes.get(key)
+        if stats is None:
+            if len(self.routes) >= self.max_routes:
+                key = "(other)"
+                stats = self.routes.get(key)
+            if stats is None:
+                histogram = loadtest.HdrHistogram(significant_figures=ROUTE_SIGNIFICANT_FIGURES)
+                stats = self.routes[key] = {"histogram": histogram, "statuses": {}, "errors": 0, "mismatches": 0}
+        if isinstance(status, int):
+            stats["histogram"].record(latency_us)
+            status_class = f"{status // 100}xx"
+        else:
+            stats["errors"] += 1
+            status_class = status
+        stats["statuses"][status_class] = stats["statuses"].get(status_class, 0) + 1
+        if isinstance(recorded_status, int) and isinstance(status, int) and recorded_status // 100 != status // 100:
+            stats["mismatches"] += 1
+
+    def summary(self):
+        result = {}
+        for key, stats in sorted(self.routes.items(), key=lambda item: -item[1]["histogram"].total):
+            histogram = stats["histogram"]
+            result[key] = {"count": histogram.total + stats["errors"], "errors": stats["errors"],
+                           "statuses": stats["statuses"], "status_mismatches": stats["mismatches"],
+                           "p50_ms": round(histogram.value_at(50) / 1000, 2),
+                           "p95_ms": round(histogram.value_at(95) / 1000, 2),
+                           "p99_ms": round(histogram.value_at(99) / 1000, 2),
+                           "max_ms": round(histogram.max / 1000, 2)}
+        return result
+
+
+async def replay(records, rewriter, speed=1.0, max_in_flight=MAX_IN_FLIGHT, methods=SAFE_METHODS,
+                 include=None, session=None, client=None, limit=None, max_gap=MAX_GAP):
+    """
+    Replay `records` (any iterable, consumed lazily) against the target. With speed > 0
+    each request is sent at its recorded offset divided by `speed`; speed 0 sends as
+    fast as max_in_flight allows. Idle gaps longer than max_gap (between two log files,
+    or overnight) are shortened to max_gap, and out-of-order records are sent at once.
+    Latency is measured from the scheduled time, so a
+    target that falls behind shows up in the numbers rather than slowing the replay.
+    Memory stays constant: at most max_in_flight requests are held at any time.
+    """
+    loop = asyncio.get_running_loop()
+    stats = RouteStats()
+    overall = loadtest.HdrHistogram()
+    skipped = {"method": 0, "filtered": 0, "unmapped": 0}
+    gate = asyncio.Semaphore(max_in_flight)
+    in_flight = set()
+    lag = loadtest.HdrHistogram()
+    previous_ts = started = None
+    offset = 0.0               # recorded seconds since the first record, gaps capped
+    sent = 0
+
+    async def one(record, url, scheduled):
+        try:
+            token = await session.token() if session else None
+            body = record["body"].encode() if record.get("body") is not None else None
+            try:
+                response = await client.request(record["method"], url, headers=rewriter.headers(record, token),
+                                                body=body)
+                status = response.status
+                if status == 401 and session:
+                    session.invalidate()
+            except asyncio.TimeoutError:
+                status = "timeout"
+            except (OSError, monitor.ProbeError, asyncio.IncompleteReadError) as e:
+                status = type(e).__name__
+            latency_us = (loop.time() - scheduled) * 1e6
+            stats.record(record["method"], route_of(record["target"]), latency_us, status, record.get("status"))
+            if isinstance(status, int):
+                overall.record(latency_us)
+        finally:
+            gate.release()
+
+    for record in records:
+        if record["method"] not in methods:
+            skipped["method"] += 1
+            continue
+        if include and not include.search(record["target"]):
+            skipped["filtered"] += 1
+            continue
+        url = rewriter.url(record["target"])
+        if not url:
+            skipped["unmapped"] += 1
+            continue
+        if limit is not None and sent >= limit:
+            break
+
+        if started is None:
+            previous_ts, started = record["ts"], loop.time()
+        offset += min(max(0.0, record["ts"] - previous_ts), max_gap)
+        previous_ts = record["ts"]
+        scheduled = started + offset / speed if speed > 0 else None
+        if scheduled is not None and scheduled > loop.time():
+            await asyncio.sleep(scheduled - loop.time())
+        # Backpressure: the log is not read further while max_in_flight requests are pending
+        await gate.acquire()
+        if scheduled is None:
+            scheduled = loop.time()
+        lag.record(max(0.0, loop.time() - scheduled) * 1e6)
+        task = asyncio.create_task(one(record, url, scheduled))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        sent += 1
+
+    if in_flight:
+        await asyncio.wait(in_flight)
+    elapsed = loop.time() - started if started is not None else 0.0
+    return {
+        "sent": sent,
+        "skipped": skipped,
+        "elapsed_s": round(elapsed, 2),
+        "recorded_span_s": round(offset, 2),
+        "throughput_rps": round(sent / elapsed, 2) if elapsed else None,
+        "latency": overall.summary(),
+        "schedule_lag_p99_ms": round(lag.value_at(99) / 1000, 2),
+        "routes": stats.summary(),
+    }
+
+
+def print_routes(routes, top=25):
+    print(f"  {'Route':50} {'Count':>7} {'Err':>5} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for key, route in list(routes.items())[:top]:
+        print(f"  {key[:50]:50} {route['count']:>7} {route['errors']:>5} {monitor._format_ms(route['p50_ms']):>8} "
+              f"{monitor._format_ms(route['p95_ms']):>8} {monitor._format_ms(route['p99_ms']):>8}")
+    if len(routes) > top:
+        print(f"  ... {len(routes) - top} more routes in the report")
+
+
+async def run(args):
+    client = monitor.HttpClient(per_host_limit=args.max_in_flight, idle_per_host=args.max_in_flight)
+    session = monitor.SessionCache(client, auth_url=args.auth_url) if args.auth else None
+    host_map = None
+    if args.host_map:
+        with open(args.host_map) as f:
+            host_map = json.load(f)
+    base_url = monitor.SERVICES[args.service] if args.service else args.target
+    methods = SAFE_METHODS + (("POST", "PUT", "PATCH", "DELETE") if args.allow_writes else ())
+    try:
+        return await replay(read_records(args.logs), Rewriter(base_url, host_map), args.speed, args.max_in_flight,
+                            methods, re.compile(args.include) if args.include else None, session, client,
+                            args.limit, args.max_gap)
+    finally:
+        await client.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded requests against a target environment")
+    parser.add_argument("logs", nargs="+", help="access logs or JSON-lines request logs (.gz ok, - for stdin)")
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument("--service", help="target service from the monitor registry, e.g. \"Orders API\"")
+    where.add_argument("--target", help="target base URL, e.g. http://localhost:3007")
+    parser.add_argument("--host-map", metavar="PATH",
+                        help="JSON {recorded host: target base URL} for logs with absolute URLs")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="time compression: 1 = recorded pace, 10 = 10x faster, 0 = as fast as possible")
+    parser.add_argument("--max-gap", type=float, default=MAX_GAP,
+                        help=f"longest idle gap kept from the log, in recorded seconds (default: {MAX_GAP:g})")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT,
+                        help=f"concurrent requests (default: {MAX_IN_FLIGHT})")
+    parser.add_argument("--include", metavar="REGEX", help="only replay request targets matching REGEX")
+    parser.add_argument("--limit", type=int, help="stop after N requests")
+    parser.add_argument("--allow-writes", action="store_true",
+                        help="also replay POST/PUT/PATCH/DELETE (never against production data you care about)")
+    parser.add_argument("--auth", action="store_true", help="replace recorded credentials by the demo account token")
+    parser.add_argument("--auth-url", help="auth service of the target environment (default: production Auth API)")
+    parser.add_argument("--output", default=REPORT_FILE, help=f"JSON report (default: {REPORT_FILE})")
+    args = parser.parse_args(argv)
+    if not (args.service or args.target or args.host_map):
+        parser.error("one of --service, --target or --host-map is required")
+    return args
+
+
+def main():
+    args = parse_args()
+    print("=" * 70)
+    print(f"  TRAFFIC REPLAY - {', '.join(args.logs)} -> {args.service or args.target or args.host_map} "
+          f"(speed {args.speed:g}x)")
+    print("=" * 70)
+
+    started = time.perf_counter()
+    result = asyncio.run(run(args))
+    print(f"  sent {result['sent']} requests in {result['elapsed_s']}s ({result['throughput_rps'] or 0} req/s, "
+          f"recorded over {result['recorded_span_s']}s), skipped {result['skipped']}, "
+          f"schedule lag p99 {result['schedule_lag_p99_ms']}ms")
+    print_routes(result["routes"])
+
+    with open(args.output, "w") as f:
+        json.dump(dict(result, timestamp=datetime.now().isoformat(), logs=args.logs,
+                       wall_s=round(time.perf_counter() - started, 2)), f, indent=2)
+    print(f"\nReport saved to: {args.output}")
+
+    errors = sum(route["errors"] for route in result["routes"].values())
+    sys.exit(0 if not errors else 1)
+
+
+if __name__ == "__main__":
+    main()
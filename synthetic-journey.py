@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+RT Backend Services - Synthetic transport-order journey
+Chronometre le parcours complet d'une commande de transport sur un tenant de demo :
+login -> creation commande -> dispatch Affret IA -> tracking -> eCMR -> nettoyage
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+
+def _load_monitor():
+    """monitor-services.py is not importable by name (hyphen), load it from its path"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "monitor-services.py")
+    spec = importlib.util.spec_from_file_location("monitor_services", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+monitor = _load_monitor()
+
+REPORT_FILE = "synthetic-journey-report.json"
+
+# Each step: (name, service, method, path template, accepted HTTP statuses).
+# A step whose path is None is skipped for that target. A freshly created order has
+# no position or eCMR yet, so 404 on those reads still exercises the whole read path.
+JOURNEY_TARGETS = {
+    "prod": {
+        "services": {
+            "auth": monitor.SERVICES["Auth API"],
+            "orders": monitor.SERVICES["Orders API"],
+            "affret": monitor.SERVICES["Affret IA API"],
+            "tracking": monitor.SERVICES["Tracking API"],
+            "ecmr": monitor.SERVICES["Orders API"],
+        },
+        "steps": [
+            ("create_order", "orders", "POST", "/api/v1/orders", (200, 201)),
+            ("dispatch", "affret", "POST", "/api/v1/affret-ia/search", (200, 201)),
+            ("tracking", "tracking", "GET", "/api/v1/tracking/{order_id}/current", (200, 404)),
+            ("ecmr", "ecmr", "GET", "/api/v1/orders/{order_id}/ecmr", (200, 404)),
+        ],
+        "cleanup": ("orders", "DELETE", "/api/v1/orders/{order_id}"),
+    },
+    # docker-compose.yml stack (authz, core-orders, affret-ia, geo-tracking)
+    "local": {
+        "services": {
+            "auth": "http://localhost:3002",
+            "orders": "http://localhost:3007",
+            "affret": "http://localhost:3010",
+            "tracking": "http://localhost:3016",
+            "ecmr": "http://localhost:3007",
+        },
+        "steps": [
+            ("create_order", "orders", "POST", "/api/orders", (200, 201)),
+            ("dispatch", "affret", "GET", "/api/affret-ia", (200,)),
+            ("tracking", "tracking", "GET", "/api/tracking/order/{order_id}", (200, 404)),
+            ("ecmr", "ecmr", None, None, ()),
+        ],
+        "cleanup": ("orders", "DELETE", "/api/orders/{order_id}"),
+    },
+}
+
+
+def demo_order(run_id):
+    """Payload of the synthetic order, tagged so leftovers are easy to find"""
+    pickup = datetime.now(timezone.utc) + timedelta(days=2)
+    return {
+        "reference": f"SYNTHETIC-{run_id}",
+        "organizationId": "demo-agrofrance",
+        "createdBy": "synthetic-journey",
+        "pickup": {"name": "Synthetic pickup", "street": "1 rue du Test", "city": "Lyon",
+                   "postalCode": "69001", "country": "France"},
+        "delivery": {"name": "Synthetic delivery", "street": "2 rue du Test", "city": "Paris",
+                     "postalCode": "75001", "country": "France"},
+        "pickupDate": pickup.isoformat(),
+        "deliveryDate": (pickup + timedelta(days=1)).isoformat(),
+        "cargo": {"type": "palette", "quantity": 1, "weight": {"value": 100, "unit": "kg"},
+                  "description": "Synthetic monitoring order - safe to delete"},
+    }
+
+
+def _order_id(response):
+    try:
+        data = response.json()
+    except ValueError:
+        return None
+    order = data.get("data", data) if isinstance(data, dict) else {}
+    return order.get("_id") or order.get("id") if isinstance(order, dict) else None
+
+
+async def _timed(client, method, url, headers, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else None
+    if body is not None:
+        headers = dict(headers, **{"Content-Type": "application/json"})
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, headers=headers, body=body)
+        return response, round((time.perf_counter() - started) * 1000, 2), None
+    except asyncio.TimeoutError:
+        return None, round((time.perf_counter() - started) * 1000, 2), f"No response within {client.timeout:.0f}s"
+    except (OSError, monitor.ProbeError, asyncio.IncompleteReadError) as e:
+        return None, round((time.perf_counter() - started) * 1000, 2), str(e)[:100] or type(e).__name__
+
+
+async def run_journey(client, target, run_id):
+    """Run the journey once; the order is deleted whatever step fails"""
+    services = target["services"]
+    steps = []
+    started = time.perf_counter()
+
+    # Every journey logs in for real: login is part of the user-facing flow
+    login_started = time.perf_counter()
+    login_result, token, _ = await monitor.login(client, services["auth"])
+    steps.append({"step": "login", "service": "auth", "status": "ok" if token else "error",
+                  "ok": bool(token), "ms": round((time.perf_counter() - login_started) * 1000, 2),
+                  "error": None if token else login_result["message"]})
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+
+    order_id = None
+    try:
+        for name, service, method, path, accepted in target["steps"]:
+            if not steps[-1]["ok"]:
+                steps.append({"step": name, "service": service, "status": "blocked", "ok": False,
+                              "ms": None, "error": f"Blocked by {steps[-1]['step']}"})
+                continue
+            if path is None:
+                steps.append({"step": name, "service": service, "status": "skipped", "ok": True,
+                              "ms": None, "error": None})
+                continue
+
+            payload = None
+            if name == "create_order":
+                payload = demo_order(run_id)
+            elif name == "dispatch" and method == "POST":
+                payload = {"orderId": order_id, "pickupPostalCode": "69001", "deliveryPostalCode": "75001",
+                           "pickupDate": demo_order(run_id)["pickupDate"], "vehicleType": "semi",
+                           "cargoType": "palette"}
+
+            url = services[service] + path.format(order_id=order_id)
+            response, ms, error = await _timed(client, method, url, headers, payload)
+            ok = response is not None and response.status in accepted
+            if name == "create_order" and ok:
+                order_id = _order_id(response)
+                if not order_id:
+                    ok, error = False, "No order id in response"
+            steps.append({"step": name, "service": service,
+                          "status": response.status if response else "error", "ok": ok, "ms": ms,
+                          "error": error or (None if ok else f"HTTP {response.status}")})
+    finally:
+        cleanup = None
+        if order_id:
+            service, method, path = target["cleanup"]
+            response, ms, error = await _timed(client, method, services[service] + path.format(order_id=order_id),
+                                               headers)
+            cleanup = {"order_id": order_id, "ok": response is not None and response.status < 400,
+                       "ms": ms, "error": error or (None if response.status < 400 else f"HTTP {response.status}")}
+
+    return {
+        "run_id": run_id,
+        "ok": all(s["ok"] for s in steps),
+        "end_to_end_ms": round(sum(s["ms"] for s in steps if s["ms"] is not None), 2),
+        "wall_ms": round((time.perf_counter() - started) * 1000, 2),
+        "steps": steps,
+        "cleanup": cleanup,
+    }
+
+
+def summarize(journeys):
+    """Per-step and end-to-end latency percentiles over successful runs"""
+    summary = {}
+    step_names = [s["step"] for s in journeys[0]["steps"]] if journeys else []
+    for name in step_names:
+        values = [s["ms"] for j in journeys for s in j["steps"] if s["step"] == name and s["ok"] and s["ms"]]
+        summary[name] = {"p50_ms": monitor.percentile(values, 50), "p95_ms": monitor.percentile(values, 95),
+                         "failures": sum(1 for j in journeys for s in j["steps"] if s["step"] == name and not s["ok"])}
+    totals = [j["end_to_end_ms"] for j in journeys if j["ok"]]
+    summary["end_to_end"] = {"p50_ms": monitor.percentile(totals, 50), "p95_ms": monitor.percentile(totals, 95),
+                             "failures": sum(1 for j in journeys if not j["ok"])}
+    return summary
+
+
+def load_target(name, path=None):
+    if path:
+        with open(path) as f:
+            return json.load(f)
+    return JOURNEY_TARGETS[name]
+
+
+async def run(target, runs, pause):
+    client = monitor.HttpClient()
+    journeys = []
+    try:
+        for i in range(runs):
+            run_id = f"{int(time.time())}-{i + 1}"
+            journey = await run_journey(client, target, run_id)
+            journeys.append(journey)
+            steps = "  ".join(f"{s['step']}:{monitor._format_ms(s['ms'])}" if s["ok"] else f"{s['step']}:FAIL"
+                              for s in journey["steps"])
+            print(f"  [{'OK' if journey['ok'] else 'FAIL':4}] run {i + 1}/{runs}  "
+                  f"total {monitor._format_ms(journey['end_to_end_ms'])}  {steps}", flush=True)
+            if journey["cleanup"] and not journey["cleanup"]["ok"]:
+                print(f"         [!] cleanup of order {journey['cleanup']['order_id']} failed: "
+                      f"{journey['cleanup']['error']}")
+            if i < runs - 1:
+                await asyncio.sleep(pause)
+    finally:
+        await client.close()
+    return journeys
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic end-to-end transport-order journey")
+    parser.add_argument("--target", choices=sorted(JOURNEY_TARGETS), default="prod",
+                        help="environment to run against (default: prod)")
+    parser.add_argument("--target-file", metavar="PATH",
+                        help="JSON file with the same shape as a JOURNEY_TARGETS entry")
+    parser.add_argument("--runs", type=int, default=1, help="number of journeys (default: 1)")
+    parser.add_argument("--pause", type=float, default=1.0, help="seconds between journeys (default: 1)")
+    args = parser.parse_args()
+
+    target = load_target(args.target, args.target_file)
+    print("=" * 70)
+    print(f"  SYNTHETIC JOURNEY - {args.target_file or args.target} - {args.runs} run(s)")
+    print("=" * 70)
+
+    journeys = asyncio.run(run(target, max(1, args.runs), args.pause))
+    summary = summarize(journeys)
+
+    print("\n" + "-" * 70)
+    print(f"  {'Step':15} {'p50':>8} {'p95':>8} {'Failures':>9}")
+    for name, stats in summary.items():
+        print(f"  {name:15} {monitor._format_ms(stats['p50_ms']):>8} {monitor._format_ms(stats['p95_ms']):>8} "
+              f"{stats['failures']:>9}")
+
+    with open(REPORT_FILE, "w") as f:
+        json.dump({"timestamp": datetime.now().isoformat(), "target": args.target_file or args.target,
+                   "summary": summary, "journeys": journeys}, f, indent=2)
+    print(f"\nReport saved to: {REPORT_FILE}")
+
+    sys.exit(0 if all(j["ok"] for j in journeys) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+GetMetricData batching of analyze-cpu-metrics.py (against a botocore Stubber) and
+the local MetricsCache (against a fake CloudWatch counting its calls)
+
+Run with: python -m unittest discover -s tests -p "test_*.py"
+"""
+import importlib.util
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import boto3
+from botocore.stub import Stubber
+
+
+def _load_script(name, filename):
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), filename)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+cpu = _load_script("analyze_cpu_metrics", "analyze-cpu-metrics.py")
+
+START = datetime(2026, 3, 1, tzinfo=timezone.utc)
+END = START + timedelta(hours=3)
+HOURS = [START + timedelta(hours=h) for h in range(3)]
+
+
+class FetchCpuMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cloudwatch = boto3.client('cloudwatch', region_name=cpu.REGION,
+                                       aws_access_key_id='test', aws_secret_access_key='test')
+        self.stubber = Stubber(self.cloudwatch)
+        self.stubber.activate()
+
+    def tearDown(self):
+        self.stubber.deactivate()
+
+    def expect(self, queries, results, next_token=None, token=None):
+        params = {'MetricDataQueries': queries, 'StartTime': START, 'EndTime': END,
+                  'ScanBy': 'TimestampAscending'}
+        if token:
+            params['NextToken'] = token
+        response = {'MetricDataResults': results}
+        if next_token:
+            response['NextToken'] = next_token
+        self.stubber.add_response('get_metric_data', response, params)
+
+    def test_splits_queries_into_batches_of_500_and_follows_next_token(self):
+        # 300 instances x 2 statistics = 600 queries -> batches of 500 and 100
+        ids = [f"i-{n:04d}" for n in range(300)]
+        queries = cpu.build_metric_queries(ids)
+        self.assertEqual(len(queries), 600)
+        first, second = queries[:cpu.MAX_METRICS_PER_REQUEST], queries[cpu.MAX_METRICS_PER_REQUEST:]
+
+        # First batch: each series is split across two pages
+        self.expect(first, [{'Id': q['Id'], 'StatusCode': 'PartialData', 'Timestamps': HOURS[:2],
+                             'Values': [1.0, 2.0]} for q in first], next_token='page-2')
+        self.expect(first, [{'Id': q['Id'], 'StatusCode': 'Complete', 'Timestamps': HOURS[2:],
+                             'Values': [3.0]} for q in first], token='page-2')
+        self.expect(second, [{'Id': q['Id'], 'StatusCode': 'Complete', 'Timestamps': HOURS,
+                              'Values': [4.0, 5.0, 6.0]} for q in second])
+
+        series = cpu.fetch_cpu_metrics(ids, START, END, cloudwatch=self.cloudwatch)
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(set(series), set(ids))
+        self.assertEqual(series['i-0000']['Average'], list(zip(HOURS, [1.0, 2.0, 3.0])))
+        self.assertEqual(series['i-0249']['Maximum'], list(zip(HOURS, [1.0, 2.0, 3.0])))
+        self.assertEqual(series['i-0250']['Average'], list(zip(HOURS, [4.0, 5.0, 6.0])))
+        self.assertEqual(series['i-0299']['Maximum'], list(zip(HOURS, [4.0, 5.0, 6.0])))
+
+    def test_failed_batch_leaves_its_instances_empty(self):
+        ids = [f"i-{n:04d}" for n in range(260)]
+        queries = cpu.build_metric_queries(ids)
+        self.stubber.add_client_error('get_metric_data', 'Throttling', 'Rate exceeded')
+        self.expect(queries[500:], [{'Id': q['Id'], 'Timestamps': HOURS[:1], 'Values': [7.0]}
+                                    for q in queries[500:]])
+
+        failed = set()
+        series = cpu.fetch_cpu_metrics(ids, START, END, cloudwatch=self.cloudwatch, failed=failed)
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(failed, set(ids[:250]))
+        self.assertEqual(series['i-0000']['Average'], [])
+        self.assertEqual(series['i-0259']['Average'], [(HOURS[0], 7.0)])
+
+
+class FakeCloudWatch:
+    """get_metric_data returning the hour of day as value; datapoints appear `delay` s after their period closes"""
+
+    def __init__(self, now, delay=0):
+        self.now = now
+        self.delay = delay
+        self.calls = []
+
+    def get_metric_data(self, MetricDataQueries, StartTime, EndTime, ScanBy, NextToken=None):
+        self.calls.append((StartTime, EndTime))
+        period = MetricDataQueries[0]['MetricStat']['Period']
+        ts = int(StartTime.timestamp())
+        ts += -ts % period
+        stamps = []
+        while ts < EndTime.timestamp():
+            if ts + period + self.delay <= self.now.timestamp():
+                stamps.append(datetime.fromtimestamp(ts, timezone.utc))
+            ts += period
+        return {'MetricDataResults': [{'Id': q['Id'], 'Timestamps': stamps,
+                                       'Values': [float(stamp.hour) for stamp in stamps]}
+                                      for q in MetricDataQueries]}
+
+
+class MetricsCacheTest(unittest.TestCase):
+    IDS = ['i-0001', 'i-0002']
+    NOW = datetime(2026, 3, 1, 12, 30, tzinfo=timezone.utc)
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def run_cached(self, now, days, cloudwatch=None):
+        cloudwatch = cloudwatch or FakeCloudWatch(now)
+        cache = cpu.MetricsCache(self.path)
+        try:
+            series = cpu.cached_cpu_metrics(self.IDS, now - timedelta(days=days), now, cache,
+                                            cloudwatch=cloudwatch, now=int(now.timestamp()))
+        finally:
+            cache.close()
+        return series, cloudwatch.calls
+
+    def direct(self, now, days):
+        return cpu.fetch_cpu_metrics(self.IDS, now - timedelta(days=days), now, cloudwatch=FakeCloudWatch(now))
+
+    def test_repeat_run_makes_no_call(self):
+        first, calls = self.run_cached(self.NOW, 7)
+        self.assertEqual(len(calls), 1)
+        again, calls = self.run_cached(self.NOW, 7)
+        self.assertEqual(calls, [])
+        self.assertEqual(again, first)
+        self.assertEqual(again, self.direct(self.NOW, 7))
+
+    def test_widened_window_fetches_only_the_head(self):
+        self.run_cached(self.NOW, 7)
+        series, calls = self.run_cached(self.NOW, 30)
+        self.assertEqual(len(calls), 1)
+        # the head ends where the 7-day window started (first whole hour)
+        self.assertEqual(calls[0][1], self.NOW - timedelta(days=7) + timedelta(minutes=30))
+        self.assertEqual(series, self.direct(self.NOW, 30))
+        _, calls = self.run_cached(self.NOW, 30)
+        self.assertEqual(calls, [])
+
+    def test_shifted_window_fetches_only_the_tail(self):
+        self.run_cached(self.NOW, 7)
+        later = self.NOW + timedelta(hours=3)
+        series, calls = self.run_cached(later, 7)
+        self.assertEqual(len(calls), 1)
+        self.assertGreater(calls[0][0], later - timedelta(hours=4))
+        self.assertEqual(series, self.direct(later, 7))
+        _, calls = self.run_cached(later, 7)
+        self.assertEqual(calls, [])
+
+    def test_late_datapoints_are_fetched_on_a_later_run(self):
+        # The 11:00 period closes at 12:00 but is only published 10 minutes later
+        now = datetime(2026, 3, 1, 12, 5, tzinfo=timezone.utc)
+        series, _ = self.run_cached(now, 1, FakeCloudWatch(now, delay=600))
+        self.assertEqual(series['i-0001']['Average'][-1][0].hour, 10)
+        later = now + timedelta(minutes=20)
+        series, calls = self.run_cached(later, 1, FakeCloudWatch(later, delay=600))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(series['i-0001']['Average'][-1][0].hour, 11)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+Open and closed models of load-test.py against its local stand-in server, the
+coordinated-omission correction, and how capacity-analysis.py reports a step.
+
+Run with: python -m unittest discover -s tests -p "test_*.py"
+"""
+import asyncio
+import importlib.util
+import os
+import unittest
+
+
+def _load_script(name, filename):
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), filename)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+loadtest = _load_script("load_test", "load-test.py")
+capacity = _load_script("capacity_analysis", "capacity-analysis.py")
+
+
+async def against_stand_in(delay_ms, workers=None, **kwargs):
+    server = loadtest.StandInServer(delay_ms, workers)
+    await server.start()
+    try:
+        target = {"service": "stand-in", "url": server.url + "/health", "method": "GET", "body": None}
+        return await loadtest.run_load(target, duration=0.5, warmup=0.1, **kwargs)
+    finally:
+        await server.close()
+
+
+class HdrHistogramTest(unittest.TestCase):
+
+    def test_record_corrected_backfills_the_requests_a_stall_held_back(self):
+        histogram = loadtest.HdrHistogram()
+        histogram.record_corrected(100_000, 10_000)
+        self.assertEqual(histogram.total, 10)   # 100, 90, ..., 10 ms
+        self.assertEqual(histogram.min // 1000, 10)
+        histogram.record_corrected(5_000, 10_000)
+        self.assertEqual(histogram.total, 11)
+
+
+class RunLoadTest(unittest.TestCase):
+
+    def test_open_model_holds_the_rate_without_correction(self):
+        result = asyncio.run(against_stand_in(5.0, model="open", rate=100.0))
+        self.assertEqual(result["errors"], {})
+        self.assertAlmostEqual(result["completed"], 50, delta=10)
+        self.assertGreaterEqual(result["latency"]["p50_ms"], 5.0)
+        self.assertNotIn("histogram_corrected", result)
+        self.assertNotIn("co_correction", result)
+
+    def test_closed_model_reports_raw_and_corrected_latency(self):
+        result = asyncio.run(against_stand_in(5.0, workers=1, model="closed", concurrency=4))
+        self.assertEqual(result["errors"], {})
+        raw, corrected = result["histogram"], result["histogram_corrected"]
+        self.assertEqual(result["latency"], raw.summary())
+        self.assertEqual(result["latency_corrected"], corrected.summary())
+        self.assertEqual(result["percentile_curve"][-1]["value_ms"], round(raw.value_at(100) / 1000, 3))
+        # One worker of the stand-in serves the four clients in turn: each waits ~4 x 5 ms
+        self.assertGreaterEqual(result["latency"]["p50_ms"], 15.0)
+        co = result["co_correction"]
+        self.assertEqual(co["source"], "mean response + think time")
+        self.assertAlmostEqual(co["expected_interval_ms"], raw.mean() / 1000, places=2)
+        self.assertGreaterEqual(corrected.total, raw.total)
+
+    def test_configured_interval_drives_the_correction(self):
+        result = asyncio.run(against_stand_in(5.0, model="closed", concurrency=2, expected_interval_ms=1.0))
+        self.assertEqual(result["co_correction"], {"expected_interval_ms": 1.0, "source": "configured"})
+        # Every response of at least 5 ms stands for at least 4 more requests at a 1 ms pace
+        self.assertGreaterEqual(result["histogram_corrected"].total, 5 * result["histogram"].total)
+        self.assertLess(result["latency_corrected"]["p50_ms"], result["latency"]["p50_ms"])
+
+
+class SummarizeStepTest(unittest.TestCase):
+
+    def test_raw_and_corrected_values_come_from_their_own_histogram(self):
+        result = asyncio.run(against_stand_in(5.0, workers=1, model="closed", concurrency=4))
+        step = capacity.summarize_step(result, 99)
+        self.assertEqual(step["mean_ms"], result["latency"]["mean_ms"])
+        self.assertEqual(step["latency_ms"], round(result["histogram"].value_at(99) / 1000, 2))
+        self.assertEqual(step["corrected_mean_ms"], result["latency_corrected"]["mean_ms"])
+        self.assertEqual(step["corrected_latency_ms"], round(result["histogram_corrected"].value_at(99) / 1000, 2))
+        self.assertEqual(step["error_rate"], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
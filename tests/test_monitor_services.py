@@ -0,0 +1,278 @@
+"""
+Stateful and statistical parts of monitor-services.py: the history store and its
+rollups, circuit breakers, SLO burn rates and the regression/anomaly detectors.
+
+Run with: python -m unittest discover -s tests -p "test_*.py"
+"""
+import importlib.util
+import math
+import os
+import random
+import tempfile
+import unittest
+
+
+def _load_script(name, filename):
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), filename)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+monitor = _load_script("monitor_services", "monitor-services.py")
+
+T0 = 1_772_400_000   # a whole day (and so a whole minute and hour) in epoch seconds
+
+
+def probe(name, ts, latency_ms=100.0, healthy=True, version="1.0.0", mongodb="N/A"):
+    """A /health result as check_service returns it"""
+    timings = {"dns_ms": 0.0, "connect_ms": 0.0, "tls_ms": 0.0, "ttfb_ms": latency_ms,
+               "total_ms": latency_ms, "bytes": 100, "reused": True} if healthy else None
+    result = monitor._result(name, f"https://{name}", healthy, "healthy" if healthy else "error",
+                             version, mongodb, timings, None if healthy else "HTTP 503")
+    result["checked_at"] = ts
+    return result
+
+
+class StoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.store = monitor.MetricsStore(self.path)
+
+    def tearDown(self):
+        self.store.db.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+
+class MetricsStoreTest(StoreTestCase):
+
+    def test_rollup_splits_samples_at_the_minute_boundary(self):
+        self.store(probe("A", T0 + 59.9, 100.0))
+        self.store(probe("A", T0 + 60.0, 300.0))
+        self.store(probe("A", T0 + 60.5, healthy=False))
+        self.store.flush(now=T0 + 120)
+
+        rows = self.store.query("A", T0, T0 + 120, resolution=60)
+        self.assertEqual([(r["bucket"], r["count"], r["errors"]) for r in rows],
+                         [(T0, 1, 0), (T0 + 60, 2, 1)])
+        self.assertEqual(rows[0]["p95"], 100.0)
+        self.assertEqual(rows[1]["p95"], 300.0)
+
+    def test_open_bucket_is_rolled_up_once_closed(self):
+        self.store(probe("A", T0 + 10))
+        self.store.flush(now=T0 + 59)
+        self.assertEqual(self.store.query("A", T0, T0 + 60, resolution=60), [])
+
+        self.store(probe("A", T0 + 50))
+        self.store.flush(now=T0 + 60)
+        self.assertEqual([r["count"] for r in self.store.query("A", T0, T0 + 60, resolution=60)], [2])
+
+    def test_totals_tile_hour_and_minute_rollups_without_double_counting(self):
+        # One probe per minute over 2h30, every tenth one failing
+        for minute in range(150):
+            self.store(probe("A", T0 + minute * 60 + 5, 100.0, healthy=minute % 10 != 0))
+        self.store.flush(now=T0 + 150 * 60)
+
+        totals = self.store.totals("A", T0 + 30 * 60, T0 + 150 * 60)   # 30 min + 1 h + 30 min
+        self.assertEqual(totals["count"], 120)
+        self.assertEqual(totals["errors"], 12)
+        self.assertEqual(sum(totals["histogram"]), 108)
+
+    def test_purge_drops_raw_samples_past_retention(self):
+        store = monitor.MetricsStore(self.path, raw_retention_days=1)
+        store(probe("A", T0))
+        store(probe("A", T0 + 2 * 86400))
+        store.flush(now=T0 + 2 * 86400 + 60)
+        self.assertEqual([row[1] for row in store.samples(0, T0 + 3 * 86400)], [T0 + 2 * 86400])
+        # ...while the rollups of the purged day remain
+        self.assertEqual(store.totals("A", T0, T0 + 86400)["count"], 1)
+        store.db.close()
+
+
+class CircuitBreakersTest(unittest.TestCase):
+    DEPENDENCIES = {"Auth API": ["MongoDB"], "Orders API": ["MongoDB"], "Affret IA API": ["Auth API"]}
+
+    def setUp(self):
+        self.breakers = monitor.CircuitBreakers(self.DEPENDENCIES, threshold=2, cooldown=10, max_cooldown=15,
+                                                sentinel="Auth API")
+
+    def test_opens_after_threshold_then_half_opens_and_closes(self):
+        self.assertEqual(self.breakers.record(probe("Orders API", T0, healthy=False), T0), "closed")
+        self.assertEqual(self.breakers.record(probe("Orders API", T0 + 1, healthy=False), T0 + 1), "open")
+        self.assertEqual(self.breakers.gate("Orders API", T0 + 5), "Circuit open, retry in 6s")
+
+        # The cooldown elapsed: one trial probe goes through, the next waits for it
+        self.assertIsNone(self.breakers.gate("Orders API", T0 + 11))
+        self.assertEqual(self.breakers.state["Orders API"]["state"], "half-open")
+        self.assertEqual(self.breakers.gate("Orders API", T0 + 11), "Circuit half-open, trial probe in flight")
+
+        # A failed trial re-opens with a doubled cooldown, capped at max_cooldown
+        self.assertEqual(self.breakers.record(probe("Orders API", T0 + 12, healthy=False), T0 + 12), "open")
+        self.assertEqual(self.breakers.state["Orders API"]["cooldown"], 15)
+        self.assertIsNotNone(self.breakers.gate("Orders API", T0 + 22))
+        self.assertIsNone(self.breakers.gate("Orders API", T0 + 27))
+
+        self.assertEqual(self.breakers.record(probe("Orders API", T0 + 28), T0 + 28), "closed")
+        self.assertEqual(self.breakers.state["Orders API"]["cooldown"], 10)
+        self.assertIsNone(self.breakers.gate("Orders API", T0 + 29))
+
+    def test_open_dependency_blocks_its_dependents_transitively(self):
+        for ts in (T0, T0 + 1):
+            self.breakers.record(probe("Auth API", ts, healthy=False), ts)
+        self.assertEqual(self.breakers.gate("Affret IA API", T0 + 2), "Blocked by Auth API")
+        self.assertIsNone(self.breakers.gate("Orders API", T0 + 2))
+
+        # A dependent failing while blocked does not open its own breaker
+        for ts in (T0 + 3, T0 + 4):
+            self.breakers.record(probe("Affret IA API", ts, healthy=False), ts)
+        self.assertEqual(self.breakers.state["Affret IA API"]["state"], "closed")
+
+        self.assertIsNone(self.breakers.gate("Auth API", T0 + 11))
+        self.breakers.record(probe("Auth API", T0 + 12), T0 + 12)
+        self.assertIsNone(self.breakers.gate("Affret IA API", T0 + 12))
+
+    def test_sentinel_payload_drives_the_mongodb_breaker(self):
+        for ts in (T0, T0 + 1):
+            self.breakers.record(probe("Auth API", ts, mongodb="disconnected"), ts)
+        self.assertEqual(self.breakers.state["MongoDB"]["state"], "open")
+        self.assertEqual(self.breakers.blocked("Orders API"), "Blocked by MongoDB")
+
+        self.breakers.record(probe("Auth API", T0 + 2, mongodb="connected"), T0 + 2)
+        self.assertIsNone(self.breakers.blocked("Orders API"))
+
+
+class SloStatusTest(StoreTestCase):
+    NOW = T0 + 30 * 86400
+
+    def setUp(self):
+        super().setUp()
+        # One probe every 30 s over the last 6 hours: 720 probes, the 10 of the last
+        # 5 minutes failing, and 7 slow (over the 1000 ms objective) 3 hours ago
+        for i in range(720):
+            ts = self.NOW - 6 * 3600 + 15 + 30 * i
+            slow = 360 <= i < 367
+            self.store(probe("Billing API", ts, 2000.0 if slow else 100.0, healthy=i < 710))
+        self.store.flush(now=self.NOW)
+
+    def test_burn_rate_for_known_error_counts(self):
+        status = monitor.slo_status(self.store, "Billing API", now=self.NOW)
+        availability = status["objectives"]["availability"]
+        # 99.5% target: a 0.5% error budget
+        self.assertEqual(availability["burn_rate"], {"5m": 200.0, "30m": round(10 / 60 / 0.005, 2),
+                                                     "1h": round(10 / 120 / 0.005, 2),
+                                                     "2h": round(10 / 240 / 0.005, 2),
+                                                     "6h": round(10 / 720 / 0.005, 2),
+                                                     "1d": round(10 / 720 / 0.005, 2),
+                                                     "3d": round(10 / 720 / 0.005, 2)})
+        self.assertEqual(status["probes"], 720)
+        self.assertEqual(availability["bad_probes"], 10)
+        self.assertEqual(availability["sli"], round(100 * (1 - 10 / 720), 3))
+
+        latency = status["objectives"]["latency"]
+        self.assertEqual(latency["bad_probes"], 7)
+        self.assertEqual(latency["burn_rate"]["1h"], 0.0)
+        self.assertEqual(latency["burn_rate"]["6h"], round(7 / 710 / 0.01, 2))
+
+    def test_alerts_need_both_windows_over_the_rate(self):
+        objectives = monitor.slo_status(self.store, "Billing API", now=self.NOW)["objectives"]
+        # 1h/5m: 16.7 and 200 >= 14.4; 6h/30m: 2.8 < 6; 1d/2h: 2.8 < 3; 3d/6h: 2.8 >= 1
+        self.assertEqual([(a["severity"], a["long"], a["short"]) for a in objectives["availability"]["alerts"]],
+                         [("page", "1h", "5m"), ("ticket", "3d", "6h")])
+        self.assertEqual(objectives["latency"]["alerts"], [])
+
+    def test_no_probes_gives_no_burn_rate(self):
+        availability = monitor.slo_status(self.store, "Idle API", now=self.NOW)["objectives"]["availability"]
+        self.assertEqual(set(availability["burn_rate"].values()), {None})
+        self.assertIsNone(availability["sli"])
+        self.assertEqual(availability["alerts"], [])
+
+
+class RegressionDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = monitor.RegressionDetector(window=40, min_samples=20)
+        self.rng = random.Random(7)
+        self.ts = T0
+
+    def feed(self, count, version, latency_ms):
+        for _ in range(count):
+            self.detector(probe("A", self.ts, latency_ms * math.exp(self.rng.gauss(0, 0.1)), version=version))
+            self.ts += 30
+
+    def test_slower_release_is_a_regression(self):
+        self.feed(60, "1.0.0", 100.0)
+        self.feed(39, "1.1.0", 150.0)
+        self.assertEqual(list(self.detector.findings), [])
+        self.assertEqual(self.detector.pending()["A"]["samples"], 39)
+
+        self.feed(1, "1.1.0", 150.0)
+        finding, = self.detector.findings
+        self.assertTrue(finding["regression"])
+        self.assertEqual((finding["previous_version"], finding["version"]), ("1.0.0", "1.1.0"))
+        self.assertEqual((finding["before_samples"], finding["after_samples"]), (40, 40))
+        self.assertGreater(finding["p95_increase_pct"], 30)
+        self.assertEqual(self.detector.pending(), {})
+
+    def test_unchanged_latency_is_not_a_regression(self):
+        self.feed(60, "1.0.0", 100.0)
+        self.feed(40, "1.1.0", 100.0)
+        finding, = self.detector.findings
+        self.assertFalse(finding["regression"])
+
+    def test_too_few_samples_of_the_old_version_are_not_compared(self):
+        self.feed(10, "1.0.0", 100.0)
+        self.feed(40, "1.1.0", 150.0)
+        self.assertEqual(list(self.detector.findings), [])
+        self.assertEqual(self.detector.pending(), {})
+
+
+class AnomalyDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = monitor.AnomalyDetector()
+        self.rng = random.Random(7)
+        self.ts = T0
+
+    def feed(self, count, latency_ms, spread=0.1, healthy=True):
+        for _ in range(count):
+            self.detector(probe("A", self.ts, latency_ms * math.exp(self.rng.gauss(0, spread)), healthy))
+            self.ts += 30
+
+    def test_latency_shift_is_raised_then_cleared(self):
+        self.feed(200, 100.0)
+        self.assertEqual(list(self.detector.events), [])
+
+        self.feed(10, 300.0)
+        raised, = self.detector.events
+        self.assertEqual((raised["event"], raised["signal"], raised["direction"]), ("raised", "latency", "high"))
+        self.assertLessEqual(raised["at"] - (T0 + 200 * 30), (monitor.ANOMALY_CONSECUTIVE + 1) * 30)
+        self.assertLess(raised["band_ms"][1], 300.0)
+        self.assertEqual(len(self.detector.active()), 1)
+
+        self.feed(20, 100.0)
+        self.assertEqual(self.detector.events[-1]["event"], "cleared")
+        self.assertEqual(self.detector.active(), [])
+
+    def test_shift_below_the_minimum_delta_is_ignored(self):
+        self.feed(200, 100.0, spread=0.01)
+        self.feed(20, 140.0, spread=0.01)
+        self.assertEqual(list(self.detector.events), [])
+
+    def test_error_burst_is_raised(self):
+        self.feed(200, 100.0)
+        self.feed(10, 100.0, healthy=False)
+        self.assertEqual([(e["event"], e["signal"]) for e in self.detector.events], [("raised", "errors")])
+
+    def test_no_verdict_before_the_baseline_has_enough_samples(self):
+        self.feed(monitor.ANOMALY_MIN_SAMPLES - 1 - monitor.ANOMALY_CONSECUTIVE, 100.0)
+        self.feed(monitor.ANOMALY_CONSECUTIVE, 1000.0)
+        self.assertEqual(list(self.detector.events), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
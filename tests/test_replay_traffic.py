@@ -0,0 +1,88 @@
+"""
+Log parsing of replay-traffic.py: JSON and access-log lines, malformed lines
+skipped while streaming, and the header rewrite of a parsed record.
+
+Run with: python -m unittest discover -s tests -p "test_*.py"
+"""
+import importlib.util
+import os
+import tempfile
+import unittest
+
+
+def _load_script(name, filename):
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), filename)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+replay = _load_script("replay_traffic", "replay-traffic.py")
+
+TS = 1_772_400_000
+
+
+class ParseJsonLineTest(unittest.TestCase):
+
+    def test_valid_line(self):
+        record = replay.parse_json_line('{"ts": 1772400000000, "method": "post", "path": "/api/v1/orders", '
+                                        '"headers": {"X-Request-Id": "r1"}, "body": {"ref": "CMD-1"}, "status": 201}')
+        self.assertEqual(record, {"ts": TS, "method": "POST", "target": "/api/v1/orders", "status": 201,
+                                  "headers": {"X-Request-Id": "r1"}, "body": '{"ref": "CMD-1"}'})
+
+    def test_iso_timestamp_url_and_null_headers(self):
+        record = replay.parse_json_line('{"timestamp": "2026-03-01T21:20:00Z", "method": "GET", '
+                                        '"url": "https://api.example.com/health", "headers": null}')
+        self.assertEqual((record["ts"], record["target"], record["headers"]),
+                         (TS, "https://api.example.com/health", {}))
+
+    def test_malformed_lines_are_skipped(self):
+        for line in [
+            '{"ts": 1772400000, "method": "GET", "path": "/a"',                  # truncated
+            '["GET", "/a"]',                                                      # not an object
+            '{"method": "GET", "path": "/a"}',                                    # no timestamp
+            '{"ts": "yesterday", "method": "GET", "path": "/a"}',
+            '{"ts": 1772400000, "path": "/a"}',                                   # no method
+            '{"ts": 1772400000, "method": 7, "path": "/a"}',
+            '{"ts": 1772400000, "method": "GET", "path": ""}',
+            '{"ts": 1772400000, "method": "GET", "path": ["/a"]}',
+            '{"ts": 1772400000, "method": "GET", "path": "/a", "headers": ["Accept: */*"]}',
+            '{"ts": 1772400000, "method": "GET", "path": "/a", "headers": "Accept: */*"}',
+        ]:
+            with self.subTest(line=line):
+                self.assertIsNone(replay.parse_json_line(line))
+
+
+class ReadRecordsTest(unittest.TestCase):
+
+    def test_streams_valid_records_of_both_formats(self):
+        lines = [
+            '{"ts": 1772400000, "method": "GET", "path": "/api/v1/orders"}',
+            '{"ts": 1772400001, "method": "GET", "path": "/a", "headers": 42}',
+            'garbage',
+            '10.0.0.1 - - [01/Mar/2026:21:20:02 +0000] "GET /health HTTP/1.1" 200 12 "-" "curl"',
+            '10.0.0.1 - - [31/Feb/2026:21:20:03 +0000] "GET /health HTTP/1.1" 200 12 "-" "curl"',
+            '',
+        ]
+        handle, path = tempfile.mkstemp(suffix='.log')
+        with os.fdopen(handle, "w") as f:
+            f.write("\n".join(lines))
+        try:
+            records = list(replay.read_records([path]))
+        finally:
+            os.remove(path)
+        self.assertEqual([(r["ts"], r["target"]) for r in records], [(TS, "/api/v1/orders"), (TS + 2, "/health")])
+
+
+class RewriterTest(unittest.TestCase):
+
+    def test_recorded_credentials_are_replaced(self):
+        record = replay.parse_json_line('{"ts": 1772400000, "method": "POST", "path": "/a", "body": "{}", '
+                                        '"headers": {"Authorization": "Bearer old", "Cookie": "s=1", "X-Trace": "t"}}')
+        headers = replay.Rewriter("https://staging.example.com").headers(record, "new")
+        self.assertEqual(headers, {"X-Trace": "t", "Authorization": "Bearer new", "Content-Type": "application/json"})
+
+
+if __name__ == '__main__':
+    unittest.main()